@@ -1,37 +1,95 @@
 #----------------------------------------------------------------------------#
 # Imports
 #----------------------------------------------------------------------------#
+import os
 import sys
 import json
+import asyncio
+import bisect
+import math
+import hashlib
+import click
 import dateutil.parser
 import babel
-from flask import Flask, render_template, request, Response, flash, redirect, url_for, jsonify
+from flask import Flask, abort, render_template, stream_template, request, Response, flash, get_flashed_messages, redirect, url_for, jsonify, stream_with_context, g, message_flashed
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
 import phonenumbers
 import logging
 from logging import Formatter, FileHandler
-from flask_wtf import Form
 from wtforms import ValidationError
 from forms import *
 from flask_migrate import Migrate
-from datetime import datetime
+from config import get_config
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
+from werkzeug.http import is_resource_modified
+from datetime import datetime, timedelta
+from itertools import groupby
+from querycount import query_budget
+from pagination import Page, StreamedPage, decode_cursor, keyset_page, keyset_query, trim_page
+from cache import Cache
+from instrumentation import Instrumentation
+from templating import Templates
+from compression import Compression
+from surrogate import SurrogateKeys
+from assets import Assets, Builder
+from metrics import Metrics, use_timed_pool
+from database import configure_engine
+from replicas import Replicas, RoutingSession, use_replicas
+from asyncdb import AsyncDatabase
+from importer import BulkImporter, Checkpoint, RowValidator, read_records
+from queryplan import full_scans
+import partitions
+import geo
+from geo import gazetteer
 #----------------------------------------------------------------------------#
 # App Config.
 #----------------------------------------------------------------------------#
 
 app = Flask(__name__)
 moment = Moment(app)
-app.config.from_object('config')
-db = SQLAlchemy(app)
+app.config.from_object(get_config())
+configure_engine(app)
+use_timed_pool(app)
+use_replicas(app)
+db = SQLAlchemy(app, session_options={'class_': RoutingSession})
 migrate = Migrate(app, db)
+cache = Cache(app)
+instrumentation = Instrumentation(app)
+templates = Templates(app)
+assets = Assets(app)
+compression = Compression(app)
+surrogate_keys = SurrogateKeys(app)
+metrics = Metrics(app, db)
+replicas = Replicas(app, db)
+async_db = AsyncDatabase(app)
 
 #----------------------------------------------------------------------------#
 # Models.
 #----------------------------------------------------------------------------#
 
+# a list of strings: a native ARRAY on Postgres, JSON everywhere else
+# (so the models also run on SQLite for local testing)
+class StringArray(db.TypeDecorator):
+    impl = db.JSON
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == 'postgresql':
+            return dialect.type_descriptor(postgresql.ARRAY(db.String()))
+        return dialect.type_descriptor(db.JSON())
+
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
+    __table_args__ = (
+        # genre filters (genres @> ARRAY[...]) and the genre/area facets
+        db.Index('ix_venue_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_venue_state_city', 'state', 'city'),
+        # nearby search scans geohash prefix ranges
+        db.Index('ix_venue_geohash', 'geohash'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
@@ -41,35 +99,81 @@ class Venue(db.Model):
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
-    genres = db.Column("genres", db.ARRAY(db.String()), nullable=False)
+    genres = db.Column("genres", StringArray(), nullable=False)
     website = db.Column(db.String(500)) 
     seeking_talent = db.Column(db.Boolean, default=True) 
     seeking_description = db.Column(db.String(500)) 
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # city centroid from the bundled gazetteer (see `flask geocode-venues`)
+    latitude = db.Column(db.Float)
+    longitude = db.Column(db.Float)
+    geohash = db.Column(db.String(12))
+    # last change to the row (counter updates included); the validator of its page
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, server_default=db.func.now())
     shows = db.relationship("Show", backref="venue", lazy=True)
 
 
 class Artist(db.Model):
     __tablename__ = 'Artist'
+    __table_args__ = (
+        db.Index('ix_artist_genres', 'genres', postgresql_using='gin'),
+        db.Index('ix_artist_state_city', 'state', 'city'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String)
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column("genres", db.ARRAY(db.String()), nullable=False)
+    genres = db.Column("genres", StringArray(), nullable=False)
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
     website = db.Column(db.String(500)) 
     seeking_venue = db.Column(db.Boolean, default=True) 
     seeking_description = db.Column(db.String(500)) 
+    upcoming_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    past_shows_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                           onupdate=datetime.utcnow, server_default=db.func.now())
     shows = db.relationship("Show", backref="artist", lazy=True)
 
 class Show(db.Model):
   __tablename__ = "Show"
+  __table_args__ = (
+    # per-venue/per-artist lookups filtered or ordered by time
+    db.Index('ix_show_venue_id_start_time', 'venue_id', 'start_time'),
+    db.Index('ix_show_artist_id_start_time', 'artist_id', 'start_time'),
+    # the keyset-paginated feed and the counter roll-forward window
+    db.Index('ix_show_start_time_id', 'start_time', 'id'),
+  )
   id = db.Column(db.Integer, primary_key=True)
   venue_id = db.Column(db.Integer, db.ForeignKey("Venue.id"), nullable=False)
   artist_id = db.Column(db.Integer, db.ForeignKey("Artist.id"), nullable=False)
   start_time = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+  # the venue is booked from start_time until end_time; bookings of a venue
+  # never overlap (see booking_conflict and the migration's exclusion constraint)
+  end_time = db.Column(db.DateTime, nullable=False)
+  updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow,
+                         onupdate=datetime.utcnow, server_default=db.func.now())
+
+# single-row table holding the watermark of the show counters: shows that
+# start at or before rolled_at are counted as past, later ones as upcoming
+class ShowCounterState(db.Model):
+  __tablename__ = "ShowCounterState"
+  id = db.Column(db.Integer, primary_key=True)
+  rolled_at = db.Column(db.DateTime, nullable=False)
+
+# how far `flask import` got in each file (keyed by its absolute path); the
+# row is written in every batch's transaction, see importer.Checkpoint
+class ImportCheckpoint(db.Model):
+  __tablename__ = "ImportCheckpoint"
+  name = db.Column(db.String, primary_key=True)
+  line = db.Column(db.Integer, nullable=False, default=0)
+  inserted = db.Column(db.Integer, nullable=False, default=0)
+  rejected = db.Column(db.Integer, nullable=False, default=0)
+  batches = db.Column(db.Integer, nullable=False, default=0)
 
 #----------------------------------------------------------------------------#
 # Filters.
@@ -92,134 +196,846 @@ def phone_validator(num):
     if not phonenumbers.is_valid_number(parsed):
         raise ValidationError('Must be a valid US phone number.')
 
+# splits shows into (past, upcoming) lists of serialized shows, ordered by
+# start time and compared against a single "now" captured per call.
+# show times, like every timestamp in the database, are naive UTC
+def split_shows(shows, serialize, now=None):
+  now = now or datetime.utcnow()
+  past_shows = []
+  upcoming_shows = []
+
+  for show in sorted(shows, key=lambda show: show.start_time):
+    if show.start_time > now:
+      upcoming_shows.append(serialize(show))
+    else:
+      past_shows.append(serialize(show))
+  return past_shows, upcoming_shows
+
+#----------------------------------------------------------------------------#
+# Show counters.
+#----------------------------------------------------------------------------#
+
+# returns the counter watermark row, locked for the current transaction
+# (shared for inserts/deletes, exclusive for roll-forward and rebuilds)
+def counter_state(exclusive=False):
+  state = db.session.get(ShowCounterState, 1, with_for_update={'read': not exclusive})
+  if state is None:
+    state = ShowCounterState(id=1, rolled_at=datetime.utcnow())
+    db.session.add(state)
+    db.session.flush()
+  return state
+
+# adds delta (1 on insert, -1 on delete) to the upcoming or past counter of
+# the show's venue and artist, depending on which side of the watermark it is
+def count_show(show, delta):
+  upcoming = show.start_time > counter_state().rolled_at
+  for model, entity_id in ((Venue, show.venue_id), (Artist, show.artist_id)):
+    column = model.upcoming_shows_count if upcoming else model.past_shows_count
+    db.session.execute(
+      db.update(model).where(model.id == entity_id).values({column: column + delta}))
+
+# applies per-entity counter deltas, {id: (upcoming delta, past delta)},
+# with one executemany statement per table
+def apply_counter_deltas(model, deltas):
+  if not deltas:
+    return
+  table = model.__table__
+  db.session.execute(
+    table.update()
+      .where(table.c.id == db.bindparam('entity_id'))
+      .values(upcoming_shows_count=table.c.upcoming_shows_count + db.bindparam('upcoming'),
+              past_shows_count=table.c.past_shows_count + db.bindparam('past')),
+    [{"entity_id": entity_id, "upcoming": upcoming, "past": past}
+     for entity_id, (upcoming, past) in deltas.items()])
+
+# moves shows that started since the last run from the upcoming to the past
+# counters; only touches shows inside the (rolled_at, now] window
+def roll_show_counters(now=None):
+  now = now or datetime.utcnow()
+  state = counter_state(exclusive=True)
+  if now <= state.rolled_at:
+    return 0
+
+  moved = 0
+  for model, foreign_key in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+    rows = db.session.query(foreign_key, db.func.count(Show.id)) \
+      .filter(Show.start_time > state.rolled_at, Show.start_time <= now) \
+      .group_by(foreign_key).all()
+    apply_counter_deltas(model, {entity_id: (-count, count) for entity_id, count in rows})
+    if model is Venue:
+      moved = sum(count for _, count in rows)
+
+  state.rolled_at = now
+  db.session.commit()
+  return moved
+
+# recomputes every counter from the Show table
+def rebuild_show_counters(now=None):
+  now = now or datetime.utcnow()
+  state = counter_state(exclusive=True)
+
+  for model, foreign_key in ((Venue, Show.venue_id), (Artist, Show.artist_id)):
+    db.session.execute(db.update(model).values(upcoming_shows_count=0, past_shows_count=0))
+    upcoming = db.func.sum(db.case((Show.start_time > now, 1), else_=0))
+    rows = db.session.query(foreign_key, upcoming, db.func.count(Show.id) - upcoming) \
+      .group_by(foreign_key).all()
+    apply_counter_deltas(model, {entity_id: (up, past) for entity_id, up, past in rows})
+
+  state.rolled_at = now
+  db.session.commit()
+
+@app.cli.command('roll-show-counters')
+def roll_show_counters_command():
+  """Move shows that have started from the upcoming to the past counters."""
+  moved = roll_show_counters()
+  if moved:
+    cache.clear()
+    surrogate_keys.purge_all()
+  print('Rolled %d shows from upcoming to past.' % moved)
+
+@app.cli.command('rebuild-show-counters')
+def rebuild_show_counters_command():
+  """Recompute all upcoming/past show counters from scratch."""
+  rebuild_show_counters()
+  cache.clear()
+  surrogate_keys.purge_all()
+  print('Show counters rebuilt.')
+
+#----------------------------------------------------------------------------#
+# Show storage.
+#----------------------------------------------------------------------------#
+
+@app.cli.command('partition-shows')
+@click.option('--interval', type=click.Choice(partitions.INTERVALS),
+              help='Partition size (default: SHOW_PARTITION_INTERVAL).')
+def partition_shows_command(interval):
+  """Convert the Show table into a table range-partitioned by start_time (Postgres only)."""
+  interval = interval or app.config['SHOW_PARTITION_INTERVAL']
+  indexes = [(index.name, [column.name for column in index.columns])
+             for index in Show.__table__.indexes]
+  with db.engine.begin() as connection:
+    created = partitions.partition_show_table(
+      connection, interval, app.config['SHOW_PARTITIONS_AHEAD'], indexes)
+  print('Show is now partitioned %s; created %s.' % (interval, ', '.join(created) or 'no partitions'))
+
+@app.cli.command('create-show-partitions')
+def create_show_partitions_command():
+  """Create the partitions for the next SHOW_PARTITIONS_AHEAD periods; run it from cron."""
+  with db.engine.begin() as connection:
+    if not partitions.is_partitioned(connection):
+      print('Show is not partitioned, nothing to do.')
+      return
+    created = partitions.ensure_partitions(
+      connection, app.config['SHOW_PARTITION_INTERVAL'], app.config['SHOW_PARTITIONS_AHEAD'])
+  print('Created %s.' % (', '.join(created) or 'no partitions'))
+
+# the queries that run on every request or write and must be served by an index
+def hot_show_queries():
+  now = datetime.utcnow()
+  return [
+    ('venue shows', db.select(Show.id, Show.start_time).where(Show.venue_id == 1)),
+    ('artist shows', db.select(Show.id, Show.start_time).where(Show.artist_id == 1)),
+    ('upcoming feed', shows_query('upcoming').order_by(Show.start_time, Show.id).limit(60).statement),
+    ('counter roll', db.select(Show.venue_id, db.func.count(Show.id))
+        .where(Show.start_time > now, Show.start_time <= now).group_by(Show.venue_id)),
+    ('venue artists', db.select(Show.artist_id).where(Show.venue_id == 1).distinct()),
+    ('booking check', db.select(Show.id, Show.end_time).where(Show.venue_id == 1, Show.start_time < now)
+        .order_by(Show.start_time.desc()).limit(1)),
+  ]
+
+@app.cli.command('explain-hot-queries')
+@click.option('--verbose', is_flag=True, help='Print the full plans.')
+def explain_hot_queries_command(verbose):
+  """Check that the hot Show queries use index scans; exits 1 otherwise."""
+  failed = False
+  with db.engine.connect() as connection:
+    for name, statement in hot_show_queries():
+      plan, scans = full_scans(connection, statement, Show.__tablename__)
+      print('%-14s %s' % (name, 'FULL SCAN: ' + '; '.join(scans) if scans else 'index scan'))
+      if verbose:
+        print(plan)
+      failed = failed or bool(scans)
+  if failed:
+    sys.exit(1)
+
+#----------------------------------------------------------------------------#
+# Templates.
+#----------------------------------------------------------------------------#
+
+@app.cli.command('precompile-templates')
+def precompile_templates_command():
+  """Compile every template into TEMPLATE_CACHE_DIR; run it at build time."""
+  if templates.bytecode_cache is None:
+    print('TEMPLATE_CACHE_DIR is not set, nothing to do.')
+    return
+  timings = templates.precompile()
+  for name, (compiled, cached) in sorted(timings.items()):
+    print('%-30s %8.2f ms compiled %8.2f ms cached' % (name, compiled, cached))
+  print('Compiled %d templates into %s: %.1f ms from source, %.1f ms from the cache.' % (
+    len(timings), app.config['TEMPLATE_CACHE_DIR'],
+    sum(compiled for compiled, _ in timings.values()),
+    sum(cached for _, cached in timings.values())))
+
+@app.cli.command('build-assets')
+def build_assets_command():
+  """Bundle, minify, fingerprint and precompress the static assets into static/dist."""
+  manifest = Builder(app.static_folder).build()
+  assets.load_manifest()
+  print('Built %d assets; restart the app to serve them.' % len(manifest))
+
+#----------------------------------------------------------------------------#
+# Bookings.
+#----------------------------------------------------------------------------#
+
+# the show at the venue overlapping [start_time, end_time), if any. as a
+# venue's shows never overlap, only the last one starting before end_time
+# can: a single backward step on the (venue_id, start_time) index
+def booking_conflict(venue_id, start_time, end_time, exclude_id=None):
+  query = Show.query.filter(Show.venue_id == venue_id, Show.start_time < end_time)
+  if exclude_id is not None:
+    query = query.filter(Show.id != exclude_id)
+  previous = query.order_by(Show.start_time.desc()).first()
+  if previous is not None and previous.end_time > start_time:
+    return previous
+  return None
+
+# every show that overlaps an earlier show at its venue, as rows of (show,
+# the latest end_time among the venue's earlier shows); one sweep over the
+# shows of each venue in start order instead of comparing every pair
+def booking_conflicts():
+  booked_until = db.func.max(Show.end_time).over(
+    partition_by=Show.venue_id, order_by=(Show.start_time, Show.id), rows=(None, -1))
+  sweep = db.select(Show.id, Show.venue_id, Show.artist_id, Show.start_time, Show.end_time,
+                    booked_until.label('booked_until')).subquery()
+  return db.session.execute(
+    db.select(sweep).where(sweep.c.start_time < sweep.c.booked_until)
+      .order_by(sweep.c.venue_id, sweep.c.start_time, sweep.c.id)).all()
+
+# must match EXCLUSION in migrations/versions/b7e3f9a1d6c2_.py
+BOOKING_EXCLUSION = (
+  'ALTER TABLE "Show" ADD CONSTRAINT ex_show_venue_booking EXCLUDE USING gist '
+  '(venue_id WITH =, tsrange(start_time, end_time) WITH &&)'
+)
+
+@app.cli.command('show-conflicts')
+@click.option('--add-constraint', is_flag=True,
+              help='Once there are no conflicts, add the exclusion constraint (Postgres).')
+def show_conflicts_command(add_constraint):
+  """List shows overlapping an earlier show at the same venue; exits 1 if any."""
+  conflicts = booking_conflicts()
+  for row in conflicts:
+    print('venue %d: show %d (%s - %s) starts before %s' % (
+      row.venue_id, row.id, row.start_time, row.end_time, row.booked_until))
+  print('%d conflicting shows.' % len(conflicts))
+  if conflicts:
+    sys.exit(1)
+
+  if add_constraint and db.engine.dialect.name == 'postgresql':
+    with db.engine.begin() as connection:
+      connection.execute(db.text('CREATE EXTENSION IF NOT EXISTS btree_gist'))
+      connection.execute(db.text('ALTER TABLE "Show" DROP CONSTRAINT IF EXISTS ex_show_venue_booking'))
+      connection.execute(db.text(BOOKING_EXCLUSION))
+    print('Added the booking exclusion constraint.')
+
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+
+# map validated form data to column values, the same way the create handlers do
+def venue_values(form):
+  phone_validator(form.phone.data)
+  values = {
+    "name": form.name.data,
+    "city": form.city.data,
+    "state": form.state.data,
+    "address": form.address.data,
+    "phone": form.phone.data,
+    "genres": form.genres.data,
+    "facebook_link": form.facebook_link.data,
+    "website": form.website.data,
+    "image_link": form.image_link.data,
+    "seeking_talent": form.seeking_talent.data == 'Yes',
+    "seeking_description": form.seeking_description.data
+  }
+  values.update(gazetteer.locate(form.city.data, form.state.data))
+  return values
+
+def artist_values(form):
+  phone_validator(form.phone.data)
+  return {
+    "name": form.name.data,
+    "city": form.city.data,
+    "state": form.state.data,
+    "phone": form.phone.data,
+    "genres": form.genres.data,
+    "facebook_link": form.facebook_link.data,
+    "website": form.website.data,
+    "image_link": form.image_link.data,
+    "seeking_venue": form.seeking_venue.data == 'Yes',
+    "seeking_description": form.seeking_description.data
+  }
+
+def show_values(form):
+  # ShowForm defaults start_time to today, an import must be explicit
+  if not form.start_time.raw_data:
+    raise ValidationError('start_time is required')
+  # a row without a duration gets ShowForm's default
+  return {
+    "venue_id": int(form.venue_id.data),
+    "artist_id": int(form.artist_id.data),
+    "start_time": form.start_time.data,
+    "end_time": form.start_time.data + timedelta(minutes=form.duration.data)
+  }
+
+# keeps the venue/artist show counters in step with imported shows
+def count_imported_shows(session, rows):
+  rolled_at = counter_state().rolled_at
+  for model, key in ((Venue, 'venue_id'), (Artist, 'artist_id')):
+    deltas = {}
+    for row in rows:
+      upcoming, past = deltas.get(row[key], (0, 0))
+      if row['start_time'] > rolled_at:
+        deltas[row[key]] = (upcoming + 1, past)
+      else:
+        deltas[row[key]] = (upcoming, past + 1)
+    apply_counter_deltas(model, deltas)
+
+# rejects shows overlapping a booking of their venue, in the database or
+# earlier in the batch, as the create show form does; booking_conflict()
+# relies on a venue's shows never overlapping
+def check_imported_shows(session, rows):
+  booked = {}
+  errors = []
+  for row in rows:
+    # the batch's accepted shows at the venue, sorted and non-overlapping, so
+    # again only the last one starting before this one ends can overlap it
+    intervals = booked.setdefault(row['venue_id'], [])
+    index = bisect.bisect_left(intervals, (row['end_time'],))
+    conflict = intervals[index - 1] if index and intervals[index - 1][1] > row['start_time'] else None
+    if conflict is None:
+      show = booking_conflict(row['venue_id'], row['start_time'], row['end_time'])
+      conflict = show and (show.start_time, show.end_time)
+
+    if conflict:
+      errors.append({"start_time": ['The venue is already booked from %s to %s.' % (
+        format_datetime(str(conflict[0])), format_datetime(str(conflict[1])))]})
+    else:
+      intervals.insert(index, (row['start_time'], row['end_time']))
+      errors.append(None)
+  return errors
+
+IMPORTS = {
+  'venues': (Venue, VenueForm, venue_values, None, None),
+  'artists': (Artist, ArtistForm, artist_values, None, None),
+  'shows': (Show, ShowForm, show_values, count_imported_shows, check_imported_shows),
+}
+
+@app.cli.command('import')
+@click.argument('kind', type=click.Choice(sorted(IMPORTS)))
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'file_format', type=click.Choice(['csv', 'jsonl']),
+              help='Input format (default: from the file extension).')
+@click.option('--batch-size', default=5000, show_default=True)
+@click.option('--restart', is_flag=True, help='Ignore an existing checkpoint.')
+@click.option('--no-copy', is_flag=True, help='Use INSERT even on Postgres.')
+def import_command(kind, path, file_format, batch_size, restart, no_copy):
+  """Bulk-load venues, artists or shows from a CSV or JSON Lines file.
+
+  Rows are validated with the same rules as the web forms. Progress is
+  checkpointed in the database with every batch, so rerunning the
+  command resumes where it stopped; rejected rows are appended to
+  PATH.errors.jsonl.
+  """
+  model, form_class, convert, after_insert, check = IMPORTS[kind]
+
+  checkpoint = Checkpoint(db.session, ImportCheckpoint, os.path.abspath(path))
+  if restart:
+    checkpoint.clear()
+  elif checkpoint.line:
+    print('Resuming %s after line %d.' % (path, checkpoint.line))
+
+  importer = BulkImporter(db.session, model.__table__, RowValidator(form_class, convert),
+                          batch_size=batch_size, after_insert=after_insert,
+                          use_copy=not no_copy, check=check)
+  summary = importer.run(read_records(path, file_format), checkpoint, path + '.errors.jsonl')
+  cache.clear()
+  surrogate_keys.purge_all()
+
+  print('Imported %(inserted)d %(kind)s (%(rejected)d rejected) in %(seconds).1fs.'
+        % dict(summary, kind=kind))
+  if summary['rejected']:
+    print('See %s.errors.jsonl for the rejected rows.' % path)
+
+#----------------------------------------------------------------------------#
+# Geocoding.
+#----------------------------------------------------------------------------#
+
+@app.cli.command('geocode-venues')
+@click.option('--all', 'relocate', is_flag=True, help='Also relocate venues that have coordinates.')
+def geocode_venues_command(relocate):
+  """Set venue coordinates from the bundled city-centroid table (offline)."""
+  pending = db.true() if relocate else Venue.latitude.is_(None)
+  places = db.session.query(Venue.city, Venue.state, db.func.count(Venue.id)) \
+    .filter(pending).group_by(Venue.city, Venue.state).all()
+
+  # one UPDATE per city rather than one per venue
+  located, unknown = 0, []
+  for city, state, count in places:
+    location = gazetteer.locate(city, state)
+    if location['geohash'] is None:
+      unknown.append((city, state, count))
+      continue
+    db.session.execute(db.update(Venue)
+                       .where(pending, Venue.city == city, Venue.state == state)
+                       .values(**location))
+    located += count
+  db.session.commit()
+
+  print('Located %d venues.' % located)
+  for city, state, count in unknown:
+    print('Unknown place %s, %s (%d venues).' % (city, state, count))
+
+#----------------------------------------------------------------------------#
+# Cache invalidation.
+#----------------------------------------------------------------------------#
+
+# a venue's name and image appear on its own page, the venues lists (every
+# filter combination lives in the "venues" namespace), the shows feed and the
+# pages of every artist that played there; its genres and area in the facets.
+# shared HTTP caches drop the same pages by surrogate key: artist pages are
+# tagged with the venues they list
+def invalidate_venue(venue_id):
+  artist_ids = db.session.query(Show.artist_id).filter(Show.venue_id == venue_id).distinct()
+  cache.delete('facets:Venue', 'venue:%s' % venue_id,
+               *['artist:%d' % artist_id for (artist_id,) in artist_ids])
+  cache.bump('venues', 'shows')
+  surrogate_keys.purge('venue-%s' % venue_id, 'venues', 'shows')
+
+# likewise for an artist and the venues it played at
+def invalidate_artist(artist_id):
+  venue_ids = db.session.query(Show.venue_id).filter(Show.artist_id == artist_id).distinct()
+  cache.delete('facets:Artist', 'artist:%s' % artist_id,
+               *['venue:%d' % venue_id for (venue_id,) in venue_ids])
+  cache.bump('artists', 'shows')
+  surrogate_keys.purge('artist-%s' % artist_id, 'artists', 'shows')
+
+# a show changes the pages of its venue and artist, the shows feed and the
+# upcoming-show counts on the venues lists
+def invalidate_show(venue_id, artist_id, show_id):
+  cache.delete('venue:%s' % venue_id, 'artist:%s' % artist_id)
+  cache.bump('venues', 'shows')
+  surrogate_keys.purge('venue-%s' % venue_id, 'artist-%s' % artist_id, 'show-%s' % show_id,
+                       'venues', 'shows')
+
+#----------------------------------------------------------------------------#
+# Conditional requests.
+#----------------------------------------------------------------------------#
+
+# identifies the templates and assets a page was rendered with, so a deploy
+# changes every ETag: RELEASE_VERSION, or a hash of the template sources
+# and the asset manifest
+def release_version():
+  version = app.config.get('RELEASE_VERSION')
+  if version is None:
+    digest = hashlib.sha1(json.dumps(assets.manifest, sort_keys=True).encode())
+    for name in templates.names():
+      digest.update(app.jinja_env.loader.get_source(app.jinja_env, name)[0].encode())
+    version = app.config['RELEASE_VERSION'] = digest.hexdigest()[:12]
+  return version
+
+# a detail page's validators come from its cached data: updated_at is the
+# latest change to the entity and everything listed on it, including the
+# start of its latest past show, so If-Modified-Since alone notices a show
+# moving from upcoming to past; the show counts catch deletions. a client
+# holding the current version gets a 304 without the template being rendered
+def conditional_page(kind, data, render):
+  validator = '%s:%s:%s:%s:%d:%d' % (release_version(), kind, data['id'], data['updated_at'].isoformat(),
+                                     data['past_shows_count'], data['upcoming_shows_count'])
+  etag = hashlib.sha1(validator.encode()).hexdigest()
+  last_modified = data['updated_at'].replace(microsecond=0)
+
+  if is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+    response = app.make_response(render())
+  else:
+    response = app.response_class(status=304)
+  response.set_etag(etag)
+  response.last_modified = last_modified
+  # browsers revalidate on every use
+  response.cache_control.max_age = 0
+  return response
+
+#----------------------------------------------------------------------------#
+# Streamed pages.
+#----------------------------------------------------------------------------#
+
+# Jinja yields a string per template node; sending each on its own would
+# cost a write (and a chunk header) apiece, so they go out in ~8 KB pieces
+STREAM_CHUNK_BYTES = 8192
+
+def buffered(chunks, size=STREAM_CHUNK_BYTES):
+  pending, length = [], 0
+  for chunk in chunks:
+    pending.append(chunk)
+    length += len(chunk)
+    if length >= size:
+      yield ''.join(pending)
+      pending, length = [], 0
+  if pending:
+    yield ''.join(pending)
+
+# renders a template while its rows are still being fetched: the head of the
+# page goes out before the query has finished, and neither the rows nor the
+# HTML are ever held in memory as a whole.
+# the queries run on the view's session after the request has torn it down,
+# which reopens a connection nothing else would return to the pool
+def streamed_page(template_name, **context):
+  response = Response(buffered(stream_template(template_name, **context)), mimetype='text/html')
+  response.call_on_close(db.session().close)
+  return response
+
+#----------------------------------------------------------------------------#
+# Pagination.
+#----------------------------------------------------------------------------#
+
+# ?per_page= (clamped to maximum) and the decoded ?after= cursor of the
+# last row on the previous page, for listings keyset-paginated by sort_columns
+def page_args(default, maximum, sort_columns):
+  per_page = min(request.args.get('per_page', default, type=int), maximum)
+  if per_page < 1:
+    abort(400)
+
+  after = None
+  if request.args.get('after'):
+    try:
+      after = decode_cursor(request.args['after'], sort_columns)
+    except ValueError:
+      abort(400, 'invalid cursor')
+  return per_page, after
+
+#----------------------------------------------------------------------------#
+# Genre facets.
+#----------------------------------------------------------------------------#
+
+GENRES = [genre for genre, _ in GENRE_CHOICES]
+
+# the ?genre=, ?city= and ?state= filters of the listing, search and API
+# endpoints (query string or form); unknown genres are rejected
+def facet_args():
+  filters = {
+    "genre": request.values.get('genre') or None,
+    "city": request.values.get('city') or None,
+    "state": request.values.get('state') or None,
+  }
+  if filters['genre'] is not None and filters['genre'] not in GENRES:
+    abort(400)
+  return filters
+
+# SQL conditions for facet_args(); on Postgres the genre test is an array
+# containment served by the GIN index on the genres column
+def facet_filter(model, filters):
+  clauses = []
+  if not filters:
+    return clauses
+  if filters['genre'] is not None:
+    if db.engine.dialect.name == 'postgresql':
+      genres = db.cast(db.literal([filters['genre']], postgresql.ARRAY(db.String)),
+                       postgresql.ARRAY(db.String))
+      clauses.append(model.genres.op('@>')(genres))
+    else:
+      # SQLite stores the genres as a JSON list; genres are validated
+      # against GENRES, so the pattern holds no LIKE wildcards
+      clauses.append(db.cast(model.genres, db.String).like('%' + json.dumps(filters['genre']) + '%'))
+  if filters['city'] is not None:
+    clauses.append(model.city == filters['city'])
+  if filters['state'] is not None:
+    clauses.append(model.state == filters['state'])
+  return clauses
+
+# (genre, state, city, count) for every genre and area, plus one row per
+# area with genre None holding the area's total, in a single statement
+def facet_statement(model):
+  # one row per (entity, genre): the genres array or JSON list joined
+  # laterally to its row
+  if db.engine.dialect.name == 'postgresql':
+    each = db.func.unnest(model.genres).table_valued('genre', joins_implicitly=True).render_derived()
+    genre = each.c.genre
+  else:
+    each = db.func.json_each(model.genres).table_valued('value', joins_implicitly=True)
+    genre = each.c.value
+  by_genre = db.select(genre.label('genre'), model.state, model.city, db.func.count().label('count')) \
+    .select_from(model.__table__.join(each, db.true())).group_by(genre, model.state, model.city)
+  by_area = db.select(db.null().label('genre'), model.state, model.city, db.func.count()) \
+    .group_by(model.state, model.city)
+  return db.union_all(by_genre, by_area)
+
+def facet_rows(model):
+  return [tuple(row) for row in db.session.execute(facet_statement(model))]
+
+# genre counts within the selected area and area counts within the selected
+# genre, computed from the cached facet_rows() of the model
+def facets(model, filters):
+  return facet_counts(cache.get_or_set('facets:%s' % model.__tablename__, lambda: facet_rows(model)),
+                      filters)
+
+def facet_counts(rows, filters):
+  def in_area(state, city):
+    return (filters['state'] in (None, state)) and (filters['city'] in (None, city))
+
+  genres, areas = {}, {}
+  for genre, state, city, count in rows:
+    if genre is not None and in_area(state, city):
+      genres[genre] = genres.get(genre, 0) + count
+    if genre == filters['genre']:
+      areas[(state, city)] = areas.get((state, city), 0) + count
+
+  return {
+    "genres": [{"genre": genre, "count": count}
+               for genre, count in sorted(genres.items(), key=lambda item: (-item[1], item[0]))],
+    "areas": [{"state": state, "city": city, "count": count}
+              for (state, city), count in sorted(areas.items(), key=lambda item: (str(item[0][0]), str(item[0][1])))],
+  }
+
+#----------------------------------------------------------------------------#
+# Search.
+#----------------------------------------------------------------------------#
+
+# the text indexed for full-text search; written as literal SQL so it is
+# identical to the expression index in migrations/versions/c3a1f0d2b7e4_.py
+SEARCH_DOCUMENT = (
+  "to_tsvector('simple', coalesce(\"{0}\".name, '') || ' ' || coalesce(\"{0}\".city, '') "
+  "|| ' ' || fyyur_genres_text(\"{0}\".genres))"
+)
+
+def search_document(model):
+  return db.literal_column(SEARCH_DOCUMENT.format(model.__tablename__))
+
+# ranked search over name, city and genres of Venue or Artist; each row
+# carries id, name and num_upcoming_shows (read from the maintained counter)
+# and the total number of matches, so the count needs no second query.
+# filters are facet_args() narrowing the matches by genre and area
+def search_statement(model, search_term, limit, offset, filters=None):
+  search_term = search_term.strip()
+  pattern = '%' + search_term.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+  if db.engine.dialect.name == 'postgresql':
+    # trigram GIN indexes serve the ILIKE filters, the tsvector GIN index
+    # serves the full-text match on name/city/genres
+    query = db.func.plainto_tsquery(db.literal_column("'simple'"), search_term)
+    document = search_document(model)
+    match = db.or_(model.name.ilike(pattern, escape='\\'),
+                   model.city.ilike(pattern, escape='\\'),
+                   document.op('@@')(query))
+    rank = db.func.similarity(model.name, search_term) + db.func.ts_rank(document, query)
+  else:
+    # SQLite fallback: LIKE is case-insensitive for ASCII, genres are JSON text
+    match = db.or_(model.name.like(pattern, escape='\\'),
+                   model.city.like(pattern, escape='\\'),
+                   db.cast(model.genres, db.String).like(pattern, escape='\\'))
+    rank = db.case(
+      (db.func.lower(model.name) == search_term.lower(), 3),
+      (db.func.lower(model.name).like(search_term.lower() + '%'), 2),
+      (model.name.like(pattern, escape='\\'), 1),
+      else_=0)
+
+  rank = rank.label('rank')
+  return db.select(
+      model.id,
+      model.name,
+      model.upcoming_shows_count.label('num_upcoming_shows'),
+      rank,
+      db.func.count().over().label('total')
+    ).where(match, *facet_filter(model, filters)) \
+    .order_by(rank.desc(), model.name, model.id) \
+    .limit(limit).offset(offset)
+
+# (total, rows) of search_statement()
+def search_entities(model, search_term, limit, offset, filters=None):
+  rows = db.session.execute(search_statement(model, search_term, limit, offset, filters)).all()
+  return search_total(rows), rows
+
+def search_total(rows):
+  return rows[0].total if rows else 0
+
+# the results as the search templates list them
+def search_results(total, rows):
+  return {
+    "count": total,
+    "data": [{
+      "id": row.id,
+      "name": row.name,
+      "num_upcoming_shows": row.num_upcoming_shows
+    } for row in rows]
+  }
+
+#----------------------------------------------------------------------------#
+# Nearby venues.
+#----------------------------------------------------------------------------#
+
+# ?lat= and ?lng= of the point and the ?radius= in km (clamped)
+def nearby_args():
+  latitude = request.args.get('lat', type=float)
+  longitude = request.args.get('lng', type=float)
+  radius = request.args.get('radius', app.config['NEARBY_RADIUS_KM'], type=float)
+  if latitude is None or longitude is None or radius <= 0:
+    abort(400)
+  if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+    abort(400)
+  return latitude, longitude, min(radius, app.config['NEARBY_MAX_RADIUS_KM'])
+
+# located venues within radius_km of a point, nearest first, with their
+# upcoming-show counts. only the geohash cells covering the circle are read
+# (index range scans), ordered by a flat-earth approximation of the distance
+# that needs no trigonometry in SQL; the exact distance is computed for the
+# returned rows
+def nearby_venues(latitude, longitude, radius_km, limit):
+  cells = [Venue.geohash.between(*geo.prefix_range(prefix))
+           for prefix in geo.cover(latitude, longitude, radius_km)]
+  # a degree of longitude is shortest at the edge of the circle closest to
+  # a pole; scaled for that latitude, the approximation never puts a venue
+  # in range farther away than it is (near a pole every longitude is in range)
+  south, north, _, _ = geo.bounding_box(latitude, longitude, radius_km)
+  poleward = max(abs(south), abs(north))
+  scale = 0.0 if poleward >= 89.9 else math.cos(math.radians(poleward))
+  dlat = Venue.latitude - latitude
+  dlng = (Venue.longitude - longitude) * scale
+  approximate = dlat * dlat + dlng * dlng
+  # the flat-earth approximation is within a few percent at these radii
+  bound = (1.05 * radius_km / geo.KM_PER_DEGREE) ** 2
+
+  rows = db.session.query(Venue.id, Venue.name, Venue.city, Venue.state, Venue.latitude,
+                          Venue.longitude, Venue.upcoming_shows_count) \
+    .filter(db.or_(*cells), approximate <= bound) \
+    .order_by(approximate, Venue.id).limit(limit).all()
+
+  venues = []
+  for row in rows:
+    distance = geo.distance_km(latitude, longitude, row.latitude, row.longitude)
+    if distance <= radius_km:
+      venues.append({
+        "id": row.id,
+        "name": row.name,
+        "city": row.city,
+        "state": row.state,
+        "latitude": row.latitude,
+        "longitude": row.longitude,
+        "distance_km": round(distance, 2),
+        "num_upcoming_shows": row.upcoming_shows_count
+      })
+  venues.sort(key=lambda venue: (venue['distance_km'], venue['id']))
+  return venues
+
+# limit/offset for the search endpoints, clamped to the configured maximum
+def search_window():
+  limit = request.values.get('limit', app.config['SEARCH_PAGE_SIZE'], type=int)
+  offset = request.values.get('offset', 0, type=int)
+  if limit < 1 or offset < 0:
+    abort(400)
+  return min(limit, app.config['SEARCH_MAX_PAGE_SIZE']), offset
+
 #----------------------------------------------------------------------------#
 # Controllers.
 #----------------------------------------------------------------------------#
 
 @app.route('/')
+@query_budget(0)
 def index():
+  surrogate_keys.tag('home')
   return render_template('pages/home.html')
 
 
 #  Venues
 #  ----------------------------------------------------------------
 
+# one query: every (matching) venue with its maintained upcoming-show
+# counter, ordered so that venues of the same city/state are adjacent
+def venues_query(filters=None):
+  return db.session.query(
+      Venue.city,
+      Venue.state,
+      Venue.id,
+      Venue.name,
+      Venue.upcoming_shows_count.label('num_upcoming_shows')
+    ).filter(*facet_filter(Venue, filters)) \
+    .order_by(Venue.state, Venue.city, Venue.name)
+
+# groups the sorted rows by city/state in a single pass; each area's venues
+# are produced lazily, so they must be consumed before the next area
+def venue_areas(rows):
+  for (city, state), area_rows in groupby(rows, key=lambda row: (row.city, row.state)):
+    yield {
+      "city": city,
+      "state": state,
+      "venues": ({
+        "id": row.id,
+        "name": row.name,
+        "num_upcoming_shows": row.num_upcoming_shows
+      } for row in area_rows)
+    }
+
+def venues_data(filters=None):
+  return venue_list(venues_query(filters).all())
+
+def venue_list(rows):
+  return [dict(area, venues=list(area["venues"])) for area in venue_areas(rows)]
+
+# the listing plus the genre/area facets of the sidebar (cached separately);
+# with STREAM_LIST_PAGES the venues go from the cursor straight into the
+# response instead
 @app.route('/venues')
+@query_budget(2)
 def venues():
+  filters = facet_args()
+  surrogate_keys.tag('venues')
+  if app.config['STREAM_LIST_PAGES']:
+    rows = venues_query(filters).execution_options(yield_per=app.config['STREAM_BATCH_SIZE'])
+    return streamed_page('pages/venues.html', areas=venue_areas(rows), filters=filters,
+                         facets=facets(Venue, filters))
 
-  # define a list to store venues data
-  data = []
-
-  # retrieve all venues data from database as a list
-  venues = Venue.query.all()
+  key = cache.namespaced('venues', filters['genre'], filters['state'], filters['city'])
+  data = cache.get_or_set(key, lambda: venues_data(filters))
 
-  # only add unique combinations of city and state in a set
-  venues_locations = set()
-  for venue in venues:
-    venues_locations.add([venue.city, venue.state])
-  
-  # structure out of the data list by iterating each combo
-  for location in venues_locations:
-    data.append({
-      "city": location[0],
-      "state": location[1],
-      "venues": []
-    })
-
-  # iterating each venue, then get the # of upcoming shows from Show table
-  for venue in venues:
-    num_upcoming_shows = 0
-
-    # filter Show table corresponding venue id, output as a list 
-    shows = Show.query.filter_by(venue_id = venue.id).all()
-
-    # if the start time is after today, add 1 
-    for show in shows:
-      if show.start_time > datetime.now():
-        num_upcoming_shows += 1
-    
-    # for each item in data, add venues to match city/state
-    for item in data:
-      if venue.city == item["city"] and venue.state == item["state"]:
-        item["venues"].append({
-          "id": venue.id,
-          "name": venue.name,
-          "num_upcoming_shows": num_upcoming_shows
-        })
-  
   # render venues page with data
-  return render_template('pages/venues.html', areas=data)
+  return render_template('pages/venues.html', areas=data, filters=filters,
+                         facets=facets(Venue, filters))
 
 @app.route('/venues/search', methods=['POST'])
+@query_budget(1)
 def search_venues():
   # Get the search term from user
   search_term=request.form.get('search_term', '')
+  limit, offset = search_window()
+  filters = facet_args()
+
+  # find matching venues by name, city or genre, best matches first,
+  # together with their number of upcoming shows
+  total, venues = search_entities(Venue, search_term, limit, offset, filters)
+
+  return render_template('pages/search_venues.html', results=search_results(total, venues),
+                         search_term=search_term,
+                         limit=limit, offset=offset, filters=filters)
+
+# the venue together with its shows and their artists in one joined query
+def venue_statement(venue_id):
+  return db.select(Venue).options(
+      db.joinedload(Venue.shows).joinedload(Show.artist)
+    ).where(Venue.id == venue_id)
+
+def venue_data(venue_id):
+  return venue_dict(db.session.execute(venue_statement(venue_id)).unique().scalars().first())
+
+def venue_dict(venue):
+  if venue is None:
+    abort(404)
+
+  # split the shows into past and upcoming in a single pass
+  now = datetime.utcnow()
+  past_shows, upcoming_shows = split_shows(venue.shows, lambda show: {
+    "artist_id": show.artist_id,
+    "artist_name": show.artist.name,
+    "artist_image_link": show.artist.image_link,
+    "start_time": format_datetime(str(show.start_time))
+  }, now)
 
-  # find all matching venues based on search term
-  # including partial match and case insensitive
-  venues = Venue.query.fliter(Venue.name.ilike(f"%{search_term}%")).all()
-
-  response = {
-    "count": len(venues),
-    "data": []
-  }
-
-  for venue in venues:
-    num_upcoming_shows = 0
-
-    # filter Show table corresponding venue id, output as a list 
-    shows = Show.query.filter_by(venue_id = venue.id).all()
-
-    # if the start time is after today, add 1 
-    for show in shows:
-      if show.start_time > datetime.now():
-        num_upcoming_shows += 1
-
-    # add data values to response
-    response["data"].append({
-      "id": venue.id,
-      "name": venue.name,
-      "num_upcoming_shows": num_upcoming_shows
-      })
-
-  return render_template('pages/search_venues.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/venues/<int:venue_id>')
-def show_venue(venue_id):
-  # get the venue corresponding to the user input venue id
-  venue = Venue.query.filter_by(id = venue_id).first()
-
-  # get all the shows records for a given venue id
-  shows = Show.query.filter_by(venue_id = venue_id).all()
-
-  # return upcoming shows
-  def upcoming_shows_func():
-    upcoming_shows = []
-
-    for show in shows:
-      if show.start_time > datetime.now():
-        upcoming_shows.append({
-          "artist_id": show.artist_id,
-          "artist_name": Artist.query.filter_by(id = show.artist_id).first().name,
-          "artist_image_link": Artist.query.filter_by(id = show.artist_id).first().image_link,
-          "start_time": format_datetime(str(show.start_time)) 
-        })
-    return upcoming_shows
-  
-  # return past shows
-  def past_shows_func():
-    past_shows = []
-
-    for show in shows:
-      if show.start_time <= datetime.now():
-        past_shows.append({
-          "artist_id": show.artist_id,
-          "artist_name": Artist.query.filter_by(id = show.artist_id).first().name,
-          "artist_image_link": Artist.query.filter_by(id = show.artist_id).first().image_link,
-          "start_time": format_datetime(str(show.start_time)) 
-        })
-    return past_shows
-  
   # populate data
   data = {
     "id": venue.id,
@@ -234,22 +1050,47 @@ def show_venue(venue_id):
     "seeking_talent": venue.seeking_talent,
     "seeking_description": venue.seeking_description,
     "image_link": venue.image_link,
-    "past_shows": past_shows_func(),
-    "upcoming_shows": upcoming_shows_func(),
-    "past_shows_count": len(past_shows_func()),
-    "upcoming_shows_count": len(upcoming_shows_func())
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
+    # a show that has started moved the page from upcoming to past
+    "updated_at": max([venue.updated_at] + [max(show.updated_at, show.artist.updated_at)
+                                            for show in venue.shows]
+                      + [show.start_time for show in venue.shows if show.start_time <= now])
   }
-  return render_template('pages/show_venue.html', venue=data)
+  return data
+
+@app.route('/venues/nearby')
+@query_budget(1)
+def nearby_venues_page():
+  latitude, longitude, radius = nearby_args()
+  venues = nearby_venues(latitude, longitude, radius, app.config['NEARBY_LIMIT'])
+  surrogate_keys.tag('venues')
+  return render_template('pages/nearby_venues.html', venues=venues,
+                         latitude=latitude, longitude=longitude, radius=radius)
+
+@app.route('/venues/<int:venue_id>')
+@query_budget(1)
+def show_venue(venue_id):
+  return venue_page(cache.get_or_set('venue:%d' % venue_id, lambda: venue_data(venue_id)))
+
+def venue_page(data):
+  surrogate_keys.tag('venue-%d' % data['id'], *['artist-%d' % show['artist_id']
+                                               for show in data['past_shows'] + data['upcoming_shows']])
+  return conditional_page('venue', data, lambda: render_template('pages/show_venue.html', venue=data))
 
 #  Create Venue
 #  ----------------------------------------------------------------
 
 @app.route('/venues/create', methods=['GET'])
+@query_budget(0)
 def create_venue_form():
   form = VenueForm()
   return render_template('forms/new_venue.html', form=form)
 
 @app.route('/venues/create', methods=['POST'])
+@query_budget(1)
 def create_venue_submission():
 
   try:
@@ -273,11 +1114,15 @@ def create_venue_submission():
                   phone=phone, genres=genres, facebook_link=facebook_link,
                   website=website, image_link=image_link,
                   seeking_talent=seeking_talent,
-                  seeking_description=seeking_description)
+                  seeking_description=seeking_description,
+                  **gazetteer.locate(city, state))
 
     # add new venue to session and commit to database
     db.session.add(venue)
     db.session.commit()
+    cache.delete('facets:Venue')
+    cache.bump('venues')
+    surrogate_keys.purge('venues')
 
     # on successful db insert, flash success
     flash('Venue ' + request.form['name'] + ' was successfully listed!')
@@ -297,7 +1142,10 @@ def create_venue_submission():
 
   return render_template('pages/home.html')
 
+# queries: the venue, its shows (detached by the ORM), the delete and the
+# artist lookup of the cache invalidation
 @app.route('/venues/<venue_id>', methods=['DELETE'])
+@query_budget(4)
 def delete_venue(venue_id):
   try:
     # get the venue corresponding to the user input venue id
@@ -307,6 +1155,7 @@ def delete_venue(venue_id):
 
     db.session.delete(venue)
     db.session.commit()
+    invalidate_venue(venue_id)
 
     # on successful db delete, flash success
     flash("Venue " + name + " was successfully deleted")
@@ -323,12 +1172,16 @@ def delete_venue(venue_id):
 
 #  Artists
 #  ----------------------------------------------------------------
-@app.route('/artists')
-def artists():
+# all the (matching) artists
+def artists_query(filters=None):
+  return db.session.query(Artist.id, Artist.name) \
+    .filter(*facet_filter(Artist, filters)) \
+    .order_by(Artist.id)
 
-  # get all the artists
-  artists = Artist.query.all()
-  
+def artists_data(filters=None):
+  return artist_list(artists_query(filters).all())
+
+def artist_list(artists):
   data = []
 
   for artist in artists:
@@ -336,79 +1189,58 @@ def artists():
       "id": artist.id,
       "name": artist.name
     })
-  return render_template('pages/artists.html', artists=data)
+  return data
+
+# the listing plus the genre/area facets of the sidebar (cached separately)
+@app.route('/artists')
+@query_budget(2)
+def artists():
+  filters = facet_args()
+  key = cache.namespaced('artists', filters['genre'], filters['state'], filters['city'])
+  data = cache.get_or_set(key, lambda: artists_data(filters))
+  surrogate_keys.tag('artists')
+  return render_template('pages/artists.html', artists=data, filters=filters,
+                         facets=facets(Artist, filters))
 
 @app.route('/artists/search', methods=['POST'])
+@query_budget(1)
 def search_artists():
 
   # get the search term from user input
   search_term=request.form.get('search_term', '')
+  limit, offset = search_window()
+  filters = facet_args()
+
+  # find matching artists by name, city or genre, best matches first,
+  # together with their number of upcoming shows
+  total, artists = search_entities(Artist, search_term, limit, offset, filters)
+
+  return render_template('pages/search_artists.html', results=search_results(total, artists),
+                         search_term=search_term,
+                         limit=limit, offset=offset, filters=filters)
+
+# the artist together with its shows and their venues in one joined query
+def artist_statement(artist_id):
+  return db.select(Artist).options(
+      db.joinedload(Artist.shows).joinedload(Show.venue)
+    ).where(Artist.id == artist_id)
+
+def artist_data(artist_id):
+  return artist_dict(db.session.execute(artist_statement(artist_id)).unique().scalars().first())
+
+def artist_dict(artist):
+  if artist is None:
+    abort(404)
+
+  # split the shows into past and upcoming in a single pass
+  now = datetime.utcnow()
+  past_shows, upcoming_shows = split_shows(artist.shows, lambda show: {
+    "venue_id": show.venue_id,
+    "venue_name": show.venue.name,
+    "venue_image_link": show.venue.image_link,
+    "start_time": format_datetime(str(show.start_time))
+  }, now)
 
-  # get all the artists based on the user input and including partial match and case-insensitive
-  artists = Artist.query.filter(Artist.name.ilike(f"%{search_term}%")).all()
-
-  response = {
-    "count": len(artists),
-    "data": []
-  }
-
-  # get the # of upcoming shows and update the data
-  for artist in artists:
-    num_upcoming_shows = 0
-
-    shows = Show.query.filter_by(artist_id = artist.id).all()
-
-    for show in shows:
-      if show.start_time > datetime.now():
-        num_upcoming_shows += 1
-    
-    response["data"].append({
-      "id": artist.id,
-      "name": artist.name,
-      "num_upcoming_shows": num_upcoming_shows
-    })
-
-  return render_template('pages/search_artists.html', results=response, search_term=request.form.get('search_term', ''))
-
-@app.route('/artists/<int:artist_id>')
-def show_artist(artist_id):
-
-  # get artist based on given artist id
-  artist = Artist.query.filter_by(id = artist_id).first()
-
-  # get all shows based on given artist id 
-  shows = Show.query.filter_by(artist_id = artist_id).all()
-
-  # return upcoming shows for the given artist
-  def upcoming_shows_func():
-    upcoming_shows = []
-
-    for show in shows:
-      if show.start_time > datetime.now():
-        venue = Venue.query.filter_by(id = show.venue_id).first()
-        upcoming_shows.append({
-          "venue_id": show.venue_id,
-          "venue_name": venue.name,
-          "venue_image_link": venue.image_link,
-          "start_time": format_datetime(str(show.start_time))
-        })
-    return upcoming_shows
-  
-  # return past shows for the given artist
-  def past_shows_func():
-    past_shows = []
-
-    for show in shows:
-      if show.start_time <= datetime.now():
-        venue = Venue.query.filter_by(id = show.venue_id).first()
-        past_shows.append({
-          "venue_id": show.venue_id,
-          "venue_name": venue.name,
-          "venue_image_link": venue.image_link,
-          "start_time": format_datetime(str(show.start_time))
-        })
-    return past_shows
-  
   # populate artist data
   data = {
     "id": artist.id,
@@ -422,17 +1254,31 @@ def show_artist(artist_id):
     "seeking_venue": artist.seeking_venue,
     "seeking_description": artist.seeking_description,
     "image_link": artist.image_link,
-    "past_shows": past_shows_func(),
-    "upcoming_shows": upcoming_shows_func(),
-    "past_shows_count": len(past_shows_func()),
-    "upcoming_shows_count": len(upcoming_shows_func()),
+    "past_shows": past_shows,
+    "upcoming_shows": upcoming_shows,
+    "past_shows_count": len(past_shows),
+    "upcoming_shows_count": len(upcoming_shows),
+    # a show that has started moved the page from upcoming to past
+    "updated_at": max([artist.updated_at] + [max(show.updated_at, show.venue.updated_at)
+                                             for show in artist.shows]
+                      + [show.start_time for show in artist.shows if show.start_time <= now])
   }
+  return data
+
+@app.route('/artists/<int:artist_id>')
+@query_budget(1)
+def show_artist(artist_id):
+  return artist_page(cache.get_or_set('artist:%d' % artist_id, lambda: artist_data(artist_id)))
 
-  return render_template('pages/show_artist.html', artist=data)
+def artist_page(data):
+  surrogate_keys.tag('artist-%d' % data['id'], *['venue-%d' % show['venue_id']
+                                                for show in data['past_shows'] + data['upcoming_shows']])
+  return conditional_page('artist', data, lambda: render_template('pages/show_artist.html', artist=data))
 
 #  Update
 #  ----------------------------------------------------------------
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
+@query_budget(1)
 def edit_artist(artist_id):
   form = ArtistForm()
 
@@ -461,7 +1307,9 @@ def edit_artist(artist_id):
 
   return render_template('forms/edit_artist.html', form=form, artist=artist)
 
+# queries: the artist, the update and the venue lookup of the cache invalidation
 @app.route('/artists/<int:artist_id>/edit', methods=['POST'])
+@query_budget(3)
 def edit_artist_submission(artist_id):
   try:
     form = ArtistForm()
@@ -484,6 +1332,7 @@ def edit_artist_submission(artist_id):
 
     # commit the changes
     db.session.commit()
+    invalidate_artist(artist_id)
 
     flash('Artist ' + request.form['name'] + ' was successfully updated!')
   except ValidationError as e:
@@ -500,6 +1349,7 @@ def edit_artist_submission(artist_id):
   return redirect(url_for('show_artist', artist_id=artist_id))
 
 @app.route('/venues/<int:venue_id>/edit', methods=['GET'])
+@query_budget(1)
 def edit_venue(venue_id):
   form = VenueForm()
   
@@ -529,7 +1379,9 @@ def edit_venue(venue_id):
 
   return render_template('forms/edit_venue.html', form=form, venue=venue)
 
+# queries: the venue, the update and the artist lookup of the cache invalidation
 @app.route('/venues/<int:venue_id>/edit', methods=['POST'])
+@query_budget(3)
 def edit_venue_submission(venue_id):
   try:
     form = VenueForm()
@@ -550,9 +1402,12 @@ def edit_venue_submission(venue_id):
     venue.image_link = form.image_link.data
     venue.seeking_talent = True if form.seeking_talent.data == 'Yes' else False
     venue.seeking_description = form.seeking_description.data
+    for column, value in gazetteer.locate(venue.city, venue.state).items():
+      setattr(venue, column, value)
 
     # commit the changes
     db.session.commit()
+    invalidate_venue(venue_id)
 
     flash('Venue ' + request.form['name'] + ' was successfully updated!')
   except ValidationError as e:
@@ -572,11 +1427,13 @@ def edit_venue_submission(venue_id):
 #  ----------------------------------------------------------------
 
 @app.route('/artists/create', methods=['GET'])
+@query_budget(0)
 def create_artist_form():
   form = ArtistForm()
   return render_template('forms/new_artist.html', form=form)
 
 @app.route('/artists/create', methods=['POST'])
+@query_budget(1)
 def create_artist_submission():
   try:
     form = ArtistForm()
@@ -603,6 +1460,9 @@ def create_artist_submission():
     # add new data and commit the changes
     db.session.add(artist)
     db.session.commit()
+    cache.delete('facets:Artist')
+    cache.bump('artists')
+    surrogate_keys.purge('artists')
 
     flash('Artist ' + request.form['name'] + ' was successfully updated!')
 
@@ -623,51 +1483,127 @@ def create_artist_submission():
 #  Shows
 #  ----------------------------------------------------------------
 
+SHOW_FILTERS = ('all', 'upcoming', 'past')
+
 @app.route('/shows')
+@query_budget(1)
 def shows():
-  
-  # get all the show data
-  shows = Show.query.all()
 
-  data = []
-
-  for show in shows:
-    venue = Venue.query.filter_by(id = show.venue_id).first()
-    artist = Artist.query.filter_by(id = show.artist_id).first()
-    data.append({
-          "venue_id": show.venue_id,
-          "venue_name": venue.name,
-          "artist_id": show.artist_id,
-          "artist_name": artist.name,
-          "artist_image_link": artist.image_link,
-          "start_time": format_datetime(str(show.start_time))
-    })
-  return render_template('pages/shows.html', shows=data)
+  # which shows to list ("upcoming", "past" or "all") and how many per page
+  when = request.args.get('when', 'all')
+  if when not in SHOW_FILTERS:
+    abort(400)
+  per_page, after = page_args(app.config['SHOWS_PAGE_SIZE'], app.config['SHOWS_MAX_PAGE_SIZE'],
+                              [Show.start_time, Show.id])
+
+  # streamed pages are tagged before their shows are known
+  if app.config['STREAM_LIST_PAGES']:
+    surrogate_keys.tag('shows')
+    page = StreamedPage(shows_query(when), [Show.start_time, Show.id], show_row, after=after,
+                        per_page=per_page, descending=(when == 'past'),
+                        batch_size=app.config['STREAM_BATCH_SIZE'])
+    return streamed_page('pages/shows.html', shows=page, when=when, per_page=per_page)
+
+  key = cache.namespaced('shows', when, per_page, request.args.get('after', ''))
+  data, next_cursor = cache.get_or_set(key, lambda: shows_data(when, after, per_page))
+  surrogate_keys.tag('shows', *['show-%d' % show['show_id'] for show in data])
+
+  return render_template('pages/shows.html', shows=Page(data, next_cursor), when=when,
+                         per_page=per_page)
+
+# shows joined to their venue and artist columns, optionally restricted to
+# upcoming or past shows
+def shows_query(when):
+  # one joined query: the show with its venue and artist columns
+  query = db.session.query(
+      Show.id,
+      Show.start_time,
+      Show.end_time,
+      Show.venue_id,
+      Venue.name.label('venue_name'),
+      Show.artist_id,
+      Artist.name.label('artist_name'),
+      Artist.image_link.label('artist_image_link')
+    ).join(Venue, Venue.id == Show.venue_id) \
+    .join(Artist, Artist.id == Show.artist_id)
+
+  now = datetime.utcnow()
+  if when == 'upcoming':
+    query = query.filter(Show.start_time > now)
+  elif when == 'past':
+    query = query.filter(Show.start_time <= now)
+  return query
+
+# one page of the shows feed (plus a row telling whether another follows);
+# past shows read most recent first, everything else chronologically
+def shows_page_query(when, after, per_page):
+  return keyset_query(shows_query(when), [Show.start_time, Show.id], after=after,
+                      per_page=per_page, descending=(when == 'past'))
+
+# one page of the shows feed as (data, next_cursor)
+def shows_data(when, after, per_page):
+  return shows_page(shows_page_query(when, after, per_page).all(), per_page)
+
+def shows_page(rows, per_page):
+  rows, next_cursor = trim_page(rows, [Show.start_time, Show.id], per_page)
+  return [show_row(row) for row in rows], next_cursor
+
+# a row of shows_query as listed in the shows feed
+def show_row(row):
+  return {
+    "show_id": row.id,
+    "venue_id": row.venue_id,
+    "venue_name": row.venue_name,
+    "artist_id": row.artist_id,
+    "artist_name": row.artist_name,
+    "artist_image_link": row.artist_image_link,
+    "start_time": format_datetime(str(row.start_time))
+  }
 
 @app.route('/shows/create')
+@query_budget(0)
 def create_shows():
   # renders form. do not touch.
   form = ShowForm()
   return render_template('forms/new_show.html', form=form)
 
+# queries: the counter watermark (created on first use), the insert, the
+# venue and artist counter updates and the booking conflict check
 @app.route('/shows/create', methods=['POST'])
+@query_budget(6)
 def create_show_submission():
   try:
     # get user input data from form
+    form = ShowForm()
     artist_id = request.form['artist_id']
     venue_id = request.form['venue_id']
-    start_time = request.form['start_time']
+    start_time = dateutil.parser.parse(request.form['start_time'])
+    if not form.duration.validate(form):
+      raise ValidationError('The duration must be between 1 and 1440 minutes.')
+    end_time = start_time + timedelta(minutes=form.duration.data)
 
     # create new show with user data
     show = Show(artist_id=artist_id, venue_id=venue_id,
-                start_time=start_time)
+                start_time=start_time, end_time=end_time)
 
-    # add show and commit session
+    # add show, update the venue/artist counters and commit session; the
+    # venue's counter update locks its row, so concurrent bookings of the
+    # same venue queue up there and the conflict check sees each other's shows
     db.session.add(show)
+    count_show(show, 1)
+    conflict = booking_conflict(int(venue_id), start_time, end_time, exclude_id=show.id)
+    if conflict is not None:
+      raise ValidationError('The venue is already booked from %s to %s.' % (
+        format_datetime(str(conflict.start_time)), format_datetime(str(conflict.end_time))))
+    show_id = show.id
     db.session.commit()
+    invalidate_show(venue_id, artist_id, show_id)
 
     # on successful db insert, flash success
     flash('Show was successfully listed!')
+  except ValidationError as e:
+    db.session.rollback()
+    flash('An error occurred. Show could not be listed. ' + str(e))
   except:
       # rollback if exception
       db.session.rollback()
@@ -677,6 +1613,321 @@ def create_show_submission():
       db.session.close()
   return render_template('pages/home.html')
 
+# queries: the show, the counter watermark, both counter updates and the delete
+@app.route('/shows/<int:show_id>', methods=['DELETE'])
+@query_budget(5)
+def delete_show(show_id):
+  # get the show corresponding to the user input show id
+  show = Show.query.filter_by(id = show_id).first_or_404()
+  venue_id, artist_id = show.venue_id, show.artist_id
+
+  try:
+    # remove the show and take it off the venue/artist counters
+    count_show(show, -1)
+    db.session.delete(show)
+    db.session.commit()
+
+  except SQLAlchemyError:
+    app.logger.exception('deleting show %d failed', show_id)
+    db.session.rollback()
+    flash("An error occurred. Show could not be deleted")
+    return jsonify({"success": False}), 500
+
+  finally:
+    db.session.close()
+
+  invalidate_show(venue_id, artist_id, show_id)
+
+  # on successful db delete, flash success
+  flash("Show was successfully deleted")
+  return jsonify({"success": True})
+
+#  API
+#  ----------------------------------------------------------------
+
+# the listings select plain columns rather than ORM entities, which keeps
+# rows cheap and lets exports stream with yield_per
+
+def venue_json(venue):
+  return {
+    "id": venue.id,
+    "name": venue.name,
+    "genres": venue.genres,
+    "address": venue.address,
+    "city": venue.city,
+    "state": venue.state,
+    "phone": venue.phone,
+    "website": venue.website,
+    "facebook_link": venue.facebook_link,
+    "seeking_talent": venue.seeking_talent,
+    "seeking_description": venue.seeking_description,
+    "image_link": venue.image_link,
+    "upcoming_shows_count": venue.upcoming_shows_count,
+    "past_shows_count": venue.past_shows_count,
+    "latitude": venue.latitude,
+    "longitude": venue.longitude
+  }
+
+def artist_json(artist):
+  return {
+    "id": artist.id,
+    "name": artist.name,
+    "genres": artist.genres,
+    "city": artist.city,
+    "state": artist.state,
+    "phone": artist.phone,
+    "website": artist.website,
+    "facebook_link": artist.facebook_link,
+    "seeking_venue": artist.seeking_venue,
+    "seeking_description": artist.seeking_description,
+    "image_link": artist.image_link,
+    "upcoming_shows_count": artist.upcoming_shows_count,
+    "past_shows_count": artist.past_shows_count
+  }
+
+def show_json(show):
+  return {
+    "id": show.id,
+    "venue_id": show.venue_id,
+    "venue_name": show.venue_name,
+    "artist_id": show.artist_id,
+    "artist_name": show.artist_name,
+    "artist_image_link": show.artist_image_link,
+    "start_time": show.start_time.isoformat(),
+    "end_time": show.end_time.isoformat()
+  }
+
+# streams every row of the query as newline-delimited JSON; rows come from a
+# server-side cursor in batches of API_EXPORT_BATCH_SIZE, so memory stays
+# constant no matter how many rows are exported
+def ndjson_response(query, serialize):
+  rows = query.execution_options(yield_per=app.config['API_EXPORT_BATCH_SIZE'])
+
+  def generate():
+    for row in rows:
+      yield json.dumps(serialize(row), separators=(',', ':')) + '\n'
+
+  return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+# a keyset-paginated JSON listing, or the full result as NDJSON with ?format=ndjson
+def api_listing(query, sort_columns, serialize, descending=False):
+  response_format = request.args.get('format', 'json')
+  if response_format == 'ndjson':
+    order = [column.desc() if descending else column.asc() for column in sort_columns]
+    return ndjson_response(query.order_by(*order), serialize)
+  if response_format != 'json':
+    abort(400)
+
+  per_page, after = page_args(app.config['API_PAGE_SIZE'], app.config['API_MAX_PAGE_SIZE'], sort_columns)
+  rows, next_cursor = keyset_page(query, sort_columns, after=after,
+                                  per_page=per_page, descending=descending)
+
+  next_url = None
+  if next_cursor:
+    args = request.args.to_dict()
+    args.update(after=next_cursor, per_page=per_page)
+    next_url = url_for(request.endpoint, **args)
+
+  return jsonify({
+    "data": [serialize(row) for row in rows],
+    "next_cursor": next_cursor,
+    "next": next_url
+  })
+
+@app.route('/api/v1/venues')
+@query_budget(1)
+def api_venues():
+  query = db.session.query(*Venue.__table__.columns).filter(*facet_filter(Venue, facet_args()))
+  surrogate_keys.tag('venues')
+  return api_listing(query, [Venue.id], venue_json)
+
+@app.route('/api/v1/venues/nearby')
+@query_budget(1)
+def api_venues_nearby():
+  latitude, longitude, radius = nearby_args()
+  surrogate_keys.tag('venues')
+  return jsonify({"data": nearby_venues(latitude, longitude, radius, app.config['NEARBY_LIMIT'])})
+
+@app.route('/api/v1/venues/facets')
+@query_budget(1)
+def api_venue_facets():
+  surrogate_keys.tag('venues')
+  return jsonify(facets(Venue, facet_args()))
+
+@app.route('/api/v1/artists')
+@query_budget(1)
+def api_artists():
+  query = db.session.query(*Artist.__table__.columns).filter(*facet_filter(Artist, facet_args()))
+  surrogate_keys.tag('artists')
+  return api_listing(query, [Artist.id], artist_json)
+
+@app.route('/api/v1/artists/facets')
+@query_budget(1)
+def api_artist_facets():
+  surrogate_keys.tag('artists')
+  return jsonify(facets(Artist, facet_args()))
+
+@app.route('/api/v1/shows')
+@query_budget(1)
+def api_shows():
+  when = request.args.get('when', 'all')
+  if when not in SHOW_FILTERS:
+    abort(400)
+
+  surrogate_keys.tag('shows')
+  return api_listing(shows_query(when), [Show.start_time, Show.id], show_json,
+                     descending=(when == 'past'))
+
+#  Async views
+#  ----------------------------------------------------------------
+
+# with ASYNC_MODE these replace the read views of the same name: the same
+# statements, caching, replica routing and query budgets, but awaited on the
+# asyncio engine, with the independent ones (a listing and its facets)
+# running at the same time. list pages are not streamed in this mode
+
+# the shaped result of a statement run on the asyncio engine
+async def fetch(statement, shape):
+  return shape(await async_db.execute(statement))
+
+def cached_fetch(key, statement, shape):
+  return cache.aget_or_set(key, lambda: fetch(statement, shape))
+
+def facet_fetch(model):
+  return cached_fetch('facets:%s' % model.__tablename__, facet_statement(model),
+                      lambda result: [tuple(row) for row in result])
+
+@query_budget(2)
+async def venues_async():
+  filters = facet_args()
+  key = cache.namespaced('venues', filters['genre'], filters['state'], filters['city'])
+  data, rows = await asyncio.gather(
+    cached_fetch(key, venues_query(filters).statement, lambda result: venue_list(result.all())),
+    facet_fetch(Venue))
+  surrogate_keys.tag('venues')
+  return render_template('pages/venues.html', areas=data, filters=filters,
+                         facets=facet_counts(rows, filters))
+
+@query_budget(1)
+async def search_venues_async():
+  search_term = request.form.get('search_term', '')
+  limit, offset = search_window()
+  filters = facet_args()
+  venues = await fetch(search_statement(Venue, search_term, limit, offset, filters),
+                       lambda result: result.all())
+  return render_template('pages/search_venues.html', results=search_results(search_total(venues), venues),
+                         search_term=search_term, limit=limit, offset=offset, filters=filters)
+
+@query_budget(1)
+async def show_venue_async(venue_id):
+  return venue_page(await cached_fetch('venue:%d' % venue_id, venue_statement(venue_id),
+                                       lambda result: venue_dict(result.unique().scalars().first())))
+
+@query_budget(2)
+async def artists_async():
+  filters = facet_args()
+  key = cache.namespaced('artists', filters['genre'], filters['state'], filters['city'])
+  data, rows = await asyncio.gather(
+    cached_fetch(key, artists_query(filters).statement, lambda result: artist_list(result.all())),
+    facet_fetch(Artist))
+  surrogate_keys.tag('artists')
+  return render_template('pages/artists.html', artists=data, filters=filters,
+                         facets=facet_counts(rows, filters))
+
+@query_budget(1)
+async def search_artists_async():
+  search_term = request.form.get('search_term', '')
+  limit, offset = search_window()
+  filters = facet_args()
+  artists = await fetch(search_statement(Artist, search_term, limit, offset, filters),
+                        lambda result: result.all())
+  return render_template('pages/search_artists.html', results=search_results(search_total(artists), artists),
+                         search_term=search_term, limit=limit, offset=offset, filters=filters)
+
+@query_budget(1)
+async def show_artist_async(artist_id):
+  return artist_page(await cached_fetch('artist:%d' % artist_id, artist_statement(artist_id),
+                                        lambda result: artist_dict(result.unique().scalars().first())))
+
+@query_budget(1)
+async def shows_async():
+  when = request.args.get('when', 'all')
+  if when not in SHOW_FILTERS:
+    abort(400)
+  per_page, after = page_args(app.config['SHOWS_PAGE_SIZE'], app.config['SHOWS_MAX_PAGE_SIZE'],
+                              [Show.start_time, Show.id])
+
+  key = cache.namespaced('shows', when, per_page, request.args.get('after', ''))
+  data, next_cursor = await cached_fetch(key, shows_page_query(when, after, per_page).statement,
+                                         lambda result: shows_page(result.all(), per_page))
+  surrogate_keys.tag('shows', *['show-%d' % show['show_id'] for show in data])
+  return render_template('pages/shows.html', shows=Page(data, next_cursor), when=when,
+                         per_page=per_page)
+
+ASYNC_VIEWS = {
+  'venues': venues_async,
+  'search_venues': search_venues_async,
+  'show_venue': show_venue_async,
+  'artists': artists_async,
+  'search_artists': search_artists_async,
+  'show_artist': show_artist_async,
+  'shows': shows_async,
+}
+
+if async_db.enabled:
+  app.view_functions.update(ASYNC_VIEWS)
+
+#  Flash messages
+#  ----------------------------------------------------------------
+
+# pages leave flash messages out of their (shared-cacheable) body and fetch
+# them from here; the hint cookie tells them when there are any. reading the
+# session on every response would make every page vary by cookie, so the
+# message_flashed signal notes the flash instead
+FLASH_COOKIE = 'flashes'
+
+@message_flashed.connect_via(app)
+def note_flash(sender, message, category):
+  g.flashed = True
+
+@app.after_request
+def flag_flashes(response):
+  if g.pop('flashed', False):
+    response.set_cookie(FLASH_COOKIE, '1', samesite='Lax')
+  return response
+
+@app.route('/flashes')
+@query_budget(0)
+def flashes():
+  response = jsonify({"messages": get_flashed_messages()})
+  response.delete_cookie(FLASH_COOKIE)
+  response.cache_control.no_store = True
+  return response
+
+#  Cache
+#  ----------------------------------------------------------------
+
+@app.route('/cache/stats')
+@query_budget(0)
+def cache_stats():
+  return jsonify(cache.stats())
+
+#  Request statistics
+#  ----------------------------------------------------------------
+
+# per-endpoint latency histograms, query counts and slowest statements
+@app.route('/requests/stats')
+@query_budget(0)
+def request_stats():
+  return jsonify(instrumentation.stats())
+
+# the API answers bad requests (filters, cursors, page sizes) in JSON
+@app.errorhandler(400)
+def bad_request_error(error):
+    if request.path.startswith('/api/'):
+        return jsonify({"error": error.description}), 400
+    return error
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -685,6 +1936,12 @@ def not_found_error(error):
 def server_error(error):
     return render_template('errors/500.html'), 500
 
+# no pooled connection became free within DB_POOL_TIMEOUT: shed the load
+@app.errorhandler(PoolTimeoutError)
+def pool_timeout_error(error):
+    db.session.rollback()
+    return render_template('errors/500.html'), 503, {'Retry-After': '1'}
+
 
 if not app.debug:
     file_handler = FileHandler('error.log')
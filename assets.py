@@ -0,0 +1,207 @@
+#----------------------------------------------------------------------------#
+# Static assets.
+#----------------------------------------------------------------------------#
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import re
+import shutil
+
+from flask import current_app, request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # the .br variants are skipped
+    brotli = None
+
+try:
+    import rjsmin
+except ImportError:  # scripts are bundled as they are (the libraries ship minified)
+    rjsmin = None
+
+# bundle name -> source files (relative to the static folder), in order
+BUNDLES = {
+    'css/app.css': ['css/bootstrap.min.css', 'css/layout.main.css', 'css/main.css',
+                    'css/main.responsive.css', 'css/main.quickfix.css'],
+    'js/head.js': ['js/libs/modernizr-2.8.2.min.js', 'js/libs/moment.min.js'],
+    'js/app.js': ['js/script.js', 'js/libs/bootstrap-3.1.1.min.js', 'js/plugins.js'],
+}
+
+# files referenced on their own (the jQuery CDN fallback, an IE-only shim)
+FILES = ['js/libs/jquery-1.11.1.min.js', 'js/libs/respond-1.4.2.min.js']
+
+OUTPUT = 'dist'
+MANIFEST = 'manifest.json'
+
+# compressing tiny or already compressed files doesn't pay
+COMPRESS_TYPES = ('.css', '.js', '.svg', '.map', '.json', '.ttf', '.otf', '.eot')
+COMPRESS_MIN_BYTES = 256
+
+CSS_URL = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+
+
+def minify_css(css):
+    """Drop comments and the whitespace around punctuation."""
+    css = CSS_COMMENT.sub('', css)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+
+def minify_js(js):
+    return rjsmin.jsmin(js) if rjsmin is not None else js
+
+
+def fingerprint(name, content):
+    """``css/app.css`` -> ``css/app.<first 10 hex digits of its sha256>.css``"""
+    root, ext = os.path.splitext(name)
+    return '%s.%s%s' % (root, hashlib.sha256(content).hexdigest()[:10], ext)
+
+
+class Builder(object):
+    """Writes the bundles and files, fingerprinted, to ``static/dist`` along
+    with gzip/brotli variants and a manifest of logical -> hashed names."""
+
+    def __init__(self, static_folder, log=print):
+        self.static_folder = static_folder
+        self.output = os.path.join(static_folder, OUTPUT)
+        self.log = log
+        self.manifest = {}
+
+    def build(self):
+        if os.path.isdir(self.output):
+            shutil.rmtree(self.output)
+        os.makedirs(self.output)
+
+        for name, sources in sorted(BUNDLES.items()):
+            if name.endswith('.css'):
+                content = '\n'.join(self._css(name, source) for source in sources)
+                self._write(name, minify_css(content).encode('utf-8'))
+            else:
+                # a statement ending without a semicolon would run into the next file
+                content = ';\n'.join(self._read(source) for source in sources)
+                self._write(name, minify_js(content).encode('utf-8'))
+        for name in FILES:
+            self._copy(name)
+
+        with open(os.path.join(self.output, MANIFEST), 'w') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        return self.manifest
+
+    def _read(self, source):
+        with open(os.path.join(self.static_folder, source), encoding='utf-8') as f:
+            return f.read()
+
+    def _css(self, bundle, source):
+        # url()s are relative to the source file; point them at fingerprinted
+        # copies next to the bundle (or at the original file when it's missing)
+        def rewrite(match):
+            url = match.group(2)
+            if re.match(r'^([a-z]+:|//|#)', url):
+                return match.group(0)
+            path, _, suffix = url.partition('?')
+            path, hash_sep, fragment = path.partition('#')
+            target = os.path.normpath(os.path.join(os.path.dirname(source), path))
+            if os.path.isfile(os.path.join(self.static_folder, target)):
+                target = os.path.join(OUTPUT, self._copy(target))
+            relative = os.path.relpath(target, os.path.join(OUTPUT, os.path.dirname(bundle)))
+            relative = relative.replace(os.sep, '/') + hash_sep + fragment
+            return 'url("%s%s")' % (relative, '?' + suffix if suffix else '')
+        return CSS_URL.sub(rewrite, self._read(source))
+
+    def _copy(self, name):
+        if name not in self.manifest:
+            with open(os.path.join(self.static_folder, name), 'rb') as f:
+                self._write(name, f.read())
+        return self.manifest[name]
+
+    def _write(self, name, content):
+        hashed = fingerprint(name, content)
+        path = os.path.join(self.output, hashed)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(content)
+        sizes = ['%d B' % len(content)]
+
+        if name.endswith(COMPRESS_TYPES) and len(content) >= COMPRESS_MIN_BYTES:
+            # mtime=0 keeps the output identical between builds
+            with open(path + '.gz', 'wb') as f:
+                compressed = gzip.compress(content, compresslevel=9, mtime=0)
+                f.write(compressed)
+            sizes.append('%d B gzip' % len(compressed))
+            if brotli is not None:
+                with open(path + '.br', 'wb') as f:
+                    compressed = brotli.compress(content, quality=11)
+                    f.write(compressed)
+                sizes.append('%d B brotli' % len(compressed))
+
+        self.manifest[name] = hashed
+        self.log('%-36s %s' % (hashed, ', '.join(sizes)))
+
+
+class Assets(object):
+    """Serves the built assets and resolves logical names in templates.
+
+    ``asset_urls(name)`` gives the fingerprinted URL of a bundle or file
+    once ``flask build-assets`` has run, and the URLs of its source files
+    otherwise (so development works without a build). Fingerprinted files
+    never change, so they are served with a far-future immutable
+    Cache-Control, precompressed when the client accepts it.
+
+    Configuration:
+
+    * ``ASSETS_MAX_AGE`` - lifetime of the fingerprinted files, in seconds
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_age = app.config.get('ASSETS_MAX_AGE', 365 * 24 * 3600)
+        self.output = os.path.join(app.static_folder, OUTPUT)
+        self.load_manifest()
+
+        app.view_functions['static'] = self.static
+        app.jinja_env.globals.update(asset_urls=self.urls, asset_url=self.url)
+        app.extensions['assets'] = self
+
+    def load_manifest(self):
+        try:
+            with open(os.path.join(self.output, MANIFEST)) as f:
+                self.manifest = json.load(f)
+        except FileNotFoundError:
+            self.manifest = {}
+
+    def urls(self, name):
+        if name in self.manifest:
+            return [url_for('static', filename='%s/%s' % (OUTPUT, self.manifest[name]))]
+        return [url_for('static', filename=source) for source in BUNDLES.get(name, [name])]
+
+    def url(self, name):
+        return self.urls(name)[0]
+
+    def static(self, filename):
+        if not filename.startswith(OUTPUT + '/'):
+            return current_app.send_static_file(filename)
+
+        name = filename[len(OUTPUT) + 1:]
+        accepted = request.accept_encodings
+        for suffix, encoding in (('.br', 'br'), ('.gz', 'gzip')):
+            if accepted[encoding] and os.path.isfile(os.path.join(self.output, name + suffix)):
+                # the type and length are those of the compressed file
+                response = send_from_directory(self.output, name + suffix, max_age=self.max_age,
+                                               mimetype=mimetypes.guess_type(name)[0])
+                response.headers['Content-Encoding'] = encoding
+                break
+        else:
+            response = send_from_directory(self.output, name, max_age=self.max_age)
+        response.vary.add('Accept-Encoding')
+        response.cache_control.immutable = True
+        response.cache_control.public = True
+        return response
@@ -0,0 +1,146 @@
+#----------------------------------------------------------------------------#
+# Async database access.
+#----------------------------------------------------------------------------#
+import asyncio
+import os
+import threading
+
+from flask import g, has_app_context
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from database import engine_options
+from querycount import current_scopes, use_scopes
+
+# the asyncio driver used for each backend of SQLALCHEMY_DATABASE_URI
+ASYNC_DRIVERS = {'postgresql': 'asyncpg', 'sqlite': 'aiosqlite'}
+
+
+def async_url(url):
+    """``postgresql://...`` -> ``postgresql+asyncpg://...`` and the like."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError('no asyncio driver known for %s' % backend)
+    return url.set(drivername='%s+%s' % (backend, ASYNC_DRIVERS[backend]))
+
+
+class AsyncDatabase(object):
+    """SQLAlchemy's asyncio engine, for the async read views (ASYNC_MODE).
+
+    Pooled asyncio connections belong to the event loop that opened them,
+    so the engines live on one loop per process, run by a background
+    thread. Views ``await execute(statement)`` from their own loop; the
+    statement runs on the database loop, and statements awaited together
+    (``asyncio.gather``) run at the same time, each on its own connection.
+
+    Statements follow the replica routing of the request (see replicas.py):
+    they run on the replica it chose, with the same stickiness after writes,
+    and move to the primary when that replica fails. They are counted by
+    querycount like the queries of sync views.
+
+    Async views are run on a loop kept per worker thread, instead of a new
+    loop (and thread) per request as Flask does by default.
+
+    Configuration:
+
+    * ``ASYNC_MODE`` - serve the read views asynchronously
+    * ``ASYNC_DATABASE_URL`` - defaults to SQLALCHEMY_DATABASE_URI with its
+      asyncio driver (asyncpg, aiosqlite); pooled like the sync engine.
+      The replicas of SQLALCHEMY_REPLICA_URIS get the same driver
+    """
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.replicas = None
+        self._engine = None
+        self._replica_engines = {}
+        self._loop = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._thread_loops = threading.local()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.enabled = app.config.get('ASYNC_MODE', False)
+        app.extensions['async_database'] = self
+        if not self.enabled:
+            return
+        self.config = dict(app.config)
+        self.url = app.config.get('ASYNC_DATABASE_URL') or async_url(app.config['SQLALCHEMY_DATABASE_URI'])
+        # Replicas must be set up first; its replicas are named after their binds
+        self.replicas = app.extensions.get('replicas')
+        self.replica_urls = dict(
+            (replica.name, async_url(app.config['SQLALCHEMY_BINDS'][replica.name]))
+            for replica in (self.replicas.replicas if self.replicas is not None else ()))
+        app.async_to_sync = self.async_to_sync
+
+    def _create_engine(self, url):
+        return create_async_engine(url, **engine_options(dict(self.config, SQLALCHEMY_DATABASE_URI=url)))
+
+    def _start(self):
+        # once per process: a forked worker can't use its parent's loop thread
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._loop = asyncio.new_event_loop()
+            threading.Thread(target=self._loop.run_forever, name='async-database', daemon=True).start()
+            self._engine = self._create_engine(self.url)
+            self._replica_engines = {}
+            for replica in (self.replicas.replicas if self.replicas is not None else ()):
+                engine = self._create_engine(self.replica_urls[replica.name])
+                event.listen(engine.sync_engine, 'handle_error', self._handle_error(replica))
+                self._replica_engines[replica.name] = engine
+            self._pid = os.getpid()
+
+    def _handle_error(self, replica):
+        def handle_error(context):
+            # as Replicas does for the sync engines
+            if context.is_disconnect or context.connection is None:
+                self.replicas.mark_down(replica)
+        return handle_error
+
+    @property
+    def engine(self):
+        """The engine of the primary."""
+        if self._pid != os.getpid():
+            self._start()
+        return self._engine
+
+    async def _run(self, engine, statement):
+        async with AsyncSession(engine) as session:
+            # the rows are fetched before the session closes (a buffered result)
+            return await session.execute(statement)
+
+    async def _execute(self, statement, replica, scopes):
+        with use_scopes(scopes):
+            if replica is not None:
+                try:
+                    return await self._run(self._replica_engines[replica.name], statement)
+                except DBAPIError:
+                    if replica.healthy:
+                        raise
+                    # reads are safe to repeat; do it on the primary
+            return await self._run(self._engine, statement)
+
+    def execute(self, statement):
+        """Run ``statement`` on the database loop; await the buffered Result
+        from any event loop."""
+        self.engine  # starts the loop in a new process
+        replica = g.get('db_replica') if has_app_context() else None
+        if replica is not None and not replica.healthy:
+            replica = None
+        coroutine = self._execute(statement, replica, current_scopes())
+        return asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, self._loop))
+
+    def async_to_sync(self, func):
+        """Flask's hook for running async views."""
+        def run(*args, **kwargs):
+            loop = getattr(self._thread_loops, 'loop', None)
+            if loop is None:
+                loop = self._thread_loops.loop = asyncio.new_event_loop()
+            return loop.run_until_complete(func(*args, **kwargs))
+        return run
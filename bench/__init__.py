@@ -0,0 +1,22 @@
+#----------------------------------------------------------------------------#
+# Benchmarks.
+#----------------------------------------------------------------------------#
+"""Synthetic data and per-route benchmarks for Fyyur.
+
+    $ python -m bench generate --scale medium --database-url sqlite:///bench.db
+    $ python -m bench run --database-url sqlite:///bench.db
+    $ python -m bench compare bench/results/<old>.json bench/results/<new>.json
+"""
+import os
+
+
+def load_app(database_url=None):
+    """Import the Fyyur app module against ``database_url``.
+
+    The URL has to be in place before ``app`` is imported, because the
+    engine is configured at import time.
+    """
+    if database_url:
+        os.environ['DATABASE_URL'] = database_url
+    import app
+    return app
@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from bench import load_app
+from bench.coldstart import cold_start
+from bench.data import SCALES, Generator, load
+from bench.load import run_load
+from bench.memory import FIXTURES as MEMORY_FIXTURES, check_memory
+from bench.modes import compare_modes
+from bench.queries import FIXTURES, check_queries
+from bench.routes import CASES, Context, run_case, uncovered_endpoints
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def generate(args):
+    venues, artists, shows = SCALES[args.scale]
+    generator = Generator(args.venues or venues, args.artists or artists, args.shows or shows,
+                          seed=args.seed,
+                          anchor=datetime.strptime(args.anchor, '%Y-%m-%d') if args.anchor else None)
+    fyyur = load_app(args.database_url)
+    load(fyyur, generator, batch_size=args.batch_size, reset=args.reset)
+
+
+def run(args):
+    fyyur = load_app(args.database_url)
+    app = fyyur.app
+    # measure the app as it runs in production: no debug checks, and the
+    # forms are posted without CSRF tokens
+    app.debug = False
+    app.config.update(WTF_CSRF_ENABLED=False, SERVER_TIMING=False)
+
+    missing = uncovered_endpoints(app)
+    if missing:
+        print('warning: no benchmark for %s' % ', '.join(missing), file=sys.stderr)
+
+    cases = [case for case in CASES if not args.only or case.name in args.only]
+    ctx = Context(fyyur, seed=args.seed)
+    ctx.mark()
+    results = {}
+    try:
+        for case in cases:
+            results[case.name] = result = run_case(
+                ctx, case, args.iterations, warmup=args.warmup, warm_cache=args.warm_cache)
+            print('%-20s p50 %9.2f ms  p95 %9.2f ms  %5.1f queries  %9.1f KiB peak' % (
+                case.name, result['latency_ms']['p50'], result['latency_ms']['p95'],
+                result['queries']['mean'], result['peak_memory_kib']))
+    finally:
+        ctx.cleanup()
+
+    with app.app_context():
+        dialect = fyyur.db.engine.dialect.name
+    report = {
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'database': dialect,
+        'data': ctx.counts,
+        'iterations': args.iterations,
+        'warm_cache': args.warm_cache,
+        'routes': results,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, '%s-%s.json' % (report['commit'], dialect))
+    if os.path.dirname(output):
+        os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print('results written to %s' % output)
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    if baseline['data'] != current['data']:
+        print('warning: the runs used different data sets', file=sys.stderr)
+
+    regressions = []
+    print('%-20s %12s %12s %8s %10s' % ('route', 'p50 before', 'p50 after', 'change', 'queries'))
+    for name in sorted(set(baseline['routes']) & set(current['routes'])):
+        before, after = baseline['routes'][name], current['routes'][name]
+        old, new = before['latency_ms']['p50'], after['latency_ms']['p50']
+        change = (new - old) / old if old else 0
+        queries = '%s -> %s' % (before['queries']['max'], after['queries']['max'])
+        print('%-20s %9.2f ms %9.2f ms %+7.0f%% %10s' % (name, old, new, change * 100, queries))
+        if change > args.threshold or after['queries']['max'] > before['queries']['max']:
+            regressions.append(name)
+
+    if regressions:
+        print('regressed: %s' % ', '.join(regressions))
+        sys.exit(1)
+
+
+def check(args):
+    # the fixtures replace every row, so this never runs against $DATABASE_URL
+    scratch = args.scratch_database
+    if not scratch:
+        scratch = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='fyyur-queries-'), 'fyyur.db')
+    fyyur = load_app(scratch)
+    fyyur.app.debug = False
+    fyyur.app.config.update(WTF_CSRF_ENABLED=False, SERVER_TIMING=False)
+
+    failures = check_queries(fyyur, fixtures=args.fixtures, iterations=args.iterations)
+    if failures:
+        print('\n'.join(['', 'query count check failed:'] + ['  ' + failure for failure in failures]))
+        sys.exit(1)
+    print('query counts ok')
+
+
+def check_streaming(args):
+    scratch = args.scratch_database
+    if not scratch:
+        scratch = 'sqlite:///' + os.path.join(tempfile.mkdtemp(prefix='fyyur-memory-'), 'fyyur.db')
+    fyyur = load_app(scratch)
+    fyyur.app.debug = False
+    fyyur.app.config.update(SERVER_TIMING=False)
+
+    failures = check_memory(fyyur, fixtures=args.fixtures, iterations=args.iterations)
+    if failures:
+        print('\n'.join(['', 'memory check failed:'] + ['  ' + failure for failure in failures]))
+        sys.exit(1)
+    print('streamed pages ok')
+
+
+def load_test(args):
+    # the pool is sized when the app is imported
+    os.environ.update(DB_POOL_SIZE=str(args.pool_size), DB_MAX_OVERFLOW=str(args.max_overflow),
+                      DB_POOL_TIMEOUT=str(args.pool_timeout), ASYNC_MODE='1' if args.use_async else '0')
+    fyyur = load_app(args.database_url)
+    fyyur.app.debug = False
+
+    result = run_load(fyyur, args.concurrency, args.duration)
+    print(json.dumps(result, indent=2, sort_keys=True))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+
+    failed = [status for status in result['status'] if not status.startswith('2')]
+    if result['peak_connections'] > result['connection_cap'] or failed:
+        print('load test failed: %d connections used (cap %d), statuses %s' % (
+            result['peak_connections'], result['connection_cap'], ', '.join(failed) or '-'))
+        sys.exit(1)
+
+
+def async_compare(args):
+    results = compare_modes(args.database_url, args.concurrency, args.duration, args.pool_size,
+                            args.max_overflow, args.pool_timeout)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+
+def cold_start_test(args):
+    result = cold_start(args.database_url, runs=args.runs)
+    print('%-20s %12s %12s' % ('first request', 'source', 'precompiled'))
+    for path in result['source']['requests_ms']:
+        print('%-20s %9.2f ms %9.2f ms' % (
+            path, result['source']['requests_ms'][path], result['precompiled']['requests_ms'][path]))
+    print('%-20s %9.2f ms %9.2f ms' % ('total', result['source']['total_ms'], result['precompiled']['total_ms']))
+    print('%-20s %9.2f ms %9.2f ms' % ('import', result['source']['import_ms'], result['precompiled']['import_ms']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m bench', description='Fyyur benchmarks.')
+    parser.add_argument('--database-url', default=os.environ.get('DATABASE_URL'),
+                        help='database to use (default: $DATABASE_URL or config.py)')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    command = commands.add_parser('generate', help='fill the database with synthetic data')
+    command.add_argument('--scale', choices=sorted(SCALES), default='small')
+    command.add_argument('--venues', type=int, help='override the number of venues of the scale')
+    command.add_argument('--artists', type=int, help='override the number of artists of the scale')
+    command.add_argument('--shows', type=int, help='override the number of shows of the scale')
+    command.add_argument('--seed', type=int, default=0)
+    command.add_argument('--anchor', help='YYYY-MM-DD the show times are spread around (default: now)')
+    command.add_argument('--batch-size', type=int, default=10000)
+    command.add_argument('--reset', action='store_true', help='delete existing rows first')
+    command.set_defaults(func=generate)
+
+    command = commands.add_parser('run', help='benchmark every route')
+    command.add_argument('--iterations', type=int, default=20)
+    command.add_argument('--warmup', type=int, default=2)
+    command.add_argument('--seed', type=int, default=0)
+    command.add_argument('--warm-cache', action='store_true',
+                         help='keep the data cache between requests')
+    command.add_argument('--only', nargs='+', metavar='CASE', help='run only these cases')
+    command.add_argument('--output', help='results file (default: bench/results/<commit>-<db>.json)')
+    command.set_defaults(func=run)
+
+    command = commands.add_parser('check-queries', help='check the query count of every route')
+    command.add_argument('--scratch-database',
+                         help='database the fixtures are loaded into; all its rows are replaced '
+                              '(default: a temporary SQLite file)')
+    command.add_argument('--fixtures', nargs='+', choices=sorted(SCALES), default=list(FIXTURES))
+    command.add_argument('--iterations', type=int, default=3)
+    command.set_defaults(func=check)
+
+    command = commands.add_parser('check-memory',
+                                  help='check that the streamed list pages use the same memory '
+                                       'whatever the amount of data')
+    command.add_argument('--scratch-database',
+                         help='database the fixtures are loaded into; all its rows are replaced '
+                              '(default: a temporary SQLite file)')
+    command.add_argument('--fixtures', nargs='+', choices=sorted(SCALES), default=list(MEMORY_FIXTURES))
+    command.add_argument('--iterations', type=int, default=3)
+    command.set_defaults(func=check_streaming)
+
+    command = commands.add_parser('load', help='measure throughput under a connection cap')
+    command.add_argument('--concurrency', type=int, default=32, help='client threads')
+    command.add_argument('--duration', type=float, default=10, help='seconds')
+    command.add_argument('--pool-size', type=int, default=4)
+    command.add_argument('--max-overflow', type=int, default=0)
+    command.add_argument('--pool-timeout', type=float, default=10)
+    command.add_argument('--async', dest='use_async', action='store_true',
+                         help='serve the read views asynchronously (ASYNC_MODE)')
+    command.add_argument('--output', help='also write the results to this file')
+    command.set_defaults(func=load_test)
+
+    command = commands.add_parser('async-compare',
+                                  help='compare the throughput of the sync and async read views')
+    command.add_argument('--concurrency', type=int, default=128, help='client threads')
+    command.add_argument('--duration', type=float, default=10, help='seconds per mode')
+    command.add_argument('--pool-size', type=int, default=4)
+    command.add_argument('--max-overflow', type=int, default=0)
+    command.add_argument('--pool-timeout', type=float, default=10)
+    command.add_argument('--output', help='also write the results of both modes to this file')
+    command.set_defaults(func=async_compare)
+
+    command = commands.add_parser('cold-start',
+                                  help='time the first requests of new processes, with and '
+                                       'without precompiled templates')
+    command.add_argument('--runs', type=int, default=5, help='processes per mode')
+    command.add_argument('--output', help='also write the results to this file')
+    command.set_defaults(func=cold_start_test)
+
+    command = commands.add_parser('compare', help='compare two result files')
+    command.add_argument('baseline')
+    command.add_argument('current')
+    command.add_argument('--threshold', type=float, default=0.2,
+                         help='p50 slowdown counted as a regression (default: 0.2)')
+    command.set_defaults(func=compare)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#----------------------------------------------------------------------------#
+# Cold-start timing.
+#----------------------------------------------------------------------------#
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+# pages rendering different templates, requested once each by a new process
+PATHS = ('/', '/venues', '/artists', '/shows', '/venues/create', '/artists/create', '/shows/create')
+
+# runs in a fresh interpreter: import the app, then time the first request
+# to every path
+CHILD = """
+import json, sys, time
+started = time.perf_counter()
+from bench import load_app
+fyyur = load_app(sys.argv[1])
+imported = time.perf_counter()
+client = fyyur.app.test_client()
+requests = {}
+for path in sys.argv[2:]:
+    request_started = time.perf_counter()
+    client.get(path).get_data()
+    requests[path] = (time.perf_counter() - request_started) * 1000
+print(json.dumps({'import_ms': (imported - started) * 1000, 'requests_ms': requests}))
+"""
+
+
+def first_requests(database_url, cache_dir, paths):
+    env = dict(os.environ, TEMPLATE_CACHE_DIR=cache_dir)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.check_output([sys.executable, '-c', CHILD, database_url or ''] + list(paths),
+                                     env=env, cwd=root)
+    return json.loads(output.decode().strip().splitlines()[-1])
+
+
+def cold_start(database_url, runs=5, paths=PATHS):
+    """First-request latency of new processes, with templates compiled from
+    source (an empty bytecode cache) and loaded from a precompiled cache.
+    Returns the medians of ``runs`` processes per mode."""
+    cache_dir = tempfile.mkdtemp(prefix='fyyur-templates-')
+    try:
+        samples = {'source': [], 'precompiled': []}
+        for _ in range(runs):
+            shutil.rmtree(cache_dir)
+            os.makedirs(cache_dir)
+            # the first process compiles and fills the cache, the second reads it
+            samples['source'].append(first_requests(database_url, cache_dir, paths))
+            samples['precompiled'].append(first_requests(database_url, cache_dir, paths))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    result = {}
+    for mode, runs_of_mode in samples.items():
+        result[mode] = {
+            'import_ms': round(statistics.median(run['import_ms'] for run in runs_of_mode), 2),
+            'requests_ms': dict(
+                (path, round(statistics.median(run['requests_ms'][path] for run in runs_of_mode), 2))
+                for path in paths),
+        }
+        result[mode]['total_ms'] = round(sum(result[mode]['requests_ms'].values()), 2)
+    return result
@@ -0,0 +1,218 @@
+#----------------------------------------------------------------------------#
+# Synthetic data.
+#----------------------------------------------------------------------------#
+import random
+import time
+from datetime import datetime, timedelta
+
+import geo
+from importer import copy_rows
+
+# (venues, artists, shows)
+SCALES = {
+    'tiny': (50, 200, 2000),
+    'small': (500, 2000, 50000),
+    'medium': (2000, 20000, 500000),
+    'large': (10000, 100000, 5000000),
+}
+
+CITIES = (
+    ('San Francisco', 'CA'), ('Oakland', 'CA'), ('Los Angeles', 'CA'),
+    ('New York', 'NY'), ('Brooklyn', 'NY'), ('Chicago', 'IL'), ('Austin', 'TX'),
+    ('Houston', 'TX'), ('Seattle', 'WA'), ('Portland', 'OR'), ('Denver', 'CO'),
+    ('Nashville', 'TN'), ('New Orleans', 'LA'), ('Atlanta', 'GA'), ('Boston', 'MA'),
+    ('Philadelphia', 'PA'), ('Minneapolis', 'MN'), ('Detroit', 'MI'),
+    ('Miami', 'FL'), ('Phoenix', 'AZ'),
+)
+
+WORDS = (
+    'Blue', 'Red', 'Golden', 'Silver', 'Velvet', 'Electric', 'Midnight', 'Neon',
+    'Wild', 'Lonely', 'Broken', 'Crystal', 'Iron', 'Paper', 'Rolling', 'Secret',
+    'Moon', 'River', 'Owl', 'Fox', 'Garden', 'Harbor', 'Lantern', 'Echo',
+    'Canyon', 'Signal', 'Ghost', 'Tiger', 'Orchid', 'Thunder', 'Comet', 'Pine',
+)
+
+VENUE_KINDS = ('Hall', 'Room', 'Lounge', 'Theatre', 'Club', 'Bar', 'Ballroom', 'Stage')
+
+# shows are spread from two years before to one year after the anchor
+SHOW_WINDOW = (timedelta(days=-730), timedelta(days=365))
+# show lengths in minutes; shows start on the hour
+SHOW_LENGTHS = (60, 90, 120, 180)
+
+
+def genre_choices():
+    from forms import GENRE_CHOICES
+    return [value for value, _ in GENRE_CHOICES]
+
+
+class Generator(object):
+    """Deterministic rows for Venue, Artist and Show.
+
+    The same seed and anchor always produce the same rows, so results from
+    different commits are measured against identical data. Show ids refer
+    to venue and artist ids 1..n, which the generator assigns explicitly.
+    """
+
+    def __init__(self, venues, artists, shows, seed=0, anchor=None):
+        self.venues = venues
+        self.artists = artists
+        self.shows = shows
+        self.seed = seed
+        self.anchor = anchor or datetime.utcnow().replace(minute=0, second=0, microsecond=0)
+        self.genres = genre_choices()
+
+    def _rng(self, table):
+        # one stream per table, so changing one scale doesn't reshuffle the others
+        return random.Random('%s:%s' % (self.seed, table))
+
+    def _name(self, rng):
+        return ' '.join(rng.sample(WORDS, 2))
+
+    def _phone(self, rng):
+        return '%03d-555-%04d' % (rng.choice((212, 312, 415, 512, 617, 713)), rng.randint(0, 9999))
+
+    def venue_rows(self):
+        rng = self._rng('venue')
+        # a separate stream, so locations don't reshuffle the other columns
+        spread = self._rng('venue-location')
+        for venue_id in range(1, self.venues + 1):
+            city, state = rng.choice(CITIES)
+            # scattered over ~15 km around the city centre
+            latitude, longitude = geo.gazetteer.lookup(city, state)
+            latitude += spread.uniform(-0.07, 0.07)
+            longitude += spread.uniform(-0.09, 0.09)
+            name = '%s %s' % (self._name(rng), rng.choice(VENUE_KINDS))
+            seeking = rng.random() < 0.5
+            yield {
+                'id': venue_id,
+                'name': name,
+                'city': city,
+                'state': state,
+                'address': '%d %s Street' % (rng.randint(1, 9999), rng.choice(WORDS)),
+                'phone': self._phone(rng),
+                'image_link': 'https://images.example.com/venues/%d.jpg' % venue_id,
+                'facebook_link': 'https://www.facebook.com/venue%d' % venue_id,
+                'genres': rng.sample(self.genres, rng.randint(1, 4)),
+                'website': 'https://venue%d.example.com' % venue_id,
+                'seeking_talent': seeking,
+                'seeking_description': 'We are looking for %s acts.' % name if seeking else None,
+                'latitude': latitude,
+                'longitude': longitude,
+                'geohash': geo.encode(latitude, longitude),
+            }
+
+    def artist_rows(self):
+        rng = self._rng('artist')
+        for artist_id in range(1, self.artists + 1):
+            city, state = rng.choice(CITIES)
+            seeking = rng.random() < 0.3
+            yield {
+                'id': artist_id,
+                'name': 'The %s' % self._name(rng),
+                'city': city,
+                'state': state,
+                'phone': self._phone(rng),
+                'genres': rng.sample(self.genres, rng.randint(1, 3)),
+                'image_link': 'https://images.example.com/artists/%d.jpg' % artist_id,
+                'facebook_link': 'https://www.facebook.com/artist%d' % artist_id,
+                'website': 'https://artist%d.example.com' % artist_id,
+                'seeking_venue': seeking,
+                'seeking_description': 'Looking for venues.' if seeking else None,
+            }
+
+    def show_rows(self):
+        rng = self._rng('show')
+        earliest, latest = SHOW_WINDOW
+        hours = int((latest - earliest).total_seconds() // 3600)
+        start = self.anchor + earliest
+        # one bit per (venue, hour): bookings of a venue never overlap
+        booked = bytearray((self.venues * (hours + 4)) // 8 + 1)
+        for show_id in range(1, self.shows + 1):
+            # venues and artists are picked with a skew, so some detail pages
+            # carry many more shows than others, as they would in real data
+            artist_id = _skewed(rng, self.artists)
+            length = rng.choice(SHOW_LENGTHS)
+            while True:
+                venue_id = _skewed(rng, self.venues)
+                # a few tries at this venue before moving on, as busy venues fill up
+                for _ in range(8):
+                    hour = rng.randint(0, hours)
+                    bits = [(venue_id - 1) * (hours + 4) + hour + offset
+                            for offset in range(-(-length // 60))]
+                    if not any(booked[bit // 8] & (1 << bit % 8) for bit in bits):
+                        break
+                else:
+                    continue
+                break
+            for bit in bits:
+                booked[bit // 8] |= 1 << bit % 8
+            yield {
+                'id': show_id,
+                'venue_id': venue_id,
+                'artist_id': artist_id,
+                'start_time': start + timedelta(hours=hour),
+                'end_time': start + timedelta(hours=hour, minutes=length),
+            }
+
+
+def _skewed(rng, n):
+    # ids near 1 are picked more often: id k with probability ~ 1 / sqrt(k)
+    return min(1 + int(n * rng.random() ** 2), n)
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(connection, table, rows):
+    if connection.dialect.name == 'postgresql' and copy_rows(connection, table, rows):
+        return
+    connection.execute(table.insert(), rows)
+
+
+def load(fyyur, generator, batch_size=10000, reset=False, log=print):
+    """Fill Venue, Artist and Show from ``generator`` and rebuild the show
+    counters. The tables must be empty unless ``reset`` is set."""
+    db = fyyur.db
+    tables = [(fyyur.Venue.__table__, generator.venue_rows),
+              (fyyur.Artist.__table__, generator.artist_rows),
+              (fyyur.Show.__table__, generator.show_rows)]
+
+    with fyyur.app.app_context():
+        db.create_all()
+        with db.engine.begin() as connection:
+            if reset:
+                for table in reversed(tables):
+                    connection.execute(table[0].delete())
+            for table, _ in tables:
+                if connection.execute(db.select(db.func.count()).select_from(table)).scalar():
+                    raise RuntimeError('"%s" is not empty (use --reset to replace its rows)' % table.name)
+
+        for table, rows in tables:
+            started = time.monotonic()
+            count = 0
+            for batch in _batches(rows(), batch_size):
+                with db.engine.begin() as connection:
+                    _insert(connection, table, batch)
+                count += len(batch)
+            elapsed = time.monotonic() - started
+            log('%s: %d rows in %.1fs (%.0f rows/s)' % (
+                table.name, count, elapsed, count / elapsed if elapsed else 0))
+
+            # explicit ids bypass the sequences, so move them past the new rows
+            if db.engine.dialect.name == 'postgresql':
+                with db.engine.begin() as connection:
+                    connection.execute(db.text(
+                        "SELECT setval(pg_get_serial_sequence('\"%s\"', 'id'), "
+                        "coalesce(max(id), 0) + 1, false) FROM \"%s\"" % (table.name, table.name)))
+
+        started = time.monotonic()
+        fyyur.rebuild_show_counters()
+        log('counters rebuilt in %.1fs' % (time.monotonic() - started))
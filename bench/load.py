@@ -0,0 +1,96 @@
+#----------------------------------------------------------------------------#
+# Load test under a connection cap.
+#----------------------------------------------------------------------------#
+import random
+import threading
+import time
+
+from sqlalchemy import event
+
+from bench.routes import Context, _percentile
+
+# read pages, detail pages picked at random
+PATHS = ('/venues', '/artists', '/shows', '/venues/{venue_id}', '/artists/{artist_id}')
+
+
+class PoolWatcher(object):
+    """Tracks how many connections are checked out at once."""
+
+    def __init__(self, engine):
+        self.lock = threading.Lock()
+        self.current = 0
+        self.peak = 0
+        event.listen(engine, 'checkout', self._checkout)
+        event.listen(engine, 'checkin', self._checkin)
+
+    def _checkout(self, dbapi_connection, connection_record, connection_proxy):
+        with self.lock:
+            self.current += 1
+            self.peak = max(self.peak, self.current)
+
+    def _checkin(self, dbapi_connection, connection_record):
+        with self.lock:
+            self.current -= 1
+
+
+def run_load(fyyur, concurrency, duration, paths=PATHS, seed=0):
+    """Hammer ``paths`` from ``concurrency`` threads for ``duration`` seconds.
+
+    The data cache is switched off, so every request needs a connection and
+    the threads compete for the pool. Returns throughput, latency, status
+    counts and the most connections that were ever checked out at once.
+    """
+    app = fyyur.app
+    fyyur.cache.enabled = False
+    ctx = Context(fyyur, seed=seed)
+    with app.app_context():
+        # the async views (ASYNC_MODE) query through the asyncio engine's pool
+        engine = fyyur.async_db.engine.sync_engine if fyyur.async_db.enabled else fyyur.db.engine
+        cap = engine.pool.size() + engine.pool._max_overflow
+    watcher = PoolWatcher(engine)
+
+    latencies, statuses = [], {}
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker(number):
+        rng = random.Random('%s:%s' % (seed, number))
+        client = app.test_client()
+        own_latencies, own_statuses = [], {}
+        while time.monotonic() < deadline:
+            path = rng.choice(paths).format(venue_id=rng.choice(ctx.venue_ids),
+                                            artist_id=rng.choice(ctx.artist_ids))
+            started = time.perf_counter()
+            response = client.get(path)
+            response.get_data()
+            # as a WSGI server would; a streamed page holds its connection until then
+            response.close()
+            own_latencies.append((time.perf_counter() - started) * 1000)
+            own_statuses[str(response.status_code)] = own_statuses.get(str(response.status_code), 0) + 1
+        with lock:
+            latencies.extend(own_latencies)
+            for status, count in own_statuses.items():
+                statuses[status] = statuses.get(status, 0) + count
+
+    threads = [threading.Thread(target=worker, args=(number,)) for number in range(concurrency)]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.monotonic() - started
+
+    return {
+        'mode': 'async' if fyyur.async_db.enabled else 'sync',
+        'concurrency': concurrency,
+        'connection_cap': cap,
+        'peak_connections': watcher.peak,
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / elapsed, 1),
+        'latency_ms': {
+            'p50': round(_percentile(latencies, 0.5), 3),
+            'p99': round(_percentile(latencies, 0.99), 3),
+            'max': round(max(latencies), 3),
+        },
+        'status': statuses,
+    }
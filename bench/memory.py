@@ -0,0 +1,52 @@
+#----------------------------------------------------------------------------#
+# Peak-memory guard for the streamed list pages.
+#----------------------------------------------------------------------------#
+from bench.data import SCALES, Generator, load
+from bench.routes import Case, Context, _get, run_case
+
+# the largest pages the streamed routes serve
+CASES = [
+    Case('venues', 'venues', 'GET', _get('/venues')),
+    Case('shows_max_page', 'shows', 'GET', _get('/shows?per_page=500')),
+]
+
+# ten times the rows between the two; a streamed page must not notice
+FIXTURES = ('tiny', 'small')
+
+# allowed growth of the peak from the smaller fixture to the larger one
+TOLERANCE = 1.25
+SLACK_KIB = 64
+
+# a streamed page holds one batch of rows at a time; smaller than the
+# smallest fixture's tables, so every fixture fills whole batches
+BATCH_SIZE = 25
+
+
+def measure(fyyur, scale, stream, seed=0, iterations=3):
+    """Load the ``scale`` fixture and return the peak memory of each case, KiB."""
+    load(fyyur, Generator(*SCALES[scale], seed=seed), reset=True, log=lambda message: None)
+    fyyur.app.config.update(STREAM_LIST_PAGES=stream, STREAM_BATCH_SIZE=BATCH_SIZE)
+    ctx = Context(fyyur, seed=seed)
+    return dict((case.name, run_case(ctx, case, iterations, warmup=1)['peak_memory_kib'])
+                for case in CASES)
+
+
+def check_memory(fyyur, fixtures=FIXTURES, seed=0, iterations=3, log=print):
+    """Measure the streamed pages on each fixture, plus the buffered pages
+    for reference, and return a list of failures: streamed pages whose
+    peak memory grows with the data."""
+    streamed = [measure(fyyur, scale, True, seed, iterations) for scale in fixtures]
+    buffered = [measure(fyyur, scale, False, seed, iterations) for scale in fixtures]
+
+    log('%-16s %s' % ('peak KiB', '  '.join('%18s' % scale for scale in fixtures)))
+    log('%-16s %s' % ('', '  '.join('%8s %9s' % ('streamed', 'buffered') for _ in fixtures)))
+    failures = []
+    for case in CASES:
+        log('%-16s %s' % (case.name, '  '.join(
+            '%8.1f %9.1f' % (streamed[index][case.name], buffered[index][case.name])
+            for index in range(len(fixtures)))))
+        smallest, largest = streamed[0][case.name], streamed[-1][case.name]
+        if largest > smallest * TOLERANCE + SLACK_KIB:
+            failures.append('%s: peak memory grows with the data (%.1f -> %.1f KiB)' % (
+                case.name, smallest, largest))
+    return failures
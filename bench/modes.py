@@ -0,0 +1,53 @@
+#----------------------------------------------------------------------------#
+# Sync vs. async serving throughput.
+#----------------------------------------------------------------------------#
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+MODES = ('sync', 'async')
+
+
+def load_in_mode(database_url, mode, options):
+    """Run ``python -m bench load`` in a new process (ASYNC_MODE is read when
+    the app is imported) and return its result."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    handle, output = tempfile.mkstemp(prefix='fyyur-load-', suffix='.json')
+    os.close(handle)
+    command = [sys.executable, '-m', 'bench']
+    if database_url:
+        command += ['--database-url', database_url]
+    command += ['load', '--output', output] + options
+    if mode == 'async':
+        command.append('--async')
+    try:
+        # a failed run (errors, pool exhaustion) still writes its result
+        subprocess.run(command, cwd=root, stdout=subprocess.DEVNULL)
+        with open(output) as f:
+            return json.load(f)
+    finally:
+        os.remove(output)
+
+
+def compare_modes(database_url, concurrency=128, duration=10, pool_size=4, max_overflow=0,
+                  pool_timeout=10, log=print):
+    """Load both serving modes with the same client threads and connection
+    cap; returns the results of each mode."""
+    options = ['--concurrency', str(concurrency), '--duration', str(duration),
+               '--pool-size', str(pool_size), '--max-overflow', str(max_overflow),
+               '--pool-timeout', str(pool_timeout)]
+    results = dict((mode, load_in_mode(database_url, mode, options)) for mode in MODES)
+
+    log('%-6s %10s %10s %10s %10s %6s  %s' % ('mode', 'req/s', 'p50 ms', 'p99 ms', 'max ms',
+                                             'conns', 'status'))
+    for mode in MODES:
+        result = results[mode]
+        log('%-6s %10.1f %10.1f %10.1f %10.1f %6s  %s' % (
+            mode, result['throughput_rps'], result['latency_ms']['p50'], result['latency_ms']['p99'],
+            result['latency_ms']['max'], '%d/%d' % (result['peak_connections'], result['connection_cap']),
+            ' '.join('%s:%d' % item for item in sorted(result['status'].items()))))
+    log('async/sync throughput: %.2f' % (
+        results['async']['throughput_rps'] / max(results['sync']['throughput_rps'], 0.1)))
+    return results
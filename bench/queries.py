@@ -0,0 +1,61 @@
+#----------------------------------------------------------------------------#
+# Query-count regression guard.
+#----------------------------------------------------------------------------#
+from bench.data import SCALES, Generator, load
+from bench.routes import CASES, Context, run_case, uncovered_endpoints
+
+# the data sizes every route is measured at; a route whose query count
+# differs between them issues queries per row (an N+1 pattern)
+FIXTURES = ('tiny', 'small')
+
+
+def declared_budget(app, endpoint):
+    return getattr(app.view_functions[endpoint], 'query_budget', None)
+
+
+def measure(fyyur, scale, seed=0, iterations=3, log=print):
+    """Load the ``scale`` fixture and return the most queries each case issued."""
+    load(fyyur, Generator(*SCALES[scale], seed=seed), reset=True, log=lambda message: None)
+    ctx = Context(fyyur, seed=seed)
+    ctx.mark()
+    counts, statuses = {}, {}
+    try:
+        for case in CASES:
+            result = run_case(ctx, case, iterations, warmup=1)
+            counts[case.name] = result['queries']['max']
+            statuses[case.name] = sorted(result['status'])
+    finally:
+        ctx.cleanup()
+    log('%s: %s' % (scale, ', '.join('%s=%d' % item for item in sorted(ctx.counts.items()))))
+    return counts, statuses
+
+
+def check_queries(fyyur, fixtures=FIXTURES, seed=0, iterations=3, log=print):
+    """Run every route against each fixture and return a list of failures.
+
+    A route fails when it has no ``query_budget``, exceeds it, errors, or
+    issues more queries on the larger fixture than on the smaller one.
+    """
+    app = fyyur.app
+    failures = ['%s: no benchmark case' % endpoint for endpoint in uncovered_endpoints(app)]
+    measured = [(scale, measure(fyyur, scale, seed, iterations, log)) for scale in fixtures]
+
+    log('%-20s %8s %s' % ('route', 'budget', '  '.join('%8s' % scale for scale in fixtures)))
+    for case in CASES:
+        budget = declared_budget(app, case.endpoint)
+        counts = [result[0][case.name] for _, result in measured]
+        log('%-20s %8s %s' % (case.name, '-' if budget is None else budget,
+                              '  '.join('%8d' % count for count in counts)))
+
+        if budget is None:
+            failures.append('%s: %s declares no query budget' % (case.name, case.endpoint))
+        elif max(counts) > budget:
+            failures.append('%s: %d queries (budget %d)' % (case.name, max(counts), budget))
+        if counts[-1] > counts[0]:
+            failures.append('%s: queries grow with the data (%s)' % (
+                case.name, ' -> '.join(str(count) for count in counts)))
+        for scale, (_, statuses) in measured:
+            errors = [status for status in statuses[case.name] if status.startswith('5')]
+            if errors:
+                failures.append('%s: HTTP %s on the %s fixture' % (case.name, '/'.join(errors), scale))
+    return failures
@@ -0,0 +1,314 @@
+#----------------------------------------------------------------------------#
+# Route benchmarks.
+#----------------------------------------------------------------------------#
+import gc
+import random
+import statistics
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from querycount import count_queries
+
+# start of the slots the write benchmarks book shows in
+BOOKING_EPOCH = datetime(2100, 1, 1)
+
+
+class Case(object):
+    """One benchmarked request shape.
+
+    ``requests(ctx, n)`` returns n ``(path, form data)`` pairs, or
+    ``(path, form data, headers)`` triples; it may write untimed setup rows
+    first (e.g. the shows a DELETE benchmark removes).
+    """
+
+    def __init__(self, name, endpoint, method, requests):
+        self.name = name
+        self.endpoint = endpoint
+        self.method = method
+        self.requests = requests
+
+
+class Context(object):
+    """The app under test plus a seeded RNG and the id ranges to pick from."""
+
+    def __init__(self, fyyur, seed=0):
+        self.fyyur = fyyur
+        self.rng = random.Random(seed)
+        db = fyyur.db
+        with fyyur.app.app_context():
+            self.venue_ids = db.session.query(fyyur.Venue.id).order_by(fyyur.Venue.id).all()
+            self.artist_ids = db.session.query(fyyur.Artist.id).order_by(fyyur.Artist.id).all()
+            self.counts = {
+                'venues': len(self.venue_ids),
+                'artists': len(self.artist_ids),
+                'shows': db.session.query(db.func.count(fyyur.Show.id)).scalar(),
+            }
+        self.venue_ids = [row.id for row in self.venue_ids]
+        self.artist_ids = [row.id for row in self.artist_ids]
+        self.serial = 0
+        self.high_water = {}
+
+    def mark(self):
+        """Remember the highest ids, so cleanup() can drop the rows the
+        write benchmarks add and later runs see the same data."""
+        fyyur = self.fyyur
+        with fyyur.app.app_context():
+            for model in (fyyur.Show, fyyur.Venue, fyyur.Artist):
+                self.high_water[model] = fyyur.db.session.query(
+                    fyyur.db.func.coalesce(fyyur.db.func.max(model.id), 0)).scalar()
+
+    def cleanup(self):
+        fyyur = self.fyyur
+        db = fyyur.db
+        with fyyur.app.app_context():
+            Show = fyyur.Show
+            for show in Show.query.filter(Show.id > self.high_water[Show]):
+                fyyur.count_show(show, -1)
+                db.session.delete(show)
+            for model in (fyyur.Venue, fyyur.Artist):
+                db.session.execute(db.delete(model).where(model.id > self.high_water[model]))
+            db.session.commit()
+        fyyur.cache.clear()
+
+    def venue_id(self):
+        return self.rng.choice(self.venue_ids)
+
+    def artist_id(self):
+        return self.rng.choice(self.artist_ids)
+
+    def unique(self, prefix):
+        self.serial += 1
+        return '%s %d' % (prefix, self.serial)
+
+
+def _get(path):
+    return lambda ctx, n: [(path(ctx) if callable(path) else path, None) for _ in range(n)]
+
+
+def _post(path, data):
+    return lambda ctx, n: [(path(ctx) if callable(path) else path, data(ctx)) for _ in range(n)]
+
+
+def _revalidate(path):
+    # conditional GETs carrying the page's current ETag, fetched untimed
+    def requests(ctx, n):
+        client = ctx.fyyur.app.test_client()
+        result = []
+        for _ in range(n):
+            url = path(ctx)
+            result.append((url, None, {'If-None-Match': client.get(url).headers['ETag']}))
+        return result
+    return requests
+
+
+def _search_term(ctx):
+    return {'search_term': ctx.rng.choice(('the', 'blue', 'hall', 'San', 'Jazz', 'zzz'))}
+
+
+def _venue_form(ctx):
+    return {
+        'name': ctx.unique('Bench Venue'),
+        'city': 'San Francisco',
+        'state': 'CA',
+        'address': '1015 Folsom Street',
+        'phone': '415-555-0100',
+        'genres': ['Jazz', 'Folk'],
+        'facebook_link': 'https://www.facebook.com/bench',
+        'website': 'https://bench.example.com',
+        'image_link': 'https://images.example.com/bench.jpg',
+        'seeking_talent': 'Yes',
+        'seeking_description': 'Benchmarking.',
+    }
+
+
+def _artist_form(ctx):
+    data = _venue_form(ctx)
+    del data['address'], data['seeking_talent']
+    data.update(name=ctx.unique('Bench Artist'), seeking_venue='No')
+    return data
+
+
+def _free_slot(ctx):
+    # far beyond the generated shows, so the booking is accepted
+    return BOOKING_EPOCH + timedelta(hours=ctx.rng.randrange(10 ** 6))
+
+
+def _show_form(ctx):
+    return {
+        'venue_id': str(ctx.venue_id()),
+        'artist_id': str(ctx.artist_id()),
+        'start_time': _free_slot(ctx).strftime('%Y-%m-%d %H:%M:%S'),
+        'duration': '90',
+    }
+
+
+def _edit_form(model, fields, seeking):
+    # posts an entity's own values back, so editing leaves the data unchanged
+    def requests(ctx, n):
+        fyyur = ctx.fyyur
+        pick = ctx.venue_id if model == 'Venue' else ctx.artist_id
+        entity = getattr(fyyur, model)
+        result = []
+        with fyyur.app.app_context():
+            for _ in range(n):
+                row = fyyur.db.session.get(entity, pick())
+                data = dict((field, getattr(row, field) or '') for field in fields)
+                data[seeking] = 'Yes' if getattr(row, seeking) else 'No'
+                result.append(('/%ss/%d/edit' % (model.lower(), row.id), data))
+        return result
+    return requests
+
+
+COMMON_FIELDS = ('name', 'city', 'state', 'phone', 'genres', 'facebook_link', 'website',
+                 'image_link', 'seeking_description')
+
+
+def _scratch_rows(ctx, n, make):
+    # rows written outside the timed section, for the DELETE benchmarks
+    fyyur = ctx.fyyur
+    with fyyur.app.app_context():
+        rows = [make(ctx) for _ in range(n)]
+        fyyur.db.session.add_all(rows)
+        fyyur.db.session.flush()
+        for row in rows:
+            if isinstance(row, fyyur.Show):
+                fyyur.count_show(row, 1)
+        fyyur.db.session.commit()
+        return [row.id for row in rows]
+
+
+def _delete_venues(ctx, n):
+    Venue = ctx.fyyur.Venue
+    ids = _scratch_rows(ctx, n, lambda ctx: Venue(name=ctx.unique('Bench Venue'), genres=['Jazz']))
+    return [('/venues/%d' % venue_id, None) for venue_id in ids]
+
+
+def _delete_shows(ctx, n):
+    Show = ctx.fyyur.Show
+    def make(ctx):
+        start_time = _free_slot(ctx)
+        return Show(venue_id=ctx.venue_id(), artist_id=ctx.artist_id(),
+                    start_time=start_time, end_time=start_time + timedelta(hours=1))
+    ids = _scratch_rows(ctx, n, make)
+    return [('/shows/%d' % show_id, None) for show_id in ids]
+
+
+CASES = [
+    Case('home', 'index', 'GET', _get('/')),
+    Case('venues', 'venues', 'GET', _get('/venues')),
+    Case('venues_genre', 'venues', 'GET', _get('/venues?genre=Jazz')),
+    Case('venues_search', 'search_venues', 'POST', _post('/venues/search', _search_term)),
+    Case('venues_nearby', 'nearby_venues_page', 'GET', _get('/venues/nearby?lat=37.7749&lng=-122.4194&radius=30')),
+    Case('venue_detail', 'show_venue', 'GET', _get(lambda ctx: '/venues/%d' % ctx.venue_id())),
+    Case('venue_detail_hot', 'show_venue', 'GET', _get(lambda ctx: '/venues/%d' % ctx.venue_ids[0])),
+    Case('venue_detail_304', 'show_venue', 'GET', _revalidate(lambda ctx: '/venues/%d' % ctx.venue_id())),
+    Case('venue_create_form', 'create_venue_form', 'GET', _get('/venues/create')),
+    Case('venue_create', 'create_venue_submission', 'POST', _post('/venues/create', _venue_form)),
+    Case('venue_edit_form', 'edit_venue', 'GET', _get(lambda ctx: '/venues/%d/edit' % ctx.venue_id())),
+    Case('venue_edit', 'edit_venue_submission', 'POST', _edit_form(
+        'Venue', COMMON_FIELDS + ('address',), 'seeking_talent')),
+    Case('venue_delete', 'delete_venue', 'DELETE', _delete_venues),
+    Case('artists', 'artists', 'GET', _get('/artists')),
+    Case('artists_genre', 'artists', 'GET', _get('/artists?genre=Rock+n+Roll')),
+    Case('artists_search', 'search_artists', 'POST', _post('/artists/search', _search_term)),
+    Case('artist_detail', 'show_artist', 'GET', _get(lambda ctx: '/artists/%d' % ctx.artist_id())),
+    Case('artist_detail_hot', 'show_artist', 'GET', _get(lambda ctx: '/artists/%d' % ctx.artist_ids[0])),
+    Case('artist_detail_304', 'show_artist', 'GET', _revalidate(lambda ctx: '/artists/%d' % ctx.artist_id())),
+    Case('artist_create_form', 'create_artist_form', 'GET', _get('/artists/create')),
+    Case('artist_create', 'create_artist_submission', 'POST', _post('/artists/create', _artist_form)),
+    Case('artist_edit_form', 'edit_artist', 'GET', _get(lambda ctx: '/artists/%d/edit' % ctx.artist_id())),
+    Case('artist_edit', 'edit_artist_submission', 'POST', _edit_form(
+        'Artist', COMMON_FIELDS, 'seeking_venue')),
+    Case('shows', 'shows', 'GET', _get('/shows')),
+    Case('shows_upcoming', 'shows', 'GET', _get('/shows?when=upcoming')),
+    Case('shows_past', 'shows', 'GET', _get('/shows?when=past')),
+    Case('show_create_form', 'create_shows', 'GET', _get('/shows/create')),
+    Case('show_create', 'create_show_submission', 'POST', _post('/shows/create', _show_form)),
+    Case('show_delete', 'delete_show', 'DELETE', _delete_shows),
+    Case('api_venues', 'api_venues', 'GET', _get('/api/v1/venues')),
+    Case('api_venues_nearby', 'api_venues_nearby', 'GET', _get('/api/v1/venues/nearby?lat=40.7128&lng=-74.006')),
+    Case('api_venue_facets', 'api_venue_facets', 'GET', _get('/api/v1/venues/facets?state=CA')),
+    Case('api_artists', 'api_artists', 'GET', _get('/api/v1/artists?genre=Folk')),
+    Case('api_artist_facets', 'api_artist_facets', 'GET', _get('/api/v1/artists/facets?genre=Folk')),
+    Case('api_shows', 'api_shows', 'GET', _get('/api/v1/shows?when=upcoming')),
+    Case('flashes', 'flashes', 'GET', _get('/flashes')),
+    Case('cache_stats', 'cache_stats', 'GET', _get('/cache/stats')),
+    Case('request_stats', 'request_stats', 'GET', _get('/requests/stats')),
+    Case('metrics', 'metrics', 'GET', _get('/metrics')),
+]
+
+
+def uncovered_endpoints(app, cases=CASES):
+    """Endpoints of ``app`` that no benchmark case exercises."""
+    covered = set(case.endpoint for case in cases)
+    return sorted(rule.endpoint for rule in app.url_map.iter_rules()
+                  if rule.endpoint != 'static' and rule.endpoint not in covered)
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def _send(client, method, request):
+    path, data, headers = (tuple(request) + (None,))[:3]
+    response = client.open(path, method=method, data=data, headers=headers)
+    # streamed bodies are only produced while being read; read them chunk by
+    # chunk like a server would, rather than joining them in memory
+    for _ in response.iter_encoded():
+        pass
+    response.close()
+    return response.status_code
+
+
+def run_case(ctx, case, iterations, warmup=2, warm_cache=False):
+    """Time ``iterations`` requests of ``case`` and return their statistics.
+
+    Unless ``warm_cache`` is set the data cache is cleared before every
+    request, so the numbers include the queries behind each page. Peak
+    memory is taken from one extra, separately traced request, because
+    tracing slows down everything it watches.
+    """
+    fyyur = ctx.fyyur
+    client = fyyur.app.test_client()
+    requests = case.requests(ctx, warmup + iterations + 1)
+
+    latencies, queries, statuses = [], [], {}
+    for number, request in enumerate(requests[:-1]):
+        if not warm_cache:
+            fyyur.cache.clear()
+        with count_queries() as statements:
+            started = time.perf_counter()
+            status = _send(client, case.method, request)
+            elapsed = time.perf_counter() - started
+        if number < warmup:
+            continue
+        latencies.append(elapsed * 1000)
+        queries.append(len(statements))
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+
+    if not warm_cache:
+        fyyur.cache.clear()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        _send(client, case.method, requests[-1])
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'endpoint': case.endpoint,
+        'method': case.method,
+        'iterations': iterations,
+        'status': statuses,
+        'latency_ms': {
+            'mean': round(statistics.mean(latencies), 3),
+            'p50': round(_percentile(latencies, 0.5), 3),
+            'p95': round(_percentile(latencies, 0.95), 3),
+            'max': round(max(latencies), 3),
+        },
+        'queries': {'mean': round(statistics.mean(queries), 2), 'max': max(queries)},
+        'peak_memory_kib': round(peak / 1024.0, 1),
+    }
@@ -0,0 +1,236 @@
+#----------------------------------------------------------------------------#
+# Page data cache.
+#----------------------------------------------------------------------------#
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from importlib import import_module
+
+from replicas import later, replica_lag
+
+
+class CacheBackend(object):
+    """Storage interface for Cache.
+
+    Backends only store and expire opaque values; key naming, statistics and
+    invalidation live in Cache, so a shared backend (Redis, memcached, ...)
+    only needs to implement these four methods.
+    """
+
+    def get(self, key):
+        """Return the stored value, or None when missing or expired."""
+        raise NotImplementedError
+
+    def set(self, key, value, ttl):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def __len__(self):
+        return 0
+
+
+class LRUBackend(CacheBackend):
+    """Bounded in-process cache with least-recently-used eviction and TTLs.
+
+    Every worker process holds its own copy, so invalidations only reach
+    the process that performed the write; the TTL bounds how stale other
+    workers can get. Use a shared backend when that is not acceptable.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisBackend(CacheBackend):
+    """Shared backend storing pickled values in Redis (needs ``redis``)."""
+
+    def __init__(self, url):
+        import redis
+        self._client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self._client.get(key)
+        return None if raw is None else pickle.loads(raw)
+
+    def set(self, key, value, ttl):
+        self._client.set(key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=ttl or None)
+
+    def delete(self, key):
+        self._client.delete(key)
+
+    def clear(self):
+        # only drop our own keys, the database may be shared
+        for key in self._client.scan_iter(Cache.PREFIX + '*'):
+            self._client.delete(key)
+
+    def __len__(self):
+        # our own keys only, like clear(); a full SCAN, so meant for stats
+        return sum(1 for _ in self._client.scan_iter(Cache.PREFIX + '*'))
+
+
+def _load_backend(app):
+    backend = app.config.get('CACHE_BACKEND', 'lru')
+    if isinstance(backend, CacheBackend):
+        return backend
+    if backend == 'lru':
+        return LRUBackend(app.config.get('CACHE_MAX_ENTRIES', 1024))
+    if backend == 'redis':
+        return RedisBackend(app.config['CACHE_REDIS_URL'])
+
+    # "package.module:factory", called with the app
+    module_name, _, attribute = backend.partition(':')
+    return getattr(import_module(module_name), attribute)(app)
+
+
+class Cache(object):
+    """Caches the data behind read pages, keyed per route and entity.
+
+    Keys are plain strings such as ``venues`` or ``venue:3``. Families of
+    keys whose members can't be enumerated (e.g. every page of /shows) live
+    in a namespace; bumping the namespace version orphans all of its keys
+    at once and lets the backend expire them.
+
+    With read replicas, a read between a write and its arrival on the
+    replica would put the old data back into the cache for a whole TTL, so
+    every invalidation is repeated once the replicas have caught up
+    (``REPLICA_LAG_SECONDS``).
+    """
+
+    PREFIX = 'fyyur:'
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.enabled = False
+        self.default_ttl = 60
+        self.replica_lag = 0
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+        self._stats_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.backend = _load_backend(app)
+        self.enabled = app.config.get('CACHE_ENABLED', True)
+        self.default_ttl = app.config.get('CACHE_DEFAULT_TTL', 60)
+        self.replica_lag = replica_lag(app.config)
+        app.extensions['cache'] = self
+
+    def _count(self, stat, n=1):
+        with self._stats_lock:
+            self._stats[stat] += n
+
+    def namespaced(self, namespace, *parts):
+        """Build a key inside ``namespace`` at its current version."""
+        key = self.PREFIX + 'ns:' + namespace
+        version = self.backend.get(key)
+        if version is None:
+            # a lost version must never resurrect older keys, so start a
+            # fresh one instead of counting from zero
+            version = time.time_ns()
+            self.backend.set(key, version, None)
+        return '%s:v%d:%s' % (namespace, version, ':'.join(str(part) for part in parts))
+
+    def get_or_set(self, key, builder, ttl=None):
+        """Return the cached value for ``key``, building and storing it on a miss."""
+        if not self.enabled:
+            return builder()
+
+        value = self.backend.get(self.PREFIX + key)
+        if value is not None:
+            self._count('hits')
+            return value
+
+        self._count('misses')
+        value = builder()
+        self.backend.set(self.PREFIX + key, value, ttl or self.default_ttl)
+        return value
+
+    async def aget_or_set(self, key, builder, ttl=None):
+        """get_or_set() for async views: ``builder`` is a coroutine function."""
+        if not self.enabled:
+            return await builder()
+
+        value = self.backend.get(self.PREFIX + key)
+        if value is not None:
+            self._count('hits')
+            return value
+
+        self._count('misses')
+        value = await builder()
+        self.backend.set(self.PREFIX + key, value, ttl or self.default_ttl)
+        return value
+
+    def _invalidate(self, forget):
+        forget()
+        if self.replica_lag:
+            later(self.replica_lag, forget)
+
+    def delete(self, *keys):
+        def forget():
+            for key in keys:
+                self.backend.delete(self.PREFIX + key)
+        self._invalidate(forget)
+        self._count('invalidations', len(keys))
+
+    def bump(self, *namespaces):
+        def forget():
+            for namespace in namespaces:
+                # the version must outlive the entries it guards, so no TTL
+                self.backend.set(self.PREFIX + 'ns:' + namespace, time.time_ns(), None)
+        self._invalidate(forget)
+        self._count('invalidations', len(namespaces))
+
+    def clear(self):
+        self._invalidate(self.backend.clear)
+        self._count('invalidations')
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 4) if lookups else None
+        stats['entries'] = len(self.backend)
+        stats['evictions'] = getattr(self.backend, 'evictions', None)
+        stats['backend'] = type(self.backend).__name__
+        return stats
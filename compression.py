@@ -0,0 +1,110 @@
+#----------------------------------------------------------------------------#
+# Response compression.
+#----------------------------------------------------------------------------#
+import gzip
+import zlib
+
+from flask import request
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+COMPRESS_MIMETYPES = ('text/html', 'text/css', 'text/plain', 'text/javascript',
+                      'application/javascript', 'application/json', 'application/x-ndjson',
+                      'image/svg+xml')
+
+
+def _gzip_stream(chunks, level):
+    # wbits 16 + 15: a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        # flush after every chunk, so the client can show it straight away
+        data = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def _brotli_stream(chunks, quality):
+    compressor = brotli.Compressor(quality=quality)
+    for chunk in chunks:
+        data = compressor.process(chunk) + compressor.flush()
+        if data:
+            yield data
+    yield compressor.finish()
+
+
+class Compression(object):
+    """Compresses dynamic responses with brotli or gzip, whichever the
+    client prefers (brotli wins a tie).
+
+    Configuration:
+
+    * ``COMPRESS_MIN_BYTES`` - smaller bodies are sent as they are; the
+      headers would eat most of the saving
+    * ``COMPRESS_LEVEL`` - gzip level (brotli uses a comparable quality)
+
+    Streamed responses (list pages, NDJSON exports) are compressed chunk by
+    chunk as they are produced, whatever their size. Responses that already
+    carry a Content-Encoding, such as the precompressed static assets, are
+    left alone. Strong ETags become weak, as the bytes on the wire differ
+    from the representation the tag was computed for.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.min_bytes = app.config.get('COMPRESS_MIN_BYTES', 500)
+        self.level = app.config.get('COMPRESS_LEVEL', 6)
+        app.after_request(self._after_request)
+        app.extensions['compression'] = self
+
+    def choose(self, accepted):
+        """The encoding to use for an Accept-Encoding header, or None."""
+        encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+        best = max(encodings, key=lambda encoding: accepted[encoding])
+        return best if accepted[best] > 0 else None
+
+    def _after_request(self, response):
+        response.vary.add('Accept-Encoding')
+        if (response.direct_passthrough
+                or response.status_code < 200 or response.status_code in (204, 206, 304)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESS_MIMETYPES):
+            return response
+
+        encoding = self.choose(request.accept_encodings)
+        if encoding is None:
+            return response
+        # quality 4 compresses about as fast as gzip -6, and smaller
+        quality = max(0, min(self.level - 2, 11))
+
+        if response.is_streamed:
+            # the server closes the response, no longer the iterable itself;
+            # closing it is what ends a stream_with_context() request
+            if hasattr(response.response, 'close'):
+                response.call_on_close(response.response.close)
+            chunks = response.iter_encoded()
+            if encoding == 'br':
+                response.response = _brotli_stream(chunks, quality)
+            else:
+                response.response = _gzip_stream(chunks, self.level)
+            response.headers.pop('Content-Length', None)
+        else:
+            body = response.get_data()
+            if len(body) < self.min_bytes:
+                return response
+            if encoding == 'br':
+                response.set_data(brotli.compress(body, quality=quality))
+            else:
+                response.set_data(gzip.compress(body, compresslevel=self.level))
+        response.headers['Content-Encoding'] = encoding
+
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
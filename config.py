@@ -1,15 +1,178 @@
 import os
 
-SECRET_KEY = os.urandom(32)
 # Grabs the folder where the script runs.
 basedir = os.path.abspath(os.path.dirname(__file__))
 
-# Enable debug mode.
-DEBUG = True
 
 # Connect to the database
+def normalize_url(url):
+    # Heroku still hands out postgres:// URLs, which SQLAlchemy no longer accepts
+    if url and url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+    return url
 
 
-# TODO IMPLEMENT DATABASE URL
-SQLALCHEMY_DATABASE_URI = "postgres://akira@localhost:5432/fyyur"
-SQLALCHEMY_TRACK_MODIFICATIONS = False
+def database_url(default=None):
+    return normalize_url(os.environ.get('DATABASE_URL', default))
+
+
+def replica_urls():
+    return [normalize_url(url.strip())
+            for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+
+
+class Config(object):
+    # Every worker process (and host) must sign sessions with the same key,
+    # otherwise flash messages and CSRF tokens fail whenever a request lands
+    # on a different worker than the one that issued them.
+    SECRET_KEY = os.environ.get('SECRET_KEY')
+
+    DEBUG = False
+    TESTING = False
+
+    SQLALCHEMY_DATABASE_URI = database_url()
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+
+    # Connection pool of each process (see database.engine_options). Size
+    # it against the server's max_connections: workers * (size + overflow)
+    # connections may be open at once.
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 5))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', '1') != '0'
+    DB_STATEMENT_TIMEOUT_MS = int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 15000))
+    # "transaction" when connecting through PgBouncer in transaction mode
+    DB_POOLER = os.environ.get('DB_POOLER') or None
+
+    # Serve the read views as async views on SQLAlchemy's asyncio engine
+    # (see asyncdb.py). ASYNC_DATABASE_URL defaults to DATABASE_URL with
+    # the asyncpg (or aiosqlite) driver; pooled with the DB_POOL_* settings
+    ASYNC_MODE = os.environ.get('ASYNC_MODE', '0') == '1'
+    ASYNC_DATABASE_URL = os.environ.get('ASYNC_DATABASE_URL') or None
+
+    # Read replicas serving GET requests (comma-separated DATABASE_REPLICA_URLS).
+    # After a write the client reads from the primary for REPLICA_STICKY_SECONDS;
+    # a failing replica is skipped for REPLICA_RETRY_SECONDS.
+    SQLALCHEMY_REPLICA_URIS = replica_urls()
+    REPLICA_STICKY_SECONDS = 10
+    REPLICA_RETRY_SECONDS = 30
+    # The longest a write takes to reach the replicas; cache invalidations are
+    # repeated after it, as reads in between may re-cache the old data
+    REPLICA_LAG_SECONDS = 10
+
+    # Number of shows listed per page on /shows (overridable with ?per_page=)
+    SHOWS_PAGE_SIZE = 60
+    SHOWS_MAX_PAGE_SIZE = 500
+
+    # Render /venues and /shows while their rows are fetched (STREAM_BATCH_SIZE
+    # at a time) instead of building the page first. Memory stays flat, but
+    # these pages bypass the data cache (every request queries the database)
+    # and carry no Server-Timing header
+    STREAM_LIST_PAGES = True
+    STREAM_BATCH_SIZE = 200
+
+    # Number of results returned per page by the search endpoints
+    SEARCH_PAGE_SIZE = 20
+    SEARCH_MAX_PAGE_SIZE = 100
+
+    # Cache for the data behind the read pages: "lru" (bounded, per process),
+    # "redis" (shared, needs CACHE_REDIS_URL) or "module:factory"
+    CACHE_ENABLED = True
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'lru')
+    CACHE_MAX_ENTRIES = 1024
+    CACHE_DEFAULT_TTL = 60
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+    # Shared HTTP caches (CDN, Varnish) keep tagged pages for
+    # PAGE_SHARED_MAX_AGE seconds; writes purge them by surrogate key through
+    # PURGER: "none", "memory", "file" (appends to PURGE_FILE), "http" (PURGE
+    # requests to PURGE_URL) or "module:factory". With replicas, purges are
+    # sent again after REPLICA_LAG_SECONDS
+    PAGE_SHARED_MAX_AGE = 3600
+    PURGER = os.environ.get('PURGER', 'none')
+    PURGE_FILE = os.environ.get('PURGE_FILE', os.path.join(basedir, 'purges.jsonl'))
+    PURGE_URL = os.environ.get('PURGE_URL', 'http://localhost:6081/')
+
+    # /venues/nearby: default and largest radius (km), most venues returned
+    NEARBY_RADIUS_KM = 25
+    NEARBY_MAX_RADIUS_KM = 250
+    NEARBY_LIMIT = 50
+
+    # JSON API page sizes and the batch size used by ?format=ndjson exports
+    API_PAGE_SIZE = 100
+    API_MAX_PAGE_SIZE = 1000
+    API_EXPORT_BATCH_SIZE = 1000
+
+    # Range partitioning of Show by start_time (see `flask partition-shows`):
+    # "yearly" or "monthly", and how many future periods to create in advance
+    SHOW_PARTITION_INTERVAL = 'yearly'
+    SHOW_PARTITIONS_AHEAD = 2
+
+    # Compiled templates, shared by every process (`flask precompile-templates`
+    # fills it at build time); None compiles them in memory on first use
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR', os.path.join(basedir, '.jinja_cache'))
+
+    # Lifetime of the fingerprinted files built by `flask build-assets`
+    ASSETS_MAX_AGE = 365 * 24 * 3600
+
+    # Compression of dynamic responses: bodies smaller than COMPRESS_MIN_BYTES
+    # are sent as they are; COMPRESS_LEVEL is the gzip level
+    COMPRESS_MIN_BYTES = 500
+    COMPRESS_LEVEL = 6
+
+    # Part of every page's ETag, so a deploy invalidates them; None derives
+    # it from the template sources and the asset manifest
+    RELEASE_VERSION = os.environ.get('RELEASE_VERSION')
+
+    # Request instrumentation: Server-Timing headers and the slow-query log
+    SERVER_TIMING = True
+    SLOW_QUERY_THRESHOLD_MS = 100
+    SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', os.path.join(basedir, 'slow_queries.log'))
+    # Show the slowest SQL statements at /requests/stats (always in debug mode)
+    REQUEST_STATS_STATEMENTS = os.environ.get('REQUEST_STATS_STATEMENTS', '0') == '1'
+
+
+class DevelopmentConfig(Config):
+    # Enable debug mode.
+    DEBUG = True
+    SECRET_KEY = os.environ.get('SECRET_KEY', 'development-only-secret')
+    SQLALCHEMY_DATABASE_URI = database_url('postgresql://akira@localhost:5432/fyyur')
+
+
+class TestingConfig(Config):
+    TESTING = True
+    SECRET_KEY = 'testing-only-secret'
+    SQLALCHEMY_DATABASE_URI = database_url('sqlite://')
+    WTF_CSRF_ENABLED = False
+    CACHE_BACKEND = 'lru'
+    SLOW_QUERY_LOG = None
+    PURGER = 'memory'
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR')
+
+
+class ProductionConfig(Config):
+    # the header tells every client how much database time a page took
+    SERVER_TIMING = False
+
+
+CONFIGS = {
+    'development': DevelopmentConfig,
+    'testing': TestingConfig,
+    'production': ProductionConfig,
+}
+
+
+def get_config(name=None):
+    """The config class named by ``name`` or $FYYUR_ENV (default: development)."""
+    name = name or os.environ.get('FYYUR_ENV', 'development')
+    try:
+        config = CONFIGS[name]
+    except KeyError:
+        raise RuntimeError('unknown FYYUR_ENV %r (expected one of %s)' % (name, ', '.join(sorted(CONFIGS))))
+
+    if not config.SECRET_KEY:
+        raise RuntimeError('SECRET_KEY must be set in the environment')
+    if not config.SQLALCHEMY_DATABASE_URI:
+        raise RuntimeError('DATABASE_URL must be set in the environment')
+    return config
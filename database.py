@@ -0,0 +1,72 @@
+#----------------------------------------------------------------------------#
+# Engine and connection pool settings.
+#----------------------------------------------------------------------------#
+from sqlalchemy.engine import make_url
+
+POOLERS = (None, 'transaction')
+
+
+def engine_options(config):
+    """SQLAlchemy engine options built from the ``DB_*`` settings.
+
+    * ``DB_POOL_SIZE`` / ``DB_MAX_OVERFLOW`` - connections kept open per
+      process, and how many more may be opened during a burst
+    * ``DB_POOL_TIMEOUT`` - seconds a request waits for a free connection
+      before failing (with a 503) instead of queueing indefinitely
+    * ``DB_POOL_RECYCLE`` - seconds after which a connection is replaced
+    * ``DB_POOL_PRE_PING`` - test connections on checkout, so connections
+      that died with a database restart are replaced transparently
+    * ``DB_STATEMENT_TIMEOUT_MS`` - Postgres cancels longer statements (0: off)
+    * ``DB_POOLER`` - ``"transaction"`` behind PgBouncer-style transaction
+      pooling: no startup parameters and no server-side prepared statements
+    """
+    url = make_url(config['SQLALCHEMY_DATABASE_URI'])
+    pooler = config.get('DB_POOLER')
+    if pooler not in POOLERS:
+        raise ValueError('unknown DB_POOLER %r' % pooler)
+
+    options = {'pool_pre_ping': config.get('DB_POOL_PRE_PING', True)}
+    if url.get_backend_name() == 'sqlite' and url.database in (None, '', ':memory:'):
+        # in-memory databases live in a single connection
+        return options
+
+    options.update(
+        pool_size=config.get('DB_POOL_SIZE', 5),
+        max_overflow=config.get('DB_MAX_OVERFLOW', 10),
+        pool_timeout=config.get('DB_POOL_TIMEOUT', 30),
+        pool_recycle=config.get('DB_POOL_RECYCLE', -1),
+    )
+
+    if url.get_backend_name() != 'postgresql':
+        return options
+
+    driver = url.get_driver_name()
+    connect_args = {}
+    timeout = config.get('DB_STATEMENT_TIMEOUT_MS')
+    if pooler == 'transaction':
+        # a transaction pooler hands the server connection to someone else
+        # after every transaction, so session state (startup options,
+        # prepared statements) can't be relied on; set statement_timeout
+        # on the role instead: ALTER ROLE ... SET statement_timeout = ...
+        if driver == 'psycopg':
+            connect_args['prepare_threshold'] = None
+        elif driver == 'asyncpg':
+            connect_args['statement_cache_size'] = 0
+            connect_args['prepared_statement_cache_size'] = 0
+    elif timeout:
+        if driver == 'asyncpg':
+            connect_args['server_settings'] = {'statement_timeout': str(timeout)}
+        else:
+            connect_args['options'] = '-c statement_timeout=%d' % timeout
+
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+
+def configure_engine(app):
+    """Fill SQLALCHEMY_ENGINE_OPTIONS from the DB_* settings; options set
+    there explicitly win. Call before SQLAlchemy(app)."""
+    options = engine_options(app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
@@ -0,0 +1,138 @@
+#----------------------------------------------------------------------------#
+# Geohashes and offline geocoding.
+#----------------------------------------------------------------------------#
+import csv
+import math
+import os
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+# ~5 m cells; stored with every located venue
+PRECISION = 9
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+CENTROIDS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'city_centroids.csv')
+
+
+def encode(latitude, longitude, precision=PRECISION):
+    """The geohash of a point: interleaved longitude/latitude bisections,
+    five bits per character. Points sharing a prefix share a cell."""
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """(height, width) in degrees of the cells of a geohash precision."""
+    lng_bits = (5 * precision + 1) // 2
+    lat_bits = 5 * precision // 2
+    return 180.0 / 2 ** lat_bits, 360.0 / 2 ** lng_bits
+
+
+def distance_km(lat1, lng1, lat2, lng2):
+    """Great-circle (haversine) distance between two points."""
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """(south, north, west, east) of the box around a circle; longitudes
+    are not wrapped, so west < -180 or east > 180 near the antimeridian."""
+    dlat = radius_km / KM_PER_DEGREE
+    south, north = max(-90.0, latitude - dlat), min(90.0, latitude + dlat)
+    # the widest part of the circle is at the latitude closest to a pole
+    widest = max(abs(south), abs(north))
+    if widest >= 89.9:
+        return south, north, -180.0, 180.0
+    dlng = min(180.0, dlat / math.cos(math.radians(widest)))
+    return south, north, longitude - dlng, longitude + dlng
+
+
+def _cells(box, precision):
+    south, north, west, east = box
+    height, width = cell_size(precision)
+    rows = range(int(math.floor((south + 90) / height)), int(math.floor((north + 90) / height)) + 1)
+    columns = range(int(math.floor((west + 180) / width)), int(math.floor((east + 180) / width)) + 1)
+    return rows, columns, height, width
+
+
+def cover(latitude, longitude, radius_km, max_cells=16):
+    """Geohash prefixes whose cells together cover the circle: the finest
+    precision that needs at most ``max_cells`` cells. Each prefix is one
+    range scan on an index over the geohash column."""
+    box = bounding_box(latitude, longitude, radius_km)
+    precision = 1
+    for candidate in range(PRECISION, 0, -1):
+        rows, columns, _, _ = _cells(box, candidate)
+        if len(rows) * len(columns) <= max_cells:
+            precision = candidate
+            break
+
+    rows, columns, height, width = _cells(box, precision)
+    prefixes = set()
+    for row in rows:
+        center_lat = min(90.0, -90 + (row + 0.5) * height)
+        for column in columns:
+            center_lng = (-180 + (column + 0.5) * width + 180) % 360 - 180
+            prefixes.add(encode(center_lat, center_lng, precision))
+    return sorted(prefixes)
+
+
+def prefix_range(prefix, precision=PRECISION):
+    """(low, high) bounds of the geohashes starting with ``prefix``, for a
+    BETWEEN that any btree index can serve, whatever its collation."""
+    return prefix, prefix + BASE32[-1] * (precision - len(prefix))
+
+
+def _key(city, state):
+    return (city or '').strip().lower(), (state or '').strip().upper()
+
+
+class Gazetteer(object):
+    """City centroids read from a bundled CSV (city, state, latitude,
+    longitude); looks places up without any network access."""
+
+    def __init__(self, path=CENTROIDS):
+        self.path = path
+        self._places = None
+
+    @property
+    def places(self):
+        if self._places is None:
+            with open(self.path, newline='', encoding='utf-8') as f:
+                self._places = {
+                    _key(row['city'], row['state']): (float(row['latitude']), float(row['longitude']))
+                    for row in csv.DictReader(f)
+                }
+        return self._places
+
+    def lookup(self, city, state):
+        """(latitude, longitude) of the city, or None when it isn't listed."""
+        return self.places.get(_key(city, state))
+
+    def locate(self, city, state):
+        """The latitude, longitude and geohash columns for a city/state;
+        all None for unknown places."""
+        point = self.lookup(city, state)
+        if point is None:
+            return {'latitude': None, 'longitude': None, 'geohash': None}
+        return {'latitude': point[0], 'longitude': point[1], 'geohash': encode(*point)}
+
+
+gazetteer = Gazetteer()
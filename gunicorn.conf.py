@@ -0,0 +1,50 @@
+#----------------------------------------------------------------------------#
+# Gunicorn settings.
+#----------------------------------------------------------------------------#
+import multiprocessing
+import os
+
+bind = '0.0.0.0:%s' % os.environ.get('PORT', '8000')
+
+# One process per core (plus one to cover I/O stalls); each runs a small
+# thread pool, since most of a request is spent waiting on the database.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Import the app once in the master, so workers fork with templates,
+# models and config already loaded and start serving immediately.
+preload_app = True
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then so slow leaks can't accumulate.
+max_requests = 2000
+max_requests_jitter = 200
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready(server):
+    # Load every template in the master (from the bytecode cache when it
+    # was precompiled); the workers inherit them and never compile one.
+    from app import templates
+    templates.warm()
+
+
+def post_fork(server, worker):
+    # Connections opened while preloading belong to the master; a worker
+    # sharing those sockets would interleave its queries with its siblings'.
+    from app import app, db
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def child_exit(server, worker):
+    # Drop the Prometheus samples of live gauges owned by the dead worker.
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,269 @@
+#----------------------------------------------------------------------------#
+# Bulk import.
+#----------------------------------------------------------------------------#
+import csv
+import io
+import json
+import os
+import time
+
+from sqlalchemy.exc import DBAPIError
+from werkzeug.datastructures import MultiDict
+from wtforms import Form
+from wtforms.fields.core import UnboundField
+
+# separators accepted between genres in a CSV cell
+GENRE_SEPARATORS = (';', '|')
+
+
+def read_records(path, file_format=None):
+    """Yield (line number, record) pairs from a CSV or JSON Lines file.
+
+    Records are streamed, so files of any size can be imported. The format
+    is taken from the file extension unless given explicitly.
+    """
+    file_format = file_format or ('jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv')
+
+    with open(path, newline='', encoding='utf-8') as f:
+        if file_format == 'csv':
+            # line 1 is the header
+            for line, record in enumerate(csv.DictReader(f), start=2):
+                yield line, record
+        elif file_format == 'jsonl':
+            for line, raw in enumerate(f, start=1):
+                if raw.strip():
+                    yield line, json.loads(raw)
+        else:
+            raise ValueError('unsupported format: %s' % file_format)
+
+
+class RowValidator(object):
+    """Validates raw records with the fields and validators of a form class.
+
+    The fields of e.g. ``VenueForm`` are copied onto a plain WTForms form
+    (no request, no CSRF) so imported rows obey exactly the same rules as
+    the web forms. A single form instance is reprocessed for every record,
+    which avoids rebuilding the fields per row.
+    """
+
+    def __init__(self, form_class, convert):
+        fields = dict(
+            (name, getattr(form_class, name)) for name in dir(form_class)
+            if isinstance(getattr(form_class, name), UnboundField))
+        self.form = type(form_class.__name__ + 'Row', (Form,), fields)()
+        self.convert = convert
+
+    def __call__(self, record):
+        """Return ``(values, None)`` for a valid record or ``(None, errors)``."""
+        formdata = MultiDict()
+        for name, value in record.items():
+            if isinstance(value, list):
+                formdata.setlist(name, [str(item) for item in value])
+            elif name == 'genres' and isinstance(value, str):
+                for separator in GENRE_SEPARATORS:
+                    value = value.replace(separator, ',')
+                formdata.setlist(name, [genre.strip() for genre in value.split(',') if genre.strip()])
+            elif isinstance(value, bool):
+                formdata[name] = 'Yes' if value else 'No'
+            elif value is not None:
+                formdata[name] = str(value)
+
+        form = self.form
+        form.process(formdata)
+        if not form.validate():
+            return None, dict(form.errors)
+        try:
+            return self.convert(form), None
+        except Exception as e:
+            return None, {'row': [str(e) or type(e).__name__]}
+
+
+class Checkpoint(object):
+    """Remembers how far an import got, so a rerun resumes after the last
+    committed batch instead of starting over.
+
+    The state is a row of ``model`` (columns name, line, inserted, rejected
+    and batches) keyed by ``name``. advance() writes it in the batch's
+    transaction, so a batch and its checkpoint are committed together and a
+    crash never leaves committed rows to be imported again.
+    """
+
+    def __init__(self, session, model, name):
+        self.session = session
+        self.model = model
+        self.name = name
+        self.state = {'line': 0, 'inserted': 0, 'rejected': 0, 'batches': 0}
+        row = session.get(model, name)
+        if row is not None:
+            self.state.update((key, getattr(row, key)) for key in self.state)
+
+    @property
+    def line(self):
+        return self.state['line']
+
+    def advance(self, line, inserted, rejected):
+        """Record a batch; committed with it by the caller."""
+        self.state['line'] = line
+        self.state['inserted'] += inserted
+        self.state['rejected'] += rejected
+        self.state['batches'] += 1
+
+        row = self.session.get(self.model, self.name)
+        if row is None:
+            row = self.model(name=self.name)
+            self.session.add(row)
+        for key, value in self.state.items():
+            setattr(row, key, value)
+
+    def clear(self):
+        self.session.query(self.model).filter_by(name=self.name).delete()
+        self.session.commit()
+        self.state = {'line': 0, 'inserted': 0, 'rejected': 0, 'batches': 0}
+
+
+def _copy_literal(value):
+    """Format a value for Postgres COPY ... (FORMAT csv)."""
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (list, tuple)):
+        items = ('"%s"' % str(item).replace('\\', '\\\\').replace('"', '\\"') for item in value)
+        return '{%s}' % ','.join(items)
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    return value
+
+
+def copy_rows(connection, table, rows):
+    """Load rows with COPY FROM STDIN (psycopg2 only); returns False when
+    the driver can't do it so the caller falls back to executemany."""
+    raw = connection.connection.dbapi_connection
+    cursor = raw.cursor()
+    if not hasattr(cursor, 'copy_expert'):
+        return False
+
+    columns = list(rows[0].keys())
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        # unquoted empty fields are NULL in COPY's csv format
+        writer.writerow(['' if value is None else value
+                         for value in (_copy_literal(row[column]) for column in columns)])
+    buffer.seek(0)
+
+    cursor.copy_expert(
+        'COPY "%s" (%s) FROM STDIN WITH (FORMAT csv)'
+        % (table.name, ', '.join('"%s"' % column for column in columns)), buffer)
+    return True
+
+
+class BulkImporter(object):
+    """Streams records into one table in large batches.
+
+    Each batch is validated, inserted with a single executemany (or COPY on
+    Postgres) and committed together with its checkpoint. If the database
+    rejects a batch, its rows are retried one by one inside savepoints so
+    the good rows still land and the bad ones end up in the error report.
+    ``after_insert(session, rows)`` runs inside the batch transaction, e.g.
+    to maintain counters. ``check(session, rows)`` runs there before the
+    insert and returns an error dict (or None) per row, for rules that
+    depend on the database or on the other rows of the batch.
+    """
+
+    def __init__(self, session, table, validate, batch_size=5000,
+                 after_insert=None, use_copy=True, check=None, log=print):
+        self.session = session
+        self.table = table
+        self.validate = validate
+        self.batch_size = batch_size
+        self.after_insert = after_insert
+        self.use_copy = use_copy
+        self.check = check
+        self.log = log
+
+    def run(self, records, checkpoint, errors_path):
+        started = self._batch_started = time.monotonic()
+        batch, rejected, last_line = [], [], checkpoint.line
+
+        with open(errors_path, 'a') as error_report:
+            for line, record in records:
+                if line <= checkpoint.line:
+                    continue
+                last_line = line
+
+                values, errors = self.validate(record)
+                if errors:
+                    rejected.append({'line': line, 'errors': errors})
+                else:
+                    batch.append((line, values))
+
+                if len(batch) + len(rejected) >= self.batch_size:
+                    self._flush(batch, rejected, last_line, checkpoint, error_report)
+                    batch, rejected = [], []
+
+            if batch or rejected:
+                self._flush(batch, rejected, last_line, checkpoint, error_report)
+
+        elapsed = time.monotonic() - started
+        return dict(checkpoint.state, seconds=round(elapsed, 3))
+
+    def _flush(self, batch, rejected, last_line, checkpoint, error_report):
+        number = checkpoint.state['batches'] + 1
+        inserted = []
+
+        if batch and self.check:
+            batch = self._check(batch, rejected)
+
+        if batch:
+            try:
+                self._insert([values for _, values in batch])
+                inserted = batch
+            except DBAPIError:
+                self.session.rollback()
+                inserted = self._insert_one_by_one(batch, rejected)
+
+            if self.after_insert and inserted:
+                self.after_insert(self.session, [values for _, values in inserted])
+
+        checkpoint.advance(last_line, len(inserted), len(rejected))
+        self.session.commit()
+
+        for rejection in rejected:
+            rejection['batch'] = number
+            error_report.write(json.dumps(rejection, default=str) + '\n')
+        error_report.flush()
+
+        # throughput covers reading and validating the batch, not just the insert
+        now = time.monotonic()
+        elapsed, self._batch_started = now - self._batch_started, now
+        self.log('batch %d: %d inserted, %d rejected, %.0f rows/s' % (
+            number, len(inserted), len(rejected),
+            (len(batch) + len(rejected)) / elapsed if elapsed else 0))
+
+    def _check(self, batch, rejected):
+        accepted = []
+        for (line, values), errors in zip(batch, self.check(self.session, [values for _, values in batch])):
+            if errors:
+                rejected.append({'line': line, 'errors': errors})
+            else:
+                accepted.append((line, values))
+        return accepted
+
+    def _insert(self, rows):
+        connection = self.session.connection()
+        if self.use_copy and connection.dialect.name == 'postgresql':
+            if copy_rows(connection, self.table, rows):
+                return
+        connection.execute(self.table.insert(), rows)
+
+    def _insert_one_by_one(self, batch, rejected):
+        inserted = []
+        for line, values in batch:
+            try:
+                with self.session.begin_nested():
+                    self.session.connection().execute(self.table.insert(), [values])
+                inserted.append((line, values))
+            except DBAPIError as e:
+                rejected.append({'line': line, 'errors': {'database': [str(e.orig)]}})
+        return inserted
@@ -0,0 +1,227 @@
+#----------------------------------------------------------------------------#
+# Request instrumentation.
+#----------------------------------------------------------------------------#
+import bisect
+import json
+import logging
+import threading
+import time
+from logging import FileHandler, Formatter
+
+from flask import (before_render_template, g, has_app_context, has_request_context,
+                   request, template_rendered)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# upper bounds of the latency histogram buckets, in milliseconds
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+
+class RequestStats(object):
+    """What one request spent its time on."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_ms = 0.0
+        self.render_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_statement = None
+        self._render_started = None
+
+    def add_query(self, statement, ms):
+        self.queries += 1
+        self.db_ms += ms
+        if ms > self.slowest_ms:
+            self.slowest_ms = ms
+            self.slowest_statement = statement
+
+
+class EndpointStats(object):
+    """Running totals and a latency histogram for one endpoint."""
+
+    def __init__(self):
+        self.requests = 0
+        self.buckets = [0] * len(BUCKETS_MS)
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_ms = 0.0
+        self.render_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_statement = None
+
+    def add(self, stats, total_ms):
+        self.requests += 1
+        self.buckets[bisect.bisect_left(BUCKETS_MS, total_ms)] += 1
+        self.total_ms += total_ms
+        self.max_ms = max(self.max_ms, total_ms)
+        self.queries += stats.queries
+        self.max_queries = max(self.max_queries, stats.queries)
+        self.db_ms += stats.db_ms
+        self.render_ms += stats.render_ms
+        if stats.slowest_ms > self.slowest_ms:
+            self.slowest_ms = stats.slowest_ms
+            self.slowest_statement = stats.slowest_statement
+
+    def to_dict(self, statements=False):
+        n = self.requests or 1
+        return {
+            'requests': self.requests,
+            'latency_ms': {
+                'mean': round(self.total_ms / n, 3),
+                'max': round(self.max_ms, 3),
+                'histogram': dict(
+                    ('le_%s' % ('inf' if bound == float('inf') else bound), count)
+                    for bound, count in zip(BUCKETS_MS, self.buckets)),
+            },
+            'queries': {'mean': round(self.queries / n, 2), 'max': self.max_queries},
+            'db_ms_mean': round(self.db_ms / n, 3),
+            'render_ms_mean': round(self.render_ms / n, 3),
+            'slowest_query': {
+                'ms': round(self.slowest_ms, 3),
+                'statement': self.slowest_statement if statements else None,
+            },
+        }
+
+
+def _current():
+    if has_app_context():
+        return g.get('request_stats')
+    return None
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    ms = (time.perf_counter() - started) * 1000
+    stats = _current()
+    if stats is not None:
+        stats.add_query(statement, ms)
+    for instrumentation in Instrumentation.instances:
+        instrumentation._check_slow(statement, ms, stats)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    # failed statements never reach after_cursor_execute
+    conn = context.connection
+    if conn is not None and conn.info.get('query_started'):
+        conn.info['query_started'].pop()
+
+
+class Instrumentation(object):
+    """Per-request SQL/render timing, Server-Timing headers, a slow-query
+    log and per-endpoint histograms.
+
+    Configuration:
+
+    * ``SERVER_TIMING`` - add a ``Server-Timing`` header to every response
+      that isn't streamed
+    * ``SLOW_QUERY_THRESHOLD_MS`` - statements slower than this are logged
+    * ``SLOW_QUERY_LOG`` - file receiving one JSON object per slow statement;
+      without it slow statements aren't logged anywhere
+    * ``REQUEST_STATS_STATEMENTS`` - include the text of the slowest
+      statements in stats(); off unless debugging, as it can reveal the
+      schema and literal values
+    """
+
+    instances = []
+
+    def __init__(self, app=None):
+        self.endpoints = {}
+        self.threshold_ms = 100
+        self.slow_log = logging.getLogger('fyyur.slow_queries')
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.threshold_ms = app.config.get('SLOW_QUERY_THRESHOLD_MS', 100)
+        self.server_timing = app.config.get('SERVER_TIMING', True)
+        self.statements = app.debug or app.config.get('REQUEST_STATS_STATEMENTS', False)
+
+        # never passed on to the root logger, which would print the records
+        # to stderr when no log file is configured
+        self.slow_log.propagate = False
+        log_path = app.config.get('SLOW_QUERY_LOG')
+        if log_path:
+            handler = FileHandler(log_path)
+            handler.setFormatter(Formatter('%(message)s'))
+            self.slow_log.addHandler(handler)
+            self.slow_log.setLevel(logging.INFO)
+        else:
+            self.slow_log.addHandler(logging.NullHandler())
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app, weak=False)
+        template_rendered.connect(self._after_render, app, weak=False)
+
+        Instrumentation.instances.append(self)
+        app.extensions['instrumentation'] = self
+
+    def _before_request(self):
+        g.request_stats = RequestStats()
+
+    def _before_render(self, sender, template, context, **extra):
+        stats = _current()
+        if stats is not None:
+            stats._render_started = time.perf_counter()
+
+    def _after_render(self, sender, template, context, **extra):
+        stats = _current()
+        if stats is not None and stats._render_started is not None:
+            stats.render_ms += (time.perf_counter() - stats._render_started) * 1000
+            stats._render_started = None
+
+    def _after_request(self, response):
+        stats = _current()
+        if stats is None:
+            return response
+        endpoint = request.endpoint or '<unmatched>'
+
+        if response.is_streamed:
+            # a streamed body runs its queries and renders while it is sent,
+            # after the headers: no Server-Timing, and the request is
+            # recorded once the server has closed the response
+            response.call_on_close(lambda: self._record(endpoint, stats))
+            return response
+
+        total_ms = self._record(endpoint, stats)
+        if self.server_timing:
+            response.headers['Server-Timing'] = ', '.join([
+                'db;dur=%.2f;desc="%d queries"' % (stats.db_ms, stats.queries),
+                'render;dur=%.2f' % stats.render_ms,
+                'total;dur=%.2f' % total_ms,
+            ])
+        return response
+
+    def _record(self, endpoint, stats):
+        total_ms = (time.perf_counter() - stats.started) * 1000
+        with self._lock:
+            self.endpoints.setdefault(endpoint, EndpointStats()).add(stats, total_ms)
+        return total_ms
+
+    def _check_slow(self, statement, ms, stats):
+        if ms < self.threshold_ms:
+            return
+        record = {
+            'ts': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'ms': round(ms, 3),
+            'statement': statement,
+        }
+        if has_request_context():
+            record.update(endpoint=request.endpoint, method=request.method, path=request.path)
+        self.slow_log.warning(json.dumps(record))
+
+    def stats(self):
+        with self._lock:
+            return dict((endpoint, stats.to_dict(self.statements))
+                        for endpoint, stats in sorted(self.endpoints.items()))
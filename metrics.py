@@ -0,0 +1,165 @@
+#----------------------------------------------------------------------------#
+# Prometheus metrics.
+#----------------------------------------------------------------------------#
+import os
+import time
+
+from flask import Response, before_render_template, g, request, template_rendered
+from prometheus_client import (CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge,
+                               Histogram, REGISTRY, generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.pool import QueuePool
+
+from querycount import query_budget
+
+# Under gunicorn every worker is a separate process. With
+# PROMETHEUS_MULTIPROC_DIR set, each worker writes its samples to files in
+# that directory and /metrics aggregates all of them (gunicorn.conf.py
+# cleans up after dead workers), so the numbers don't depend on which
+# worker answers the scrape.
+
+LATENCY_BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1, 2.5, 5, 10)
+
+REQUESTS = Counter(
+    'fyyur_http_requests_total', 'HTTP requests handled.',
+    ['endpoint', 'method', 'status'])
+REQUEST_LATENCY = Histogram(
+    'fyyur_http_request_duration_seconds', 'Time spent handling a request.',
+    ['endpoint'], buckets=LATENCY_BUCKETS)
+RENDER_LATENCY = Histogram(
+    'fyyur_template_render_seconds', 'Time spent rendering a template.',
+    ['template'], buckets=LATENCY_BUCKETS)
+
+# labelled "primary" or with the bind name of the replica
+POOL_SIZE = Gauge(
+    'fyyur_db_pool_size', 'Configured size of the connection pool.',
+    ['database'], multiprocess_mode='livesum')
+POOL_CHECKED_OUT = Gauge(
+    'fyyur_db_pool_checked_out', 'Connections currently checked out of the pool.',
+    ['database'], multiprocess_mode='livesum')
+POOL_OVERFLOW = Gauge(
+    'fyyur_db_pool_overflow', 'Connections open beyond the pool size.',
+    ['database'], multiprocess_mode='livesum')
+POOL_CHECKOUT_WAIT = Histogram(
+    'fyyur_db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection.',
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5, 10, 30))
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection."""
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super(TimedQueuePool, self)._do_get()
+        finally:
+            POOL_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+
+def use_timed_pool(app):
+    """Select TimedQueuePool for the app's engine; call before SQLAlchemy(app).
+
+    SQLite keeps its own pooling (in-memory databases need a static pool).
+    """
+    if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
+        return
+    options = app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    options.setdefault('poolclass', TimedQueuePool)
+
+
+def _update_overflow(database, pool):
+    # QueuePool counts overflow from -pool_size while the pool fills up
+    if hasattr(pool, 'overflow'):
+        POOL_OVERFLOW.labels(database).set(max(0, pool.overflow()))
+
+
+def _observe(started, endpoint, method, status):
+    REQUEST_LATENCY.labels(endpoint).observe(time.perf_counter() - started)
+    REQUESTS.labels(endpoint, method, status).inc()
+
+
+def registry():
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        aggregated = CollectorRegistry()
+        multiprocess.MultiProcessCollector(aggregated)
+        return aggregated
+    return REGISTRY
+
+
+class Metrics(object):
+    """Request, template and connection-pool metrics served at /metrics."""
+
+    def __init__(self, app=None, db=None):
+        self.engines = {}
+        self._reported_pid = None
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        before_render_template.connect(self._before_render, app, weak=False)
+        template_rendered.connect(self._after_render, app, weak=False)
+
+        # the primary and the replica binds
+        with app.app_context():
+            self.engines = dict((name or 'primary', engine) for name, engine in db.engines.items())
+        for database, engine in self.engines.items():
+            self._watch(database, engine)
+
+        app.add_url_rule('/metrics', 'metrics', self.export)
+        app.extensions['metrics'] = self
+
+    def _watch(self, database, engine):
+        @event.listens_for(engine, 'checkout')
+        def checkout(dbapi_connection, connection_record, connection_proxy):
+            POOL_CHECKED_OUT.labels(database).inc()
+            _update_overflow(database, engine.pool)
+
+        @event.listens_for(engine, 'checkin')
+        def checkin(dbapi_connection, connection_record):
+            POOL_CHECKED_OUT.labels(database).dec()
+            _update_overflow(database, engine.pool)
+
+    def _report_pool_sizes(self):
+        # once per process, from the process itself: the app is imported
+        # by gunicorn's master (preload_app), whose livesum samples are
+        # not the workers'
+        if self._reported_pid == os.getpid():
+            return
+        self._reported_pid = os.getpid()
+        for database, engine in self.engines.items():
+            if hasattr(engine.pool, 'size'):
+                POOL_SIZE.labels(database).set(engine.pool.size())
+
+    def _before_request(self):
+        self._report_pool_sizes()
+        g.metrics_started = time.perf_counter()
+
+    def _after_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        # unmatched URLs share one label to keep the cardinality bounded
+        endpoint = request.endpoint or 'unmatched'
+        labels = (endpoint, request.method, response.status_code)
+        if response.is_streamed:
+            # the body is generated while it is sent: time it until the
+            # server closes the response
+            response.call_on_close(lambda: _observe(started, *labels))
+        else:
+            _observe(started, *labels)
+        return response
+
+    def _before_render(self, sender, template, context, **extra):
+        g.setdefault('metrics_render_started', []).append(time.perf_counter())
+
+    def _after_render(self, sender, template, context, **extra):
+        started = g.get('metrics_render_started')
+        if started:
+            RENDER_LATENCY.labels(template.name or 'string').observe(
+                time.perf_counter() - started.pop())
+
+    @query_budget(0)
+    def export(self):
+        return Response(generate_latest(registry()), mimetype=CONTENT_TYPE_LATEST)
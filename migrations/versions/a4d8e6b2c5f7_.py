@@ -0,0 +1,31 @@
+"""venue coordinates and geohash
+
+Revision ID: a4d8e6b2c5f7
+Revises: f1a7c2e9b3d4
+Create Date: 2026-10-17 15:12:40.218736
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d8e6b2c5f7'
+down_revision = 'f1a7c2e9b3d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # filled in by `flask geocode-venues`
+    op.add_column('Venue', sa.Column('latitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('longitude', sa.Float(), nullable=True))
+    op.add_column('Venue', sa.Column('geohash', sa.String(length=12), nullable=True))
+    op.create_index('ix_venue_geohash', 'Venue', ['geohash'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_venue_geohash', table_name='Venue')
+    op.drop_column('Venue', 'geohash')
+    op.drop_column('Venue', 'longitude')
+    op.drop_column('Venue', 'latitude')
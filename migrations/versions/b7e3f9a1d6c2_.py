@@ -0,0 +1,70 @@
+"""show end times and non-overlapping venue bookings
+
+Revision ID: b7e3f9a1d6c2
+Revises: a4d8e6b2c5f7
+Create Date: 2026-10-17 16:20:03.914527
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7e3f9a1d6c2'
+down_revision = 'a4d8e6b2c5f7'
+branch_labels = None
+depends_on = None
+
+# existing shows are assumed to last this long
+DEFAULT_MINUTES = 120
+
+# a GiST index over (venue_id, booked range) that rejects overlapping
+# bookings of a venue; btree_gist provides the = operator class for integers.
+# must match BOOKING_EXCLUSION in app.py
+EXCLUSION = (
+    'ALTER TABLE "Show" ADD CONSTRAINT ex_show_venue_booking EXCLUDE USING gist '
+    '(venue_id WITH =, tsrange(start_time, end_time) WITH &&)'
+)
+
+# shows overlapping an earlier show at the same venue (see booking_conflicts in app.py)
+CONFLICTS = (
+    'SELECT count(*) FROM (SELECT start_time, max(end_time) OVER ('
+    'PARTITION BY venue_id ORDER BY start_time, id '
+    'ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING) AS booked_until '
+    'FROM "Show") AS sweep WHERE start_time < booked_until'
+)
+
+
+def upgrade():
+    bind = op.get_bind()
+    op.add_column('Show', sa.Column('end_time', sa.DateTime(), nullable=True))
+    if bind.dialect.name == 'postgresql':
+        op.execute("UPDATE \"Show\" SET end_time = start_time + interval '%d minutes'" % DEFAULT_MINUTES)
+    else:
+        op.execute("UPDATE \"Show\" SET end_time = datetime(start_time, '+%d minutes')" % DEFAULT_MINUTES)
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.alter_column('end_time', existing_type=sa.DateTime(), nullable=False)
+
+    if bind.dialect.name != 'postgresql':
+        return
+    # partitioned tables can't carry an exclusion constraint on the
+    # partition key; the booking check in create_show_submission remains
+    partitioned = bind.execute(sa.text(
+        "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass('\"Show\"')")).scalar()
+    if partitioned:
+        print('"Show" is partitioned: skipping the booking exclusion constraint.')
+        return
+    conflicts = bind.execute(sa.text(CONFLICTS)).scalar()
+    if conflicts:
+        print('%d shows overlap at their venue: skipping the booking exclusion '
+              'constraint (see `flask show-conflicts --add-constraint`).' % conflicts)
+        return
+    op.execute('CREATE EXTENSION IF NOT EXISTS btree_gist')
+    op.execute(EXCLUSION)
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('ALTER TABLE "Show" DROP CONSTRAINT IF EXISTS ex_show_venue_booking')
+    with op.batch_alter_table('Show') as batch_op:
+        batch_op.drop_column('end_time')
@@ -0,0 +1,65 @@
+"""search indexes for venues and artists
+
+Revision ID: c3a1f0d2b7e4
+Revises: 92f21cf2779a
+Create Date: 2026-10-17 09:12:41.208533
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c3a1f0d2b7e4'
+down_revision = '92f21cf2779a'
+branch_labels = None
+depends_on = None
+
+
+# array_to_string() is only STABLE, so wrap it in an IMMUTABLE function that
+# can be used inside an expression index
+GENRES_TEXT_FUNCTION = """
+CREATE OR REPLACE FUNCTION fyyur_genres_text(character varying[])
+RETURNS text LANGUAGE sql IMMUTABLE PARALLEL SAFE AS
+$$ SELECT coalesce(array_to_string($1, ' '), '') $$
+"""
+
+# must match SEARCH_DOCUMENT in app.py
+SEARCH_DOCUMENT = (
+    "to_tsvector('simple', coalesce(name, '') || ' ' || coalesce(city, '') "
+    "|| ' ' || fyyur_genres_text(genres))"
+)
+
+
+def upgrade():
+    # the indexes are Postgres specific; other databases fall back to LIKE
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.execute(GENRES_TEXT_FUNCTION)
+
+    for table in ('Venue', 'Artist'):
+        prefix = table.lower()
+        op.execute(
+            'CREATE INDEX ix_{0}_name_trgm ON "{1}" USING gin (name gin_trgm_ops)'
+            .format(prefix, table))
+        op.execute(
+            'CREATE INDEX ix_{0}_city_trgm ON "{1}" USING gin (city gin_trgm_ops)'
+            .format(prefix, table))
+        op.execute(
+            'CREATE INDEX ix_{0}_search ON "{1}" USING gin (({2}))'
+            .format(prefix, table, SEARCH_DOCUMENT))
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+
+    for table in ('Venue', 'Artist'):
+        prefix = table.lower()
+        op.execute('DROP INDEX IF EXISTS ix_{0}_search'.format(prefix))
+        op.execute('DROP INDEX IF EXISTS ix_{0}_city_trgm'.format(prefix))
+        op.execute('DROP INDEX IF EXISTS ix_{0}_name_trgm'.format(prefix))
+
+    op.execute('DROP FUNCTION IF EXISTS fyyur_genres_text(character varying[])')
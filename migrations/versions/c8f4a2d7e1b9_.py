@@ -0,0 +1,40 @@
+"""updated_at timestamps on venues, artists and shows
+
+Revision ID: c8f4a2d7e1b9
+Revises: b7e3f9a1d6c2
+Create Date: 2026-10-17 18:42:37.208114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8f4a2d7e1b9'
+down_revision = 'b7e3f9a1d6c2'
+branch_labels = None
+depends_on = None
+
+TABLES = ('Venue', 'Artist', 'Show')
+
+
+def upgrade():
+    for table in TABLES:
+        if op.get_bind().dialect.name == 'postgresql':
+            # now() is evaluated once and stored as the column's "missing"
+            # value, so existing rows get it without rewriting the table
+            op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=False,
+                                           server_default=sa.func.now()))
+            continue
+        # SQLite can't add a column with a non-constant default
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(), nullable=True))
+        op.execute('UPDATE "%s" SET updated_at = CURRENT_TIMESTAMP' % table)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False,
+                                  server_default=sa.func.now())
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('updated_at')
@@ -0,0 +1,31 @@
+"""import checkpoints
+
+Revision ID: d1e9b4a6c3f8
+Revises: c8f4a2d7e1b9
+Create Date: 2026-10-17 21:06:12.514230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd1e9b4a6c3f8'
+down_revision = 'c8f4a2d7e1b9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('ImportCheckpoint',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('line', sa.Integer(), nullable=False),
+    sa.Column('inserted', sa.Integer(), nullable=False),
+    sa.Column('rejected', sa.Integer(), nullable=False),
+    sa.Column('batches', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('ImportCheckpoint')
@@ -0,0 +1,52 @@
+"""upcoming/past show counters on Venue and Artist
+
+Revision ID: d7e2a9c41f36
+Revises: c3a1f0d2b7e4
+Create Date: 2026-10-17 10:03:17.771902
+
+"""
+from datetime import datetime
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7e2a9c41f36'
+down_revision = 'c3a1f0d2b7e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column('upcoming_shows_count', sa.Integer(), nullable=False, server_default='0'))
+            batch_op.add_column(sa.Column('past_shows_count', sa.Integer(), nullable=False, server_default='0'))
+
+    state = op.create_table('ShowCounterState',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('rolled_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+
+    # backfill the counters against the watermark we are about to record
+    now = datetime.utcnow()
+    for table, foreign_key in (('Venue', 'venue_id'), ('Artist', 'artist_id')):
+        op.get_bind().execute(sa.text(
+            'UPDATE "{0}" SET '
+            'upcoming_shows_count = (SELECT count(*) FROM "Show" '
+            'WHERE "Show".{1} = "{0}".id AND "Show".start_time > :now), '
+            'past_shows_count = (SELECT count(*) FROM "Show" '
+            'WHERE "Show".{1} = "{0}".id AND "Show".start_time <= :now)'
+            .format(table, foreign_key)), {'now': now})
+
+    op.bulk_insert(state, [{'id': 1, 'rolled_at': now}])
+
+
+def downgrade():
+    op.drop_table('ShowCounterState')
+    for table in ('Artist', 'Venue'):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('past_shows_count')
+            batch_op.drop_column('upcoming_shows_count')
@@ -0,0 +1,31 @@
+"""genre and area indexes on venues and artists
+
+Revision ID: f1a7c2e9b3d4
+Revises: e5b8c3d9a2f1
+Create Date: 2026-10-17 14:05:19.663102
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1a7c2e9b3d4'
+down_revision = 'e5b8c3d9a2f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # GIN on Postgres serves `genres @> ARRAY[...]`; elsewhere a plain index
+    op.create_index('ix_venue_genres', 'Venue', ['genres'], unique=False, postgresql_using='gin')
+    op.create_index('ix_artist_genres', 'Artist', ['genres'], unique=False, postgresql_using='gin')
+    op.create_index('ix_venue_state_city', 'Venue', ['state', 'city'], unique=False)
+    op.create_index('ix_artist_state_city', 'Artist', ['state', 'city'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_artist_state_city', table_name='Artist')
+    op.drop_index('ix_venue_state_city', table_name='Venue')
+    op.drop_index('ix_artist_genres', table_name='Artist')
+    op.drop_index('ix_venue_genres', table_name='Venue')
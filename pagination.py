@@ -0,0 +1,127 @@
+#----------------------------------------------------------------------------#
+# Keyset pagination.
+#----------------------------------------------------------------------------#
+import base64
+import json
+from datetime import datetime
+
+from sqlalchemy import tuple_
+
+
+def encode_cursor(values):
+    """Encode the sort key of the last row of a page as an opaque string."""
+    payload = [
+        {'dt': value.isoformat()} if isinstance(value, datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, sort_columns=None):
+    """Inverse of encode_cursor(); raises ValueError on a malformed cursor,
+    or one that doesn't hold a value of the right type per sort column."""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        if not isinstance(payload, list):
+            raise ValueError('invalid cursor')
+        values = tuple(
+            datetime.fromisoformat(value['dt']) if isinstance(value, dict) else value
+            for value in payload
+        )
+    except (TypeError, KeyError, UnicodeError, json.JSONDecodeError, base64.binascii.Error) as e:
+        raise ValueError('invalid cursor') from e
+
+    if sort_columns is not None:
+        if len(values) != len(sort_columns):
+            raise ValueError('invalid cursor')
+        for value, column in zip(values, sort_columns):
+            expected = column.type.python_type
+            # bool is an int to isinstance(); JSON numbers may stand for floats
+            if isinstance(value, bool) and expected is not bool:
+                raise ValueError('invalid cursor')
+            if not isinstance(value, expected) and not (expected is float and isinstance(value, int)):
+                raise ValueError('invalid cursor')
+    return values
+
+
+def keyset_query(query, sort_columns, after=None, per_page=50, descending=False):
+    """``query`` narrowed to one page plus one row (see keyset_page())."""
+    if after is not None and len(after) != len(sort_columns):
+        raise ValueError('invalid cursor')
+    key = tuple_(*sort_columns)
+
+    if after is not None:
+        query = query.filter(key < tuple_(*after) if descending else key > tuple_(*after))
+
+    order = [column.desc() if descending else column.asc() for column in sort_columns]
+
+    # fetch one extra row to learn whether another page exists
+    return query.order_by(*order).limit(per_page + 1)
+
+
+def keyset_page(query, sort_columns, after=None, per_page=50, descending=False):
+    """Fetch one page of ``query`` ordered by ``sort_columns``.
+
+    ``after`` is the decoded cursor of the previous page (or None for the
+    first page). Rows are located with a row-value comparison on the sort
+    columns instead of OFFSET, so every page costs the same index range
+    scan no matter how deep it is. Returns ``(rows, next_cursor)`` where
+    ``next_cursor`` is None on the last page.
+    """
+    rows = keyset_query(query, sort_columns, after, per_page, descending).all()
+    return trim_page(rows, sort_columns, per_page)
+
+
+def trim_page(rows, sort_columns, per_page):
+    """``(rows, next_cursor)`` from the rows of keyset_query()."""
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, column.key) for column in sort_columns])
+    return rows, next_cursor
+
+
+class Page(object):
+    """One page of serialized rows; iterate it for the rows."""
+
+    def __init__(self, rows, next_cursor):
+        self.rows = rows
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.rows)
+
+
+class StreamedPage(Page):
+    """keyset_page() for streamed templates: the rows are fetched in
+    batches of ``batch_size`` and serialized while being iterated, so the
+    page is never held in memory as a whole. ``next_cursor`` is known once
+    the rows have been consumed, i.e. below the rows in the template.
+    """
+
+    def __init__(self, query, sort_columns, serialize, after=None, per_page=50,
+                 descending=False, batch_size=100):
+        super(StreamedPage, self).__init__(None, None)
+        self.query = keyset_query(query, sort_columns, after, per_page, descending) \
+            .execution_options(yield_per=batch_size)
+        self.sort_columns = sort_columns
+        self.serialize = serialize
+        self.per_page = per_page
+
+    def __iter__(self):
+        rows = iter(self.query)
+        try:
+            last = None
+            for number, row in enumerate(rows):
+                if number == self.per_page:
+                    self.next_cursor = encode_cursor([getattr(last, column.key)
+                                                      for column in self.sort_columns])
+                    break
+                last = row
+                yield self.serialize(row)
+        finally:
+            # release the cursor without reading the extra row's batch to the end
+            rows.close()
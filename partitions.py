@@ -0,0 +1,139 @@
+#----------------------------------------------------------------------------#
+# Show table partitioning (Postgres only).
+#----------------------------------------------------------------------------#
+from datetime import datetime
+
+from sqlalchemy import text
+
+TABLE = 'Show'
+DEFAULT_PARTITION = 'Show_default'
+INTERVALS = ('yearly', 'monthly')
+
+
+def period_start(interval, moment):
+    if interval == 'yearly':
+        return datetime(moment.year, 1, 1)
+    return datetime(moment.year, moment.month, 1)
+
+
+def next_period(interval, start):
+    if interval == 'yearly':
+        return datetime(start.year + 1, 1, 1)
+    if start.month == 12:
+        return datetime(start.year + 1, 1, 1)
+    return datetime(start.year, start.month + 1, 1)
+
+
+def partition_name(interval, start):
+    if interval == 'yearly':
+        return 'Show_y%04d' % start.year
+    return 'Show_m%04d_%02d' % (start.year, start.month)
+
+
+def is_partitioned(connection):
+    relkind = connection.execute(text(
+        "SELECT relkind FROM pg_class WHERE oid = to_regclass('\"Show\"')")).scalar()
+    return relkind == 'p'
+
+
+def existing_partitions(connection):
+    return set(connection.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :table"), {'table': TABLE}).scalars())
+
+
+def create_partition(connection, interval, start):
+    """Create and attach the partition for the period beginning at ``start``.
+
+    Rows of that period which landed in the default partition (because
+    their partition did not exist yet) are moved into the new one first;
+    Postgres refuses to attach a range the default partition still holds.
+    """
+    end = next_period(interval, start)
+    name = partition_name(interval, start)
+    params = {'start': start, 'end': end}
+
+    connection.execute(text(
+        'CREATE TABLE "%s" (LIKE "%s" INCLUDING DEFAULTS INCLUDING CONSTRAINTS)' % (name, TABLE)))
+
+    if DEFAULT_PARTITION in existing_partitions(connection):
+        connection.execute(text(
+            'WITH moved AS (DELETE FROM "%s" WHERE start_time >= :start AND start_time < :end '
+            'RETURNING *) INSERT INTO "%s" SELECT * FROM moved' % (DEFAULT_PARTITION, name)), params)
+
+    # attaching creates the partition's copies of the parent's indexes and keys
+    connection.execute(text(
+        "ALTER TABLE \"%s\" ATTACH PARTITION \"%s\" FOR VALUES FROM ('%s') TO ('%s')"
+        % (TABLE, name, start.isoformat(sep=' '), end.isoformat(sep=' '))))
+    return name
+
+
+def ensure_partitions(connection, interval, ahead, since=None, now=None):
+    """Make sure a partition exists for every period from ``since`` (default:
+    the current one) up to ``ahead`` periods into the future."""
+    now = now or datetime.utcnow()
+    start = period_start(interval, since or now)
+    last = period_start(interval, now)
+    for _ in range(ahead):
+        last = next_period(interval, last)
+
+    existing = existing_partitions(connection)
+    created = []
+    while start <= last:
+        if partition_name(interval, start) not in existing:
+            created.append(create_partition(connection, interval, start))
+        start = next_period(interval, start)
+    return created
+
+
+def partition_show_table(connection, interval, ahead, indexes):
+    """Convert Show into a table range-partitioned by start_time.
+
+    The primary key becomes (id, start_time), as Postgres requires the
+    partition key in every unique constraint; ids keep coming from the
+    existing sequence. ``indexes`` is a list of (name, columns) created on
+    the partitioned parent (and thereby on every partition). Shows outside
+    every partition's range go to a default partition until
+    ensure_partitions() creates their partition. Runs in the caller's
+    transaction, so a failure leaves the original table untouched.
+    """
+    if is_partitioned(connection):
+        raise RuntimeError('"Show" is already partitioned')
+
+    old = 'Show_unpartitioned'
+    connection.execute(text('LOCK TABLE "Show" IN ACCESS EXCLUSIVE MODE'))
+    connection.execute(text('ALTER TABLE "Show" RENAME TO "%s"' % old))
+    sequence = connection.execute(text(
+        "SELECT pg_get_serial_sequence('\"%s\"', 'id')" % old)).scalar()
+
+    # free the constraint and index names for the new table
+    for (constraint,) in connection.execute(text(
+            "SELECT conname FROM pg_constraint WHERE conrelid = '\"%s\"'::regclass "
+            "AND contype IN ('p', 'f', 'u', 'x') ORDER BY contype = 'p'" % old)).all():
+        connection.execute(text('ALTER TABLE "%s" DROP CONSTRAINT "%s"' % (old, constraint)))
+    for (index,) in connection.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = :table"), {'table': old}).all():
+        connection.execute(text('DROP INDEX "%s"' % index))
+
+    connection.execute(text(
+        'CREATE TABLE "Show" (LIKE "%s" INCLUDING DEFAULTS) PARTITION BY RANGE (start_time)' % old))
+    connection.execute(text('ALTER TABLE "Show" ADD PRIMARY KEY (id, start_time)'))
+    connection.execute(text(
+        'ALTER TABLE "Show" ADD FOREIGN KEY (venue_id) REFERENCES "Venue" (id)'))
+    connection.execute(text(
+        'ALTER TABLE "Show" ADD FOREIGN KEY (artist_id) REFERENCES "Artist" (id)'))
+    for name, columns in indexes:
+        connection.execute(text('CREATE INDEX "%s" ON "Show" (%s)' % (
+            name, ', '.join(columns))))
+    if sequence:
+        connection.execute(text('ALTER SEQUENCE %s OWNED BY "Show".id' % sequence))
+
+    connection.execute(text('CREATE TABLE "%s" PARTITION OF "Show" DEFAULT' % DEFAULT_PARTITION))
+    earliest = connection.execute(text('SELECT min(start_time) FROM "%s"' % old)).scalar()
+    created = ensure_partitions(connection, interval, ahead, since=earliest)
+
+    connection.execute(text('INSERT INTO "Show" SELECT * FROM "%s"' % old))
+    connection.execute(text('DROP TABLE "%s"' % old))
+    return created
@@ -0,0 +1,148 @@
+#----------------------------------------------------------------------------#
+# Query counting.
+#----------------------------------------------------------------------------#
+import functools
+import inspect
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from flask import current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# counters are per thread (and per asyncio task, which inherits those of the
+# code that started it) so concurrent requests don't bleed into each other
+_counters = ContextVar('query_counters', default=None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def _active_counters():
+    counters = _counters.get()
+    if counters is None:
+        counters = []
+        _counters.set(counters)
+    return counters
+
+
+def current_scopes():
+    """The counting scopes of the calling code, for use_scopes()."""
+    return _active_counters()
+
+
+@contextmanager
+def use_scopes(scopes):
+    """Count the statements of the block in ``scopes``, taken from
+    current_scopes() in another thread (e.g. the caller of a coroutine
+    run on a different event loop)."""
+    token = _counters.set(scopes)
+    try:
+        yield
+    finally:
+        _counters.reset(token)
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    for counter in _active_counters():
+        counter.append(statement)
+
+
+@contextmanager
+def count_queries():
+    """Collect every SQL statement executed on this thread inside the block.
+
+    Yields the list of statements, so ``len()`` of it is the query count.
+    """
+    statements = []
+    counters = _active_counters()
+    counters.append(statements)
+    try:
+        yield statements
+    finally:
+        # by identity: nested scopes may hold equal lists
+        for index in range(len(counters) - 1, -1, -1):
+            if counters[index] is statements:
+                del counters[index]
+                break
+
+
+class _CountedStream(object):
+    """A streamed response body whose queries (a streamed page queries
+    while it is being sent) are added to ``statements``; ``check`` runs
+    once the body is exhausted."""
+
+    def __init__(self, chunks, statements, check):
+        self.chunks = chunks
+        self.iterator = iter(chunks)
+        self.statements = statements
+        self.check = check
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            with count_queries() as statements:
+                try:
+                    return next(self.iterator)
+                finally:
+                    self.statements.extend(statements)
+        except StopIteration:
+            self.check()
+            raise
+
+    def close(self):
+        if hasattr(self.chunks, 'close'):
+            self.chunks.close()
+
+
+def query_budget(max_queries):
+    """Declare the maximum number of queries a view may issue.
+
+    The budget is enforced when the app runs in debug or testing mode, so a
+    view that regresses into an N+1 pattern fails loudly in development
+    instead of silently slowing down in production. Streamed responses
+    count the queries issued while their body is sent, and are checked
+    once it has been.
+    """
+    def decorator(view):
+        view.query_budget = max_queries
+
+        def enforced():
+            return current_app.debug or current_app.testing
+
+        def checked(response, statements):
+            def check():
+                if len(statements) > max_queries:
+                    raise QueryBudgetExceeded(
+                        '%s issued %d queries (budget %d)'
+                        % (view.__name__, len(statements), max_queries))
+
+            if getattr(response, 'is_streamed', False):
+                response.response = _CountedStream(response.response, statements, check)
+                return response
+            check()
+            return response
+
+        if inspect.iscoroutinefunction(view):
+            @functools.wraps(view)
+            async def async_wrapper(*args, **kwargs):
+                if not enforced():
+                    return await view(*args, **kwargs)
+                with count_queries() as statements:
+                    response = await view(*args, **kwargs)
+                return checked(response, statements)
+            return async_wrapper
+
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if not enforced():
+                return view(*args, **kwargs)
+            with count_queries() as statements:
+                response = view(*args, **kwargs)
+            return checked(response, statements)
+        return wrapper
+    return decorator
@@ -0,0 +1,77 @@
+#----------------------------------------------------------------------------#
+# Query plans.
+#----------------------------------------------------------------------------#
+import json
+
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable
+
+
+class Explain(Executable, ClauseElement):
+    """``EXPLAIN`` for any selectable, in the current dialect's flavour."""
+
+    inherit_cache = False
+
+    def __init__(self, statement):
+        self.statement = statement
+
+
+@compiles(Explain, 'postgresql')
+def _explain_postgresql(element, compiler, **kw):
+    return 'EXPLAIN (FORMAT JSON) ' + compiler.process(element.statement, **kw)
+
+
+@compiles(Explain, 'sqlite')
+def _explain_sqlite(element, compiler, **kw):
+    return 'EXPLAIN QUERY PLAN ' + compiler.process(element.statement, **kw)
+
+
+@compiles(Explain)
+def _explain_default(element, compiler, **kw):
+    return 'EXPLAIN ' + compiler.process(element.statement, **kw)
+
+
+def _postgresql_nodes(node):
+    yield node
+    for child in node.get('Plans', ()):
+        for descendant in _postgresql_nodes(child):
+            yield descendant
+
+
+def full_scans(connection, statement, table):
+    """Return ``(plan, scans)`` for ``statement``, where ``scans`` lists the
+    steps that read ``table`` (or any of its partitions) without an index.
+
+    On Postgres sequential scans are disabled for the duration of the
+    check: tiny development tables are always cheaper to scan, and what
+    matters here is whether an index *can* serve the query.
+    """
+    dialect = connection.dialect.name
+
+    if dialect == 'postgresql':
+        # rolling back the savepoint also undoes the SET LOCAL
+        savepoint = connection.begin_nested()
+        try:
+            connection.exec_driver_sql('SET LOCAL enable_seqscan = off')
+            raw = connection.execute(Explain(statement)).scalar()
+        finally:
+            savepoint.rollback()
+        plan = raw if isinstance(raw, list) else json.loads(raw)
+        scans = [
+            '%s on %s' % (node['Node Type'], node['Relation Name'])
+            for node in _postgresql_nodes(plan[0]['Plan'])
+            if node['Node Type'] == 'Seq Scan'
+            and node.get('Relation Name', '').split('_')[0] == table
+        ]
+        return json.dumps(plan, indent=2), scans
+
+    if dialect == 'sqlite':
+        details = [row[-1] for row in connection.execute(Explain(statement))]
+        scans = [
+            detail for detail in details
+            if detail.startswith('SCAN ') and ' INDEX ' not in detail
+            and detail.split()[1].strip('"') == table
+        ]
+        return '\n'.join(details), scans
+
+    raise NotImplementedError('query plans are not supported on %s' % dialect)
@@ -0,0 +1,161 @@
+#----------------------------------------------------------------------------#
+# Read replicas.
+#----------------------------------------------------------------------------#
+import itertools
+import logging
+import threading
+import time
+
+from flask import current_app, g, has_app_context, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.exc import DBAPIError
+
+# requests with these methods don't write and may be served by a replica
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+BIND_PREFIX = 'replica_'
+
+# holds the time until which the client reads from the primary. a plain
+# cookie, as reading the Flask session would make every page vary by cookie
+PRIMARY_COOKIE = 'primary_until'
+
+log = logging.getLogger('fyyur.replicas')
+
+
+class RoutingSession(Session):
+    """Session that runs the queries of read-only requests on the replica
+    chosen for the request; everything else (flushes, explicit binds,
+    CLI commands, write requests) goes to the primary as usual."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context():
+            replica = g.get('db_replica')
+            if replica is not None:
+                return replica.engine
+        return super(RoutingSession, self).get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def replica_lag(config):
+    """How long a write may take to reach the replicas: REPLICA_LAG_SECONDS,
+    or 0 without replicas."""
+    if not config.get('SQLALCHEMY_REPLICA_URIS'):
+        return 0
+    return config.get('REPLICA_LAG_SECONDS', 10)
+
+
+def later(seconds, callback):
+    """Call ``callback`` from a timer thread in ``seconds``.
+
+    The thread isn't a daemon, so a CLI command or a worker shutting down
+    waits for it instead of dropping the call.
+    """
+    def run():
+        try:
+            callback()
+        except Exception:
+            log.exception('delayed call to %r failed', callback)
+    timer = threading.Timer(seconds, run)
+    timer.start()
+    return timer
+
+
+def use_replicas(app):
+    """Register one bind per URL in SQLALCHEMY_REPLICA_URIS; call before
+    SQLAlchemy(app), so the replicas get the same engine options."""
+    binds = app.config.setdefault('SQLALCHEMY_BINDS', {})
+    for number, url in enumerate(app.config.get('SQLALCHEMY_REPLICA_URIS') or ()):
+        binds[BIND_PREFIX + str(number)] = url
+
+
+class Replica(object):
+
+    def __init__(self, name, engine):
+        self.name = name
+        self.engine = engine
+        self.down_until = 0.0
+
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.down_until
+
+
+class Replicas(object):
+    """Round-robin routing of read-only requests over healthy replicas.
+
+    A replica whose connections fail is taken out of rotation for
+    ``REPLICA_RETRY_SECONDS`` and the failed request is retried once on
+    the primary. After a write, the client's reads stay on the primary for
+    ``REPLICA_STICKY_SECONDS`` (tracked in a cookie of its own), so users
+    see their own changes even while the replicas lag behind.
+    """
+
+    def __init__(self, app=None, db=None):
+        self.replicas = []
+        self._next = itertools.count()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 10)
+        self.retry_seconds = app.config.get('REPLICA_RETRY_SECONDS', 30)
+
+        names = [BIND_PREFIX + str(number)
+                 for number in range(len(app.config.get('SQLALCHEMY_REPLICA_URIS') or ()))]
+        with app.app_context():
+            self.replicas = [Replica(name, db.engines[name]) for name in names]
+        for replica in self.replicas:
+            event.listen(replica.engine, 'handle_error', self._handle_error(replica))
+
+        if self.replicas:
+            app.before_request(self._before_request)
+            app.after_request(self._after_request)
+            app.register_error_handler(DBAPIError, self._failover)
+        self.db = db
+        app.extensions['replicas'] = self
+
+    def _handle_error(self, replica):
+        def handle_error(context):
+            # lost or refused connections, not errors in the statement itself
+            if context.is_disconnect or context.connection is None:
+                self.mark_down(replica)
+        return handle_error
+
+    def mark_down(self, replica):
+        replica.down_until = time.monotonic() + self.retry_seconds
+        log.warning('replica %s is down, retrying in %ds', replica.name, self.retry_seconds)
+
+    def choose(self):
+        """The next healthy replica, or None when all of them are down."""
+        with self._lock:
+            start = next(self._next)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            if replica.healthy:
+                return replica
+        return None
+
+    def _primary_until(self):
+        try:
+            return float(request.cookies.get(PRIMARY_COOKIE, 0))
+        except ValueError:
+            return 0
+
+    def _before_request(self):
+        if request.method in READ_METHODS and self._primary_until() <= time.time():
+            g.db_replica = self.choose()
+
+    def _after_request(self, response):
+        if request.method not in READ_METHODS:
+            response.set_cookie(PRIMARY_COOKIE, '%.3f' % (time.time() + self.sticky_seconds),
+                                max_age=self.sticky_seconds, httponly=True, samesite='Lax')
+        return response
+
+    def _failover(self, error):
+        replica = g.pop('db_replica', None)
+        if replica is None or replica.healthy:
+            raise error
+        # reads are safe to repeat; do it on the primary
+        self.db.session.rollback()
+        return current_app.dispatch_request()
+
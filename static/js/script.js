@@ -2,3 +2,20 @@ window.parseISOString = function parseISOString(s) {
   var b = s.split(/\D+/);
   return new Date(Date.UTC(b[0], --b[1], b[2], b[3], b[4], b[5], b[6]));
 };
+
+// flash messages are fetched separately, so pages can be cached for everyone;
+// the server sets the "flashes" cookie when there are any
+$(function () {
+  var $flashes = $('#flashes');
+  if (!$flashes.length || !/(^|;\s*)flashes=1/.test(document.cookie)) {
+    return;
+  }
+  $.getJSON($flashes.data('url'), function (data) {
+    $.each(data.messages, function (i, message) {
+      $('<div class="alert alert-block alert-info fade in">')
+        .append('<a class="close" data-dismiss="alert">&times;</a>')
+        .append(document.createTextNode(message))
+        .appendTo($flashes);
+    });
+  });
+});
@@ -0,0 +1,171 @@
+#----------------------------------------------------------------------------#
+# Shared HTTP caching.
+#----------------------------------------------------------------------------#
+import json
+import threading
+import time
+import urllib.request
+from importlib import import_module
+
+from flask import g, request
+
+from replicas import later, replica_lag
+
+# carried by every shared-cacheable response, so purging it empties the cache
+ALL = 'pages'
+
+# CDNs cap the header (Fastly at 16 KB); see collapse()
+MAX_HEADER_BYTES = 8192
+
+
+def collapse(keys, limit=MAX_HEADER_BYTES):
+    """Shorten a key set that doesn't fit the header by replacing the most
+    numerous kind of entity key (``artist-3``, ``artist-7``, ...) with the
+    key of its collection (``artists``), which every change to such an
+    entity purges as well. The page is purged more often, never less."""
+    keys = set(keys)
+    while len(' '.join(keys)) > limit:
+        kinds = {}
+        for key in keys:
+            kind, dash, entity_id = key.rpartition('-')
+            if dash and entity_id.isdigit():
+                kinds.setdefault(kind, set()).add(key)
+        if not kinds:
+            break
+        kind, members = max(kinds.items(), key=lambda item: len(item[1]))
+        keys = (keys - members) | {kind + 's'}
+    return keys
+
+
+class Purger(object):
+    """Forwards purge events (lists of surrogate keys) to the shared cache
+    in front of the app: a CDN, Varnish, or a stand-in for testing."""
+
+    def purge(self, keys):
+        raise NotImplementedError
+
+
+class MemoryPurger(Purger):
+    """Keeps the events in a list, for tests and local development."""
+
+    def __init__(self):
+        self.events = []
+        self._lock = threading.Lock()
+
+    def purge(self, keys):
+        with self._lock:
+            self.events.append(list(keys))
+
+
+class FilePurger(Purger):
+    """Appends every event to a file as a line of JSON, for a sidecar to
+    tail and forward (or for inspecting what a write purged)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def purge(self, keys):
+        line = json.dumps({'time': time.time(), 'keys': list(keys)})
+        with self._lock, open(self.path, 'a') as f:
+            f.write(line + '\n')
+
+
+class HTTPPurger(Purger):
+    """Sends a PURGE request listing the keys in a header, as Varnish
+    with the xkey module expects; failures are logged, not raised, since
+    the write they follow has already been committed."""
+
+    def __init__(self, url, header='xkey-purge', timeout=2, logger=None):
+        self.url = url
+        self.header = header
+        self.timeout = timeout
+        self.logger = logger
+
+    def purge(self, keys):
+        purge = urllib.request.Request(self.url, method='PURGE', headers={self.header: ' '.join(keys)})
+        try:
+            urllib.request.urlopen(purge, timeout=self.timeout).close()
+        except OSError as e:
+            if self.logger is not None:
+                self.logger.warning('purging %s failed: %s', ' '.join(keys), e)
+
+
+def _load_purger(app):
+    purger = app.config.get('PURGER', 'none')
+    if purger is None or isinstance(purger, Purger):
+        return purger
+    if purger == 'none':
+        return None
+    if purger == 'memory':
+        return MemoryPurger()
+    if purger == 'file':
+        return FilePurger(app.config['PURGE_FILE'])
+    if purger == 'http':
+        return HTTPPurger(app.config['PURGE_URL'], logger=app.logger)
+
+    # "package.module:factory", called with the app
+    module_name, _, attribute = purger.partition(':')
+    return getattr(import_module(module_name), attribute)(app)
+
+
+class SurrogateKeys(object):
+    """Lets a shared cache store the read pages and purge them by key.
+
+    Views ``tag()`` their response with the keys of what it shows, e.g.
+    ``venue-3`` or ``venues`` for a listing. Tagged GET responses get a
+    ``Surrogate-Key`` header and a Cache-Control that allows shared caches
+    to keep them for ``PAGE_SHARED_MAX_AGE`` seconds while browsers
+    revalidate; write handlers ``purge()`` the keys they changed. Only
+    tag responses that are the same for every visitor.
+
+    With read replicas the shared cache may refetch a purged page from a
+    replica that hasn't seen the write yet and keep it for the whole
+    s-maxage, so purges are sent again after ``REPLICA_LAG_SECONDS``.
+
+    Configuration:
+
+    * ``PURGER`` - "none", "memory", "file" (``PURGE_FILE``), "http"
+      (``PURGE_URL``) or "module:factory"
+    * ``PAGE_SHARED_MAX_AGE`` - s-maxage of tagged pages
+    """
+
+    def __init__(self, app=None):
+        self.purger = None
+        self.shared_max_age = 3600
+        self.replica_lag = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.purger = _load_purger(app)
+        self.shared_max_age = app.config.get('PAGE_SHARED_MAX_AGE', 3600)
+        self.replica_lag = replica_lag(app.config)
+        app.after_request(self._after_request)
+        app.extensions['surrogate_keys'] = self
+
+    def tag(self, *keys):
+        g.setdefault('surrogate_keys', set()).update(keys)
+
+    def purge(self, *keys):
+        if self.purger is not None and keys:
+            keys = sorted(set(keys))
+            self.purger.purge(keys)
+            if self.replica_lag:
+                later(self.replica_lag, lambda: self.purger.purge(keys))
+
+    def purge_all(self):
+        self.purge(ALL)
+
+    def _after_request(self, response):
+        keys = g.pop('surrogate_keys', None)
+        if (not keys or request.method not in ('GET', 'HEAD')
+                or response.status_code not in (200, 304)):
+            return response
+
+        response.headers['Surrogate-Key'] = ' '.join(sorted(collapse(keys | {ALL})))
+        response.cache_control.public = True
+        response.cache_control.s_maxage = self.shared_max_age
+        if response.cache_control.max_age is None:
+            response.cache_control.max_age = 0
+        return response
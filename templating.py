@@ -0,0 +1,120 @@
+#----------------------------------------------------------------------------#
+# Template compilation.
+#----------------------------------------------------------------------------#
+import os
+import threading
+import time
+
+from flask import g, has_app_context
+from jinja2 import BaseLoader, FileSystemBytecodeCache
+
+
+def _is_template(name):
+    return name.endswith('.html')
+
+
+class TimedLoader(BaseLoader):
+    """Wraps the app's loader and reports how long every template took to
+    load: compiled from source, or read from the bytecode cache. Jinja keeps
+    loaded templates in memory, so each one is loaded once per process."""
+
+    def __init__(self, loader, loaded):
+        self.loader = loader
+        self.loaded = loaded
+        self.has_source_access = loader.has_source_access
+
+    def get_source(self, environment, template):
+        return self.loader.get_source(environment, template)
+
+    def list_templates(self):
+        return self.loader.list_templates()
+
+    def load(self, environment, name, globals=None):
+        started = time.perf_counter()
+        template = super(TimedLoader, self).load(environment, name, globals)
+        self.loaded(name, (time.perf_counter() - started) * 1000)
+        return template
+
+
+class Templates(object):
+    """Bytecode cache for the Jinja environment, template warm-up and
+    first-render timing.
+
+    Configuration:
+
+    * ``TEMPLATE_CACHE_DIR`` - where compiled templates are stored and
+      shared between processes and restarts (None: compile in memory only)
+
+    The first request of every process is logged with the time it spent
+    loading templates, which is what the bytecode cache saves.
+    """
+
+    def __init__(self, app=None):
+        self.loads = {}
+        self.bytecode_cache = None
+        self._first_request = True
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        cache_dir = app.config.get('TEMPLATE_CACHE_DIR')
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+            app.jinja_env.bytecode_cache = self.bytecode_cache
+        app.jinja_env.loader = TimedLoader(app.jinja_env.loader, self._loaded)
+
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+        app.extensions['templates'] = self
+
+    def _loaded(self, name, ms):
+        with self._lock:
+            self.loads[name] = ms
+        loads = g.get('template_loads') if has_app_context() else None
+        if loads is not None:
+            loads.append(ms)
+
+    def _before_request(self):
+        if self._first_request:
+            g.template_loads = []
+            g.first_request_started = time.perf_counter()
+
+    def _after_request(self, response):
+        loads = g.pop('template_loads', None)
+        if loads is not None and self._first_request:
+            self._first_request = False
+            self.app.logger.info(
+                'first request of process %d took %.1f ms, %.1f ms of it loading %d templates (%s)',
+                os.getpid(), (time.perf_counter() - g.first_request_started) * 1000,
+                sum(loads), len(loads),
+                'bytecode cache' if self.bytecode_cache is not None else 'no bytecode cache')
+        return response
+
+    def names(self):
+        return sorted(self.app.jinja_env.list_templates(filter_func=_is_template))
+
+    def warm(self):
+        """Load every template into the environment, e.g. in the gunicorn
+        master before it forks, so no worker compiles a template."""
+        for name in self.names():
+            self.app.jinja_env.get_template(name)
+
+    def precompile(self):
+        """Compile every template from source into the bytecode cache, then
+        load them back from it. Returns {name: (compile ms, cached load ms)}."""
+        env = self.app.jinja_env
+        if self.bytecode_cache is not None:
+            self.bytecode_cache.clear()
+
+        timings = {}
+        for phase in (0, 1):
+            # drop the in-memory copies, so every template goes through the loader
+            env.cache.clear()
+            self.loads.clear()
+            self.warm()
+            for name, ms in self.loads.items():
+                timings.setdefault(name, [None, None])[phase] = ms
+        return dict((name, tuple(ms)) for name, ms in timings.items())
@@ -0,0 +1,13 @@
+#----------------------------------------------------------------------------#
+# WSGI entry point.
+#----------------------------------------------------------------------------#
+# Production servers load the app from here, e.g.
+#
+#   $ FYYUR_ENV=production gunicorn wsgi:app
+#
+# (gunicorn picks up gunicorn.conf.py from the working directory).
+import os
+
+os.environ.setdefault('FYYUR_ENV', 'production')
+
+from app import app  # noqa: E402